@@ -0,0 +1,288 @@
+"""
+Benchmarks every strategy on synthetic bars and checks them against baselines.
+
+    python bench/run.py                      # full matrix, compare to baselines
+    python bench/run.py --years 1 --save     # record new baselines
+    python bench/run.py --strategies srs --timeframes M15
+    python bench/run.py --profile ci --save  # baselines for another machine
+
+Each case (strategy, timeframe, years) runs in its own interpreter so peak RSS
+is per case. Throughput is bars per second of the run phase. A case regresses
+when its throughput drops, or its peak RSS grows, by more than the tolerance
+against the stored baseline, and then the run exits with status 1.
+
+The monte_carlo cases (method, trades) time `common.robustness.monte_carlo`
+over MONTE_CARLO_PATHS paths of synthetic trades instead, counting paths as
+bars, and also regress past MONTE_CARLO_SECONDS whatever the baseline.
+
+Baselines are machine-specific, so bench/baselines.json keeps them per
+profile, chosen with --profile or BENCH_PROFILE. It's committed with the
+"reference" profile, recorded on a single core, and a machine that checks
+itself against its own numbers records a profile of its own with --save. A
+case without a baseline in the profile fails the run too, so a missing
+baseline can't pass for a clean one.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time as clock
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# allow running as `python bench/run.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.synthetic import generate
+
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+PROFILE = "reference"
+
+STRATEGIES = ("orb", "prior_day_reversal", "srs")
+TIMEFRAMES = {"M1": 60, "M15": 900}
+YEARS = (1, 5, 10)
+
+MONTE_CARLO = ("bootstrap", "shuffle")
+MONTE_CARLO_TRADES = 400
+MONTE_CARLO_PATHS = 100_000
+MONTE_CARLO_SECONDS = 1.0
+
+
+def _orb(candles, compression: int) -> dict[str, float]:
+    import backtrader as bt
+
+    import orb
+
+    started = clock.perf_counter()
+    cerebro = orb.build_cerebro(
+        candles,
+        stdstats=False,
+        data_kwargs=dict(
+            timeframe=bt.TimeFrame.Minutes, compression=compression, tz=orb.TZ
+        ),
+    )
+    phases = {"setup": clock.perf_counter() - started}
+    started = clock.perf_counter()
+    cerebro.run()
+    phases["run"] = clock.perf_counter() - started
+    return phases
+
+
+def _prior_day_reversal(candles, compression: int) -> dict[str, float]:
+    import backtrader as bt
+
+    from common.sessions import PriorDayIndex
+    from prolefoto import prior_day_reversal as pdr
+
+    started = clock.perf_counter()
+    levels = PriorDayIndex(candles, pdr.TZ, pdr.ROLLOVER)
+    phases = {"index": clock.perf_counter() - started}
+    started = clock.perf_counter()
+    cerebro = pdr.build_cerebro(
+        candles,
+        levels,
+        data_kwargs=dict(
+            timeframe=bt.TimeFrame.Minutes, compression=compression, tz=pdr.TZ
+        ),
+    )
+    phases["setup"] = clock.perf_counter() - started
+    started = clock.perf_counter()
+    cerebro.run()
+    phases["run"] = clock.perf_counter() - started
+    return phases
+
+
+def _srs(candles, compression: int) -> dict[str, float]:
+    # the engine works on its own 15 minute grid, so on M1 this also covers
+    # dropping the bars in between
+    from meta import srs_and_onr
+
+    started = clock.perf_counter()
+    srs_and_onr.test_day(candles)
+    return {"run": clock.perf_counter() - started}
+
+
+RUNNERS = {"orb": _orb, "prior_day_reversal": _prior_day_reversal, "srs": _srs}
+
+
+def run_case(strategy: str, timeframe: str, years: int, seed: int) -> dict:
+    """
+    Runs one case in this process and returns its measurements.
+    """
+    # the strategies log every session, measure them rather than the handlers
+    logging.disable(logging.INFO)
+
+    started = clock.perf_counter()
+    candles = generate(years, TIMEFRAMES[timeframe], seed=seed)
+    phases = {"generate": clock.perf_counter() - started}
+    phases.update(RUNNERS[strategy](candles, TIMEFRAMES[timeframe] // 60))
+
+    return dict(
+        case=f"{strategy}:{timeframe}:{years}",
+        bars=len(candles),
+        bars_per_sec=len(candles) / phases["run"],
+        # kilobytes on Linux
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        phases=phases,
+    )
+
+
+def run_monte_carlo(method: str, trades: int, seed: int) -> dict:
+    """
+    Times one Monte Carlo run in this process and returns its measurements.
+    """
+    from common.robustness import monte_carlo
+
+    started = clock.perf_counter()
+    rng = np.random.default_rng(seed)
+    pnl = rng.normal(50.0, 1000.0, trades)
+    phases = {"generate": clock.perf_counter() - started}
+    started = clock.perf_counter()
+    monte_carlo(pnl, 100000.0, MONTE_CARLO_PATHS, method, seed=seed)
+    phases["run"] = clock.perf_counter() - started
+
+    return dict(
+        case=f"monte_carlo:{method}:{trades}",
+        bars=MONTE_CARLO_PATHS,
+        bars_per_sec=MONTE_CARLO_PATHS / phases["run"],
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        phases=phases,
+    )
+
+
+def compare(results: list[dict], baselines: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for result in results:
+        if (
+            result["case"].startswith("monte_carlo:")
+            and result["phases"]["run"] > MONTE_CARLO_SECONDS
+        ):
+            regressions.append(
+                f"{result['case']}: {result['phases']['run']:.2f}s, "
+                f"target {MONTE_CARLO_SECONDS:.2f}s"
+            )
+        baseline = baselines.get(result["case"])
+        if baseline is None:
+            regressions.append(f"{result['case']}: no baseline, record one with --save")
+            continue
+        if result["bars_per_sec"] < baseline["bars_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{result['case']}: {result['bars_per_sec']:.0f} bars/s, "
+                f"baseline {baseline['bars_per_sec']:.0f}"
+            )
+        if result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{result['case']}: {result['peak_rss_mb']:.0f} MB peak RSS, "
+                f"baseline {baseline['peak_rss_mb']:.0f}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strategy benchmarks")
+    parser.add_argument(
+        "--strategies", nargs="+", choices=STRATEGIES + ("monte_carlo",)
+    )
+    parser.add_argument("--timeframes", nargs="+", choices=list(TIMEFRAMES))
+    parser.add_argument("--years", nargs="+", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown / memory growth against the baselines",
+    )
+    parser.add_argument(
+        "--profile",
+        default=os.getenv("BENCH_PROFILE", PROFILE),
+        help=f"baselines to check against or save to ({PROFILE} by default)",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the baselines"
+    )
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        strategy, timeframe, years = args.case.split(":")
+        if strategy == "monte_carlo":
+            method, trades = timeframe, years
+            result = run_monte_carlo(method, int(trades), args.seed)
+        else:
+            result = run_case(strategy, timeframe, int(years), args.seed)
+        print(json.dumps(result))
+        return 0
+
+    cases = []
+    for strategy in args.strategies or STRATEGIES + ("monte_carlo",):
+        if strategy == "monte_carlo":
+            cases += [f"monte_carlo:{m}:{MONTE_CARLO_TRADES}" for m in MONTE_CARLO]
+            continue
+        for timeframe in args.timeframes or TIMEFRAMES:
+            for years in args.years or YEARS:
+                cases.append(f"{strategy}:{timeframe}:{years}")
+
+    results = []
+    for case in cases:
+        logging.info(f"Running {case}")
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--case",
+                case,
+                "--seed",
+                str(args.seed),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    table = pd.DataFrame(
+        [
+            {
+                "case": r["case"],
+                "bars": r["bars"],
+                "bars_per_sec": round(r["bars_per_sec"]),
+                "peak_rss_mb": round(r["peak_rss_mb"], 1),
+                **{k: round(v, 3) for k, v in r["phases"].items()},
+            }
+            for r in results
+        ]
+    )
+    logging.info(f"Results:\n{table.to_string(index=False)}")
+
+    profiles = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    baselines = profiles.setdefault(args.profile, {})
+    if args.save:
+        baselines.update(
+            {
+                r["case"]: dict(
+                    bars_per_sec=r["bars_per_sec"], peak_rss_mb=r["peak_rss_mb"]
+                )
+                for r in results
+            }
+        )
+        BASELINES.write_text(json.dumps(profiles, indent=2, sort_keys=True) + "\n")
+        logging.info(f"{args.profile} baselines saved to {BASELINES}")
+        return 0
+
+    regressions = compare(results, baselines, args.tolerance)
+    for regression in regressions:
+        logging.error(f"Regression against {args.profile}: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    sys.exit(main())
@@ -0,0 +1,561 @@
+"""
+Local stand-in for the OANDA v20 REST API, for measuring and load-testing the
+fetch and live code paths without a network.
+
+    python bench/standin.py --port 8080 --latency 0.05 --error-rate 0.02
+    OANDA_HOSTNAME=127.0.0.1 OANDA_PORT=8080 OANDA_SSL=0 python orb.py --live
+
+It answers the account list, instrument candles, pricing, pricing stream and
+order endpoints from synthetic bars (see bench/synthetic.py) or from candles
+recorded in the candle cache, with optional latency, injected server errors
+and 429s past a request rate. Candles of any granularity are resampled from M1
+on 17:00 New York boundaries the way OANDA aligns them. Pricing replays the M1
+bars from `replay_from` (the first bar by default), `speed` times faster than
+the wall clock: polled prices are the latest close, and the stream sends the
+open, both extremes and the close of every bar as ticks. Orders are
+acknowledged and kept in `orders`, but never filled.
+
+In-process, `StandIn(...).start()` serves from a background thread and
+`connect()` returns a v20 context pointed at it.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time as clock
+import zlib
+from collections import deque
+from datetime import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import v20
+
+# allow running as `python bench/standin.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.synthetic import NEW_YORK, generate
+from common.cache import CandleCache
+from common.candles import Candles
+from common.oanda import GRANULARITY_SECONDS, MAX_CANDLES, rfc3339
+from common.resample import Resampler
+
+ACCOUNT_ID = "101-001-0000000-001"
+
+# OANDA's default dailyAlignment/alignmentTimezone
+ALIGNMENT = time(17, 0)
+
+CANDLES = re.compile(r"^/v3/instruments/([A-Z0-9_]+)/candles$")
+PRICING = re.compile(r"^/v3/accounts/([^/]+)/pricing$")
+STREAM = re.compile(r"^/v3/accounts/([^/]+)/pricing/stream$")
+ORDERS = re.compile(r"^/v3/accounts/([^/]+)/orders$")
+
+# where in each M1 bar the streamed open, extremes and close ticks fall
+TICKS = (0, 15, 30, 45)
+HEARTBEAT = 5.0
+
+
+class SyntheticSource:
+    """
+    `years` of synthetic M1 bars per instrument, seeded from the instrument
+    name so every instrument moves differently but always the same way. Bid
+    and ask are `spread` (a fraction of price) apart around the mid.
+    """
+
+    def __init__(self, years: float = 1, seed: int = 0, spread: float = 1e-4) -> None:
+        self.years = years
+        self.seed = seed
+        self.spread = spread
+        self._mid: dict[tuple[str, str], Candles] = {}
+        self._lock = threading.Lock()
+
+    def _resampled(self, instrument: str, granularity: str) -> Candles:
+        with self._lock:
+            if (instrument, "M1") not in self._mid:
+                seed = self.seed + zlib.crc32(instrument.encode())
+                self._mid[instrument, "M1"] = generate(self.years, 60, seed=seed)
+            if (instrument, granularity) not in self._mid:
+                self._mid[instrument, granularity] = Resampler(
+                    self._mid[instrument, "M1"], NEW_YORK
+                ).bars(GRANULARITY_SECONDS[granularity], ALIGNMENT)
+            return self._mid[instrument, granularity]
+
+    def candles(self, instrument: str, granularity: str, price: str) -> Candles:
+        mid = self._resampled(instrument, granularity)
+        if price == "M":
+            return mid
+        shift = 1 + self.spread / 2 if price == "A" else 1 - self.spread / 2
+        return Candles(
+            mid.time,
+            mid.open * shift,
+            mid.high * shift,
+            mid.low * shift,
+            mid.close * shift,
+            mid.volume,
+        )
+
+
+class RecordedSource:
+    """
+    Whatever the candle cache at `root` holds. Granularities that weren't
+    recorded are resampled from the recorded M1.
+    """
+
+    def __init__(self, root: str | None = None) -> None:
+        self.cache = CandleCache(root)
+        self._resampled: dict[tuple[str, str, str], Candles] = {}
+        self._lock = threading.Lock()
+
+    def candles(self, instrument: str, granularity: str, price: str) -> Candles:
+        candles = self.cache.read(instrument, granularity, price, mmap=True)
+        if len(candles) or granularity == "M1":
+            return candles
+        key = (instrument, granularity, price)
+        with self._lock:
+            if key not in self._resampled:
+                self._resampled[key] = Resampler(
+                    self.cache.read(instrument, "M1", price, mmap=True), NEW_YORK
+                ).bars(GRANULARITY_SECONDS[granularity], ALIGNMENT)
+            return self._resampled[key]
+
+
+def _price(value: float) -> str:
+    return f"{value:.5f}"
+
+
+def _time(epoch: int, unix: bool = False) -> str:
+    if unix:
+        return f"{epoch}.000000000"
+    return rfc3339(epoch).replace("Z", ".000000000Z")
+
+
+class StandIn:
+    """
+    The server. `latency` (plus up to `jitter`) seconds is added to every
+    response, `error_rate` of the requests get a 503, and requests beyond
+    `rate` per second get a 429. Injected faults are drawn from a generator
+    seeded with `seed`. Counts of what was served are kept in `stats`.
+    """
+
+    def __init__(
+        self,
+        source: SyntheticSource | RecordedSource,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate: float | None = None,
+        speed: float = 1.0,
+        replay_from: int | None = None,
+        seed: int = 0,
+    ) -> None:
+        self.source = source
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate = rate
+        self.speed = speed
+        self.replay_from = replay_from
+        self.orders: list[dict] = []
+        self.stats = dict(requests=0, candles=0, errors=0, throttled=0, ticks=0)
+        self._closing = threading.Event()
+        self._random = random.Random(seed)
+        self._recent: deque[float] = deque()
+        self._lock = threading.Lock()
+        self._started = clock.monotonic()
+        self._thread = None
+
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if STREAM.match(urlsplit(self.path).path):
+                    standin.stream(self)
+                else:
+                    self.reply(*standin.handle(self.path))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                unix = self.headers.get("Accept-Datetime-Format") == "UNIX"
+                self.reply(*standin.handle(self.path, body, unix))
+
+            def reply(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def host(self) -> str:
+        return self.server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def environ(self) -> dict[str, str]:
+        """
+        Environment variables that point `common.oanda.connect` here.
+        """
+        return dict(OANDA_HOSTNAME=self.host, OANDA_PORT=str(self.port), OANDA_SSL="0")
+
+    def connect(self, token: str = "standin") -> v20.Context:
+        return v20.Context(self.host, port=self.port, ssl=False, token=token)
+
+    def start(self) -> "StandIn":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._closing.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StandIn":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _fault(self) -> tuple[int, dict] | None:
+        with self._lock:
+            self.stats["requests"] += 1
+            now = clock.monotonic()
+            if self.rate is not None:
+                while self._recent and self._recent[0] <= now - 1.0:
+                    self._recent.popleft()
+                if len(self._recent) >= self.rate:
+                    self.stats["throttled"] += 1
+                    return 429, {"errorMessage": "Requests per second exceeded"}
+                self._recent.append(now)
+            delay = self.latency + self._random.random() * self.jitter
+            error = self._random.random() < self.error_rate
+            if error:
+                self.stats["errors"] += 1
+        if delay:
+            clock.sleep(delay)
+        if error:
+            return 503, {"errorMessage": "Service unavailable (injected)"}
+        return None
+
+    def handle(
+        self, path: str, body: bytes | None = None, unix: bool = False
+    ) -> tuple[int, dict]:
+        """
+        Status and JSON body for a GET, or a POST if there's a `body`.
+        """
+        fault = self._fault()
+        if fault is not None:
+            return fault
+        url = urlsplit(path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if body is not None:
+                if ORDERS.match(url.path):
+                    return self.order(json.loads(body), unix)
+            elif url.path == "/v3/accounts":
+                return 200, {"accounts": [{"id": ACCOUNT_ID, "tags": []}]}
+            elif match := CANDLES.match(url.path):
+                return self.candles(match.group(1), query)
+            elif PRICING.match(url.path):
+                return self.pricing(query)
+        except (KeyError, ValueError) as e:
+            return 400, {"errorMessage": f"Invalid value: {e}"}
+        return 404, {"errorMessage": f"{url.path} isn't implemented by the stand-in"}
+
+    def candles(self, instrument: str, query: dict[str, str]) -> tuple[int, dict]:
+        """
+        /v3/instruments/{instrument}/candles with price, granularity, from,
+        to and count. Unix or RFC3339 times.
+        """
+        granularity = query.get("granularity", "S5")
+        if granularity == "W":
+            return 400, {"errorMessage": "Weekly candles aren't implemented"}
+        seconds = GRANULARITY_SECONDS[granularity]
+        count = int(query.get("count", 500))
+        if count > MAX_CANDLES:
+            return 400, {"errorMessage": "Maximum value for 'count' exceeded"}
+
+        if "from" in query and "to" in query:
+            start, end = _epoch(query["from"]), _epoch(query["to"])
+            if (end - start) // seconds > MAX_CANDLES:
+                return 400, {"errorMessage": "Maximum value for 'count' exceeded"}
+            select = lambda c: c.between(start, end)
+        elif "from" in query:
+            start = _epoch(query["from"])
+            select = lambda c: c[np.searchsorted(c.time, start) :][:count]
+        else:
+            end = _epoch(query["to"]) if "to" in query else clock.time()
+            select = lambda c: c[: np.searchsorted(c.time, end)][-count:]
+
+        price = query.get("price", "M")
+        parts = {
+            p: select(self.source.candles(instrument, granularity, p)) for p in price
+        }
+        first = next(iter(parts.values()))
+        now = clock.time()
+        names = {"M": "mid", "B": "bid", "A": "ask"}
+        candles = [
+            {
+                "complete": bool(first.time[i] + seconds <= now),
+                "volume": int(first.volume[i]),
+                "time": _time(int(first.time[i])),
+                **{
+                    names[p]: {
+                        "o": _price(c.open[i]),
+                        "h": _price(c.high[i]),
+                        "l": _price(c.low[i]),
+                        "c": _price(c.close[i]),
+                    }
+                    for p, c in parts.items()
+                },
+            }
+            for i in range(len(first))
+        ]
+        with self._lock:
+            self.stats["candles"] += len(candles)
+        return 200, {
+            "instrument": instrument,
+            "granularity": granularity,
+            "candles": candles,
+        }
+
+    def replay_time(self, first: int) -> int:
+        """
+        Where the pricing replay is in a history starting at `first`.
+        """
+        start = self.replay_from if self.replay_from is not None else first
+        return int(start + (clock.monotonic() - self._started) * self.speed)
+
+    def pricing(self, query: dict[str, str]) -> tuple[int, dict]:
+        """
+        /v3/accounts/{id}/pricing for a comma-separated list of instruments.
+        """
+        prices = []
+        latest = 0
+        for instrument in query["instruments"].split(","):
+            bid = self.source.candles(instrument, "M1", "B")
+            ask = self.source.candles(instrument, "M1", "A")
+            if not len(bid) or not len(ask):
+                return 400, {"errorMessage": f"Invalid instrument {instrument}"}
+            now = self.replay_time(bid.time[0])
+            i = max(int(np.searchsorted(bid.time, now, side="right")) - 1, 0)
+            latest = max(latest, now)
+            prices.append(
+                {
+                    "type": "PRICE",
+                    "instrument": instrument,
+                    "time": _time(now),
+                    "tradeable": True,
+                    "status": "tradeable",
+                    "bids": [{"price": _price(bid.close[i]), "liquidity": 1000000}],
+                    "asks": [{"price": _price(ask.close[i]), "liquidity": 1000000}],
+                    "closeoutBid": _price(bid.close[i]),
+                    "closeoutAsk": _price(ask.close[i]),
+                }
+            )
+        return 200, {"prices": prices, "time": _time(latest)}
+
+    def order(self, body: dict, unix: bool) -> tuple[int, dict]:
+        """
+        POST /v3/accounts/{id}/orders, acknowledged but never filled.
+        """
+        order = body["order"]
+        with self._lock:
+            self.orders.append(order)
+            id = str(len(self.orders))
+        transaction = dict(
+            order,
+            id=id,
+            accountID=ACCOUNT_ID,
+            time=_time(int(clock.time()), unix),
+            reason="CLIENT_ORDER",
+        )
+        return 201, {
+            "orderCreateTransaction": transaction,
+            "relatedTransactionIDs": [id],
+            "lastTransactionID": id,
+        }
+
+    def ticks(self, instrument: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Times, bids and asks of the stream's ticks for `instrument`: the open,
+        the extreme away from the close, the other extreme and the close of
+        every M1 bar.
+        """
+        bid = self.source.candles(instrument, "M1", "B")
+        ask = self.source.candles(instrument, "M1", "A")
+        if not len(bid) or not len(ask):
+            raise ValueError(f"Invalid instrument {instrument}")
+        up = bid.close >= bid.open
+        times = (bid.time[:, None] + np.array(TICKS)).ravel()
+        bids, asks = (
+            np.stack(
+                [
+                    c.open,
+                    np.where(up, c.low, c.high),
+                    np.where(up, c.high, c.low),
+                    c.close,
+                ],
+                axis=1,
+            ).ravel()
+            for c in (bid, ask)
+        )
+        return times, bids, asks
+
+    def stream(self, handler: BaseHTTPRequestHandler) -> None:
+        """
+        Serves /v3/accounts/{id}/pricing/stream on `handler` until the client
+        goes away, the replay runs out or the server stops, with a HEARTBEAT
+        every few seconds of wall-clock time. Times are always UNIX, which is
+        what common.stream asks for.
+        """
+        fault = self._fault()
+        if fault is not None:
+            handler.reply(*fault)
+            return
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(handler.path).query).items()}
+        try:
+            instruments = query["instruments"].split(",")
+            ticks = [self.ticks(instrument) for instrument in instruments]
+        except (KeyError, ValueError) as e:
+            handler.reply(400, {"errorMessage": f"Invalid value: {e}"})
+            return
+        which = np.repeat(np.arange(len(ticks)), [len(t) for t, _, _ in ticks])
+        times, bids, asks = (np.concatenate(column) for column in zip(*ticks))
+        order = np.argsort(times, kind="stable")
+        times, bids, asks, which = times[order], bids[order], asks[order], which[order]
+        origin = self.replay_from if self.replay_from is not None else times[0]
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def send(line: bytes) -> None:
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            handler.wfile.flush()
+
+        heartbeat = clock.monotonic() + HEARTBEAT
+        try:
+            first = np.searchsorted(times, self.replay_time(times[0]))
+            for k in range(first, len(times)):
+                due = self._started + (times[k] - origin) / self.speed
+                while (now := clock.monotonic()) < due:
+                    if now >= heartbeat:
+                        replayed = int(origin + (now - self._started) * self.speed)
+                        send(
+                            b'{"type":"HEARTBEAT","time":"%s"}\n'
+                            % _time(replayed, True).encode()
+                        )
+                        heartbeat += HEARTBEAT
+                    if self._closing.wait(min(due, heartbeat) - now):
+                        return
+                bid, ask = _price(bids[k]), _price(asks[k])
+                price = {
+                    "type": "PRICE",
+                    "time": _time(int(times[k]), True),
+                    "bids": [{"price": bid, "liquidity": 1000000}],
+                    "asks": [{"price": ask, "liquidity": 1000000}],
+                    "closeoutBid": bid,
+                    "closeoutAsk": ask,
+                    "status": "tradeable",
+                    "tradeable": True,
+                    "instrument": instruments[which[k]],
+                }
+                send(json.dumps(price).encode() + b"\n")
+                with self._lock:
+                    self.stats["ticks"] += 1
+            handler.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            handler.close_connection = True
+
+
+def _epoch(value: str) -> int:
+    if "T" in value:
+        return int(np.datetime64(value.rstrip("Z")[:19], "s").astype(np.int64))
+    return int(float(value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OANDA v20 stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--cache",
+        metavar="ROOT",
+        nargs="?",
+        const="",
+        help="serve recorded candles from the candle cache instead of synthetic",
+    )
+    parser.add_argument("--years", type=float, default=1, help="synthetic history")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, help="requests/s before 429s")
+    parser.add_argument("--speed", type=float, default=1.0, help="pricing replay")
+    parser.add_argument(
+        "--replay-from",
+        type=_epoch,
+        help="start the pricing replay here (RFC3339 or epoch seconds)",
+    )
+    args = parser.parse_args()
+
+    if args.cache is not None:
+        source = RecordedSource(args.cache or None)
+    else:
+        source = SyntheticSource(args.years, args.seed)
+    standin = StandIn(
+        source,
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate=args.rate,
+        speed=args.speed,
+        replay_from=args.replay_from,
+        seed=args.seed,
+    )
+    logging.info(f"Serving on http://{standin.host}:{standin.port}")
+    logging.info(
+        " ".join(f"{name}={value}" for name, value in standin.environ().items())
+    )
+    try:
+        standin.server.serve_forever()
+    finally:
+        logging.info(f"Served {standin.stats}")
+        standin.server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()  # hack to move to next line
+        logging.info("Process interrupted by user. Exiting...")
@@ -0,0 +1,91 @@
+"""
+Deterministic synthetic OHLC bars for benchmarking without network access.
+
+Bars follow an OANDA-style CFD session on New York wall-clock time: open from
+18:00 to 17:00 the next day, Sunday evening to Friday evening, with the daily
+17:00-18:00 break. The grid is laid out in UTC and the session is cut on local
+time, so DST transitions move the session in UTC the way real data does. Every
+reopen gaps away from the previous close, and volatility is higher around the
+cash open and close so the opening-range strategies have something to trade.
+"""
+
+from datetime import datetime, time, timezone, tzinfo
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from common.candles import DAY, Candles, local_times, to_seconds
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+# a Monday, with DST transitions in every year after it
+START = datetime(2015, 1, 5, tzinfo=timezone.utc)
+YEAR = 365 * DAY
+
+# (from, to, volatility multiplier) in local time, 0.6 outside of these
+ACTIVITY = (
+    (time(9, 30), time(11, 0), 2.0),
+    (time(11, 0), time(15, 30), 1.2),
+    (time(15, 30), time(16, 0), 1.6),
+)
+
+
+def _in_session(local: np.ndarray, session_open: time, session_close: time):
+    weekday = (local // DAY + 3) % 7  # 0 = Monday
+    seconds = local % DAY
+    opens, closes = to_seconds(session_open), to_seconds(session_close)
+    return (
+        ~((seconds >= closes) & (seconds < opens))
+        & ~((weekday == 4) & (seconds >= closes))
+        & (weekday != 5)
+        & ~((weekday == 6) & (seconds < opens))
+    )
+
+
+def generate(
+    years: float,
+    step: int,
+    seed: int = 0,
+    start: datetime = START,
+    tz: tzinfo = NEW_YORK,
+    price: float = 35000.0,
+    volatility: float = 0.15,
+    gap: float = 0.002,
+    session_open: time = time(18, 0),
+    session_close: time = time(17, 0),
+) -> Candles:
+    """
+    `years` of `step`-second bars. `volatility` is the annualised volatility
+    of the random walk and `gap` the standard deviation of the jump at each
+    reopen, both as fractions of price. The same arguments always give the
+    same bars.
+    """
+    rng = np.random.default_rng(seed)
+    begin = int(start.timestamp())
+    times = np.arange(begin, begin + int(years * YEAR), step, dtype=np.int64)
+    local = local_times(times, tz)
+    inside = _in_session(local, session_open, session_close)
+    times, local = times[inside], local[inside]
+    n = len(times)
+
+    # busier around the cash open and close, quiet overnight
+    seconds = local % DAY
+    scale = np.full(n, 0.6)
+    for frm, to, factor in ACTIVITY:
+        scale[(seconds >= to_seconds(frm)) & (seconds < to_seconds(to))] = factor
+    sigma = volatility * np.sqrt(step / (252 * 23 * 3600)) * scale
+
+    # a jump between the previous close and the open wherever the previous bar
+    # is more than one step back
+    reopen = np.diff(times, prepend=times[:1] - step) > step
+    jumps = np.zeros(n)
+    jumps[reopen] = rng.normal(0.0, gap, int(reopen.sum()))
+    moves = rng.normal(0.0, 1.0, n) * sigma
+
+    close = price * np.exp(np.cumsum(jumps + moves))
+    open = close * np.exp(-moves)
+    wick = np.abs(rng.normal(0.0, 1.0, (2, n))) * sigma * close / 2
+    high = np.maximum(open, close) + wick[0]
+    low = np.minimum(open, close) - wick[1]
+    volume = rng.poisson(50 * scale * step / 60).astype(np.int64) + 1
+    return Candles(times, open, high, low, close, volume)
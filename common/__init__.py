@@ -0,0 +1,6 @@
+"""
+Shared plumbing for the backtests in this repo (data fetching, caching, etc.).
+
+The strategy scripts stay self-contained; anything more than one of them needs
+lives here.
+"""
@@ -0,0 +1,266 @@
+"""
+On-disk candle store so repeat backtests don't re-download history.
+
+Candles are kept per (instrument, granularity, price component) as one `.npy`
+file per column, plus a `coverage.json` listing the [start, end) epoch-second
+ranges that have already been fetched. A request only hits the API for the
+parts of its range that aren't covered yet.
+
+    <root>/<instrument>/<granularity>/<price>/{time,open,...}.npy
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import v20
+
+from common.candles import COLUMNS, Candles
+from common.oanda import (
+    GRANULARITY_SECONDS,
+    Failure,
+    FetchError,
+    connect,
+    fetch_ranges,
+    rfc3339,
+    to_epoch,
+)
+
+DEFAULT_ROOT = Path(__file__).resolve().parent.parent / ".candles"
+
+logger = logging.getLogger("common.cache")
+
+
+def merge_ranges(ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(
+    start: int, end: int, covered: list[tuple[int, int]]
+) -> list[tuple[int, int]]:
+    """
+    Parts of [start, end) that aren't in `covered` (which must be merged).
+    """
+    gaps = []
+    cursor = start
+    for c_start, c_end in covered:
+        if c_end <= cursor:
+            continue
+        if c_start >= end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class CandleCache:
+    def __init__(
+        self,
+        root: str | os.PathLike | None = None,
+        connect_fn: Callable[[], v20.Context] | None = None,
+        workers: int = 4,
+        rate: float = 20.0,
+    ) -> None:
+        """
+        `connect_fn` (`common.oanda.connect` by default, or a stand-in's
+        `connect`) is called once per fetch thread, on its first request, as
+        a v20 context isn't safe to share between threads. A fully cached
+        load never touches the network.
+        """
+        self.root = Path(root or os.getenv("CANDLE_CACHE_DIR") or DEFAULT_ROOT)
+        self._connect = connect_fn or connect
+        self.workers = workers
+        self.rate = rate
+        self._loaded: dict[tuple[str, str, str], Candles] = {}
+
+    def path(self, instrument: str, granularity: str, price: str) -> Path:
+        return self.root / instrument / granularity / price
+
+    def coverage(
+        self, instrument: str, granularity: str, price: str
+    ) -> list[tuple[int, int]]:
+        path = self.path(instrument, granularity, price) / "coverage.json"
+        if not path.exists():
+            return []
+        return [tuple(r) for r in json.loads(path.read_text())]
+
+    def read(
+        self, instrument: str, granularity: str, price: str, mmap: bool = False
+    ) -> Candles:
+        """
+        Everything on disk for the key. With `mmap` the columns are mapped
+        read-only instead of read in, so opening years of M1 is instant and
+        only the pages that get touched are ever loaded.
+        """
+        key = (instrument, granularity, price)
+        if mmap and key not in self._loaded:
+            path = self.path(*key)
+            if not (path / "time.npy").exists():
+                return Candles.empty()
+            # plain ndarray views skip np.memmap's python-level __getitem__
+            return Candles(
+                *(
+                    np.load(path / f"{name}.npy", mmap_mode="r").view(np.ndarray)
+                    for name in COLUMNS
+                )
+            )
+        if key not in self._loaded:
+            path = self.path(*key)
+            if (path / "time.npy").exists():
+                self._loaded[key] = Candles(
+                    *(np.load(path / f"{name}.npy") for name in COLUMNS)
+                )
+            else:
+                self._loaded[key] = Candles.empty()
+        return self._loaded[key]
+
+    def _write(
+        self,
+        instrument: str,
+        granularity: str,
+        price: str,
+        candles: Candles,
+        coverage: list[tuple[int, int]],
+    ) -> None:
+        path = self.path(instrument, granularity, price)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in COLUMNS:
+            tmp = path / f"{name}.tmp.npy"
+            np.save(tmp, getattr(candles, name))
+            os.replace(tmp, path / f"{name}.npy")
+        # coverage goes last so a crash mid-write never claims data we don't have
+        tmp = path / "coverage.tmp.json"
+        tmp.write_text(json.dumps(coverage))
+        os.replace(tmp, path / "coverage.json")
+        self._loaded[(instrument, granularity, price)] = candles
+
+    def missing(
+        self,
+        instrument: str,
+        granularity: str,
+        price: str,
+        start: datetime | int,
+        end: datetime | int,
+    ) -> list[tuple[int, int]]:
+        return subtract_ranges(
+            to_epoch(start),
+            to_epoch(end),
+            self.coverage(instrument, granularity, price),
+        )
+
+    def update(
+        self,
+        instrument: str,
+        granularity: str,
+        price: str,
+        start: datetime | int,
+        end: datetime | int,
+    ) -> list[Failure]:
+        """
+        Downloads whatever part of [start, end) isn't on disk yet.
+        """
+        return self.update_ranges(instrument, granularity, price, [(start, end)])
+
+    def update_ranges(
+        self,
+        instrument: str,
+        granularity: str,
+        price: str,
+        ranges: list[tuple[datetime | int, datetime | int]],
+    ) -> list[Failure]:
+        """
+        Downloads the uncovered parts of several [start, end) ranges in one
+        batch of concurrent requests. Whatever succeeded is written to disk;
+        the ranges that couldn't be fetched are returned.
+        """
+        # candles that haven't closed yet would be cached in their incomplete state
+        latest = int(time.time()) - GRANULARITY_SECONDS[granularity]
+        covered = self.coverage(instrument, granularity, price)
+        gaps = []
+        for start, end in merge_ranges(
+            [(to_epoch(start), min(to_epoch(end), latest)) for start, end in ranges]
+        ):
+            if start < end:
+                gaps += subtract_ranges(start, end, covered)
+        if not gaps:
+            return []
+
+        logger.info(
+            "Fetching %s %s (%s) in %i gap(s) from %s to %s",
+            instrument,
+            granularity,
+            price,
+            len(gaps),
+            rfc3339(gaps[0][0]),
+            rfc3339(gaps[-1][1]),
+        )
+        fetched, failures = fetch_ranges(
+            self._connect,
+            instrument,
+            granularity,
+            price,
+            gaps,
+            workers=self.workers,
+            rate=self.rate,
+        )
+        if not fetched:
+            return failures
+
+        candles = Candles.concat(
+            [self.read(instrument, granularity, price)] + [f[2] for f in fetched]
+        )
+        # sorted and de-duplicated, newest download wins if a candle was revised
+        _, last = np.unique(candles.time[::-1], return_index=True)
+        candles = candles[len(candles) - 1 - last]
+
+        coverage = merge_ranges(covered + [(f[0], f[1]) for f in fetched])
+        self._write(instrument, granularity, price, candles, coverage)
+        return failures
+
+    def load(
+        self,
+        instrument: str,
+        granularity: str,
+        price: str,
+        start: datetime | int,
+        end: datetime | int,
+        fetch: bool = True,
+        mmap: bool = False,
+    ) -> Candles:
+        """
+        Candles with start times in [start, end), fetching any gaps first unless
+        `fetch` is off (see `read` for `mmap`).
+        """
+        if fetch:
+            failures = self.update(instrument, granularity, price, start, end)
+            if failures:
+                raise FetchError("; ".join(f.error for f in failures))
+        else:
+            gaps = self.missing(instrument, granularity, price, start, end)
+            if gaps:
+                logger.warning(
+                    "%s %s (%s) isn't cached for %i gap(s) from %s to %s",
+                    instrument,
+                    granularity,
+                    price,
+                    len(gaps),
+                    rfc3339(gaps[0][0]),
+                    rfc3339(gaps[-1][1]),
+                )
+        return self.read(instrument, granularity, price, mmap=mmap).between(
+            to_epoch(start), to_epoch(end)
+        )
@@ -0,0 +1,231 @@
+"""
+Columnar candle container.
+
+Every column is a NumPy array (int64 epoch seconds for time, float64 prices,
+int64 volume) and slicing a `Candles` returns views into the same arrays, so a
+multi-year M1 history can be cut into days and sessions without copying.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+
+import numpy as np
+
+COLUMNS = ("time", "open", "high", "low", "close", "volume")
+
+# price component letter -> attribute on a v20 Candlestick
+PRICE_COMPONENTS = {"M": "mid", "B": "bid", "A": "ask"}
+
+DAY = 24 * 60 * 60
+
+
+def parse_times(times: list[str]) -> np.ndarray:
+    """
+    Converts v20 candle times (RFC3339 or UNIX format) to int64 epoch seconds.
+    """
+    if not times:
+        return np.empty(0, dtype=np.int64)
+    if "T" not in times[0]:
+        return np.array(times, dtype=np.float64).astype(np.int64)
+    # "2024-01-02T14:30:00.000000000Z" -> "2024-01-02T14:30:00"
+    return np.array([t[:19] for t in times], dtype="datetime64[s]").astype(np.int64)
+
+
+def _utcoffset(epoch: int, tz: tzinfo) -> int:
+    return int(datetime.fromtimestamp(epoch, tz).utcoffset().total_seconds())
+
+
+def utc_offsets(times: np.ndarray, tz: tzinfo) -> np.ndarray:
+    """
+    UTC offset in seconds of `tz` at each epoch second in `times` (sorted).
+
+    The zone is only consulted once per day, plus a 15-minute scan of the days
+    a DST transition falls on, so this stays cheap for years of M1 data.
+    """
+    if len(times) == 0:
+        return np.empty(0, dtype=np.int64)
+    days = np.arange(times[0] - times[0] % DAY, times[-1] + DAY, DAY)
+    points = [int(days[0])]
+    values = [_utcoffset(points[0], tz)]
+    for day in days[1:]:
+        if _utcoffset(int(day), tz) == values[-1]:
+            continue
+        for t in range(int(day) - DAY + 900, int(day) + 1, 900):
+            offset = _utcoffset(t, tz)
+            if offset != values[-1]:
+                points.append(t)
+                values.append(offset)
+                break
+    index = np.searchsorted(points, times, side="right") - 1
+    return np.asarray(values, dtype=np.int64)[index]
+
+
+def local_times(times: np.ndarray, tz: tzinfo) -> np.ndarray:
+    """
+    Wall-clock time in `tz`, as epoch-style seconds (i.e. `// DAY` gives the
+    local date and `% DAY` the local time of day).
+    """
+    return times + utc_offsets(times, tz)
+
+
+def to_seconds(t: time) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def to_dates(local_days: np.ndarray) -> list[date]:
+    """
+    Dates for day numbers as produced by `local_times(...) // DAY`.
+    """
+    epoch = date(1970, 1, 1)
+    return [epoch + timedelta(days=int(d)) for d in local_days]
+
+
+class Candles:
+    """
+    OHLCV bars with start times in ascending order.
+    """
+
+    __slots__ = COLUMNS
+
+    def __init__(
+        self,
+        time: np.ndarray,
+        open: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        volume: np.ndarray,
+    ) -> None:
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def empty(cls) -> "Candles":
+        return cls(
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, np.ndarray]) -> "Candles":
+        return cls(*(columns[name] for name in COLUMNS))
+
+    @classmethod
+    def from_v20(cls, candles: list, price: str = "M") -> "Candles":
+        """
+        Builds the arrays in one go from a v20 candles response body, keeping
+        only complete candles.
+        """
+        component = PRICE_COMPONENTS[price]
+        candles = [c for c in candles if c.complete]
+        data = [getattr(c, component) for c in candles]
+        return cls(
+            parse_times([c.time for c in candles]),
+            np.fromiter((d.o for d in data), np.float64, len(data)),
+            np.fromiter((d.h for d in data), np.float64, len(data)),
+            np.fromiter((d.l for d in data), np.float64, len(data)),
+            np.fromiter((d.c for d in data), np.float64, len(data)),
+            np.fromiter((c.volume for c in candles), np.int64, len(candles)),
+        )
+
+    @classmethod
+    def concat(cls, parts: list["Candles"]) -> "Candles":
+        if not parts:
+            return cls.empty()
+        return cls(
+            *(np.concatenate([getattr(p, name) for p in parts]) for name in COLUMNS)
+        )
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __getitem__(self, key) -> "Candles":
+        """
+        Slices (views) or fancy-indexes (copies) every column at once.
+        """
+        return Candles(*(getattr(self, name)[key] for name in COLUMNS))
+
+    def __repr__(self) -> str:
+        if len(self) == 0:
+            return "Candles(0 bars)"
+        return (
+            f"Candles({len(self)} bars, "
+            f"{datetime.fromtimestamp(int(self.time[0]), timezone.utc)} to "
+            f"{datetime.fromtimestamp(int(self.time[-1]), timezone.utc)})"
+        )
+
+    def between(self, start: int, end: int) -> "Candles":
+        """
+        View of the bars starting in [start, end) (epoch seconds).
+        """
+        lo, hi = np.searchsorted(self.time, [start, end])
+        return self[lo:hi]
+
+    def days(self, tz: tzinfo) -> tuple[list[date], np.ndarray, np.ndarray]:
+        """
+        Local calendar dates in `tz` with the [start, stop) bar index of each,
+        so `self[start:stop]` is that day's view.
+        """
+        local_days = local_times(self.time, tz) // DAY
+        starts = np.flatnonzero(np.diff(local_days, prepend=local_days[:1] - 1))
+        stops = np.append(starts[1:], len(self))
+        return to_dates(local_days[starts]), starts, stops
+
+    def sessions(
+        self, tz: tzinfo, start: time, end: time
+    ) -> tuple[list[date], np.ndarray, np.ndarray]:
+        """
+        Like `days`, but only the bars starting between the local times
+        [start, end) of each day. Days without any such bars are left out.
+        """
+        local = local_times(self.time, tz)
+        dates, day_starts, _ = self.days(tz)
+        midnights = local[day_starts] // DAY * DAY
+        # bars are sorted, so each day's session is one contiguous run
+        lo = np.searchsorted(local, midnights + to_seconds(start))
+        hi = np.searchsorted(local, midnights + to_seconds(end))
+        keep = hi > lo
+        return [d for d, k in zip(dates, keep) if k], lo[keep], hi[keep]
+
+    def grid(
+        self, tz: tzinfo, start: time, end: time, step: int
+    ) -> tuple[list[date], dict[str, np.ndarray]]:
+        """
+        Lays each local day's bars between [start, end) out on a
+        (days, slots) grid of `step`-second slots, so whole-history session
+        logic can be written as column operations. Missing bars are NaN, and
+        bars that don't start on a slot boundary are dropped.
+        """
+        local = local_times(self.time, tz)
+        offset = local % DAY - to_seconds(start)
+        slots = (to_seconds(end) - to_seconds(start)) // step
+        inside = (offset >= 0) & (offset < slots * step) & (offset % step == 0)
+        day_keys, rows = np.unique(local[inside] // DAY, return_inverse=True)
+        cols = offset[inside] // step
+        prices = {}
+        for name in ("open", "high", "low", "close"):
+            prices[name] = np.full((len(day_keys), slots), np.nan)
+            prices[name][rows, cols] = getattr(self, name)[inside]
+        return to_dates(day_keys), prices
+
+    def to_dataframe(self):
+        """
+        DataFrame indexed by naive UTC datetimes, ready for `bt.feeds.PandasData`.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(
+            {name: getattr(self, name) for name in COLUMNS[1:]},
+            index=pd.to_datetime(self.time, unit="s"),
+        )
@@ -0,0 +1,189 @@
+"""
+Streams a backtest's fills, closed trades and equity curve to Parquet while it
+runs.
+
+Rows are collected into preallocated NumPy batches and each full batch is
+written out as a row group, so memory stays fixed however long the run is and
+nothing has to be serialised at the end. Each stream is one file:
+
+    <directory>/{fills,trades,equity}.parquet
+
+and can be read back with `pd.read_parquet` (or any other Parquet reader)
+once the run has finished.
+"""
+
+from pathlib import Path
+
+import backtrader as bt
+import numpy as np
+
+from common.candles import DAY
+from common.feeds import EPOCH
+
+FILLS = {
+    "time": np.int64,
+    "ref": np.int64,
+    "side": np.int8,
+    "size": np.float64,
+    "price": np.float64,
+    "value": np.float64,
+    "commission": np.float64,
+}
+TRADES = {
+    "ref": np.int64,
+    "opened": np.int64,
+    "closed": np.int64,
+    "side": np.int8,
+    "size": np.float64,
+    "entry_price": np.float64,
+    "exit_price": np.float64,
+    "pnl": np.float64,
+    "pnl_comm": np.float64,
+    "bars": np.int64,
+}
+EQUITY = {
+    "time": np.int64,
+    "value": np.float64,
+    "cash": np.float64,
+}
+
+# int64 columns that hold epoch seconds
+TIMESTAMPS = {"time", "opened", "closed"}
+
+
+def _epoch(num: float) -> int:
+    return round((num - EPOCH) * DAY)
+
+
+class _Stream:
+    """
+    One Parquet file fed from a fixed-size batch of columns.
+    """
+
+    def __init__(self, path: Path, columns: dict[str, type], batch_size: int) -> None:
+        import pyarrow as pa
+
+        self.path = path
+        self.columns = {
+            name: np.empty(batch_size, dtype) for name, dtype in columns.items()
+        }
+        self.schema = pa.schema(
+            [
+                (
+                    name,
+                    (
+                        pa.timestamp("s", tz="UTC")
+                        if name in TIMESTAMPS
+                        else pa.from_numpy_dtype(dtype)
+                    ),
+                )
+                for name, dtype in columns.items()
+            ]
+        )
+        self.rows = 0
+        self._writer = None
+
+    def append(self, *row) -> None:
+        for column, value in zip(self.columns.values(), row):
+            column[self.rows] = value
+        self.rows += 1
+        if self.rows == len(column):
+            self.flush()
+
+    def flush(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        if self.rows:
+            self._writer.write_batch(
+                pa.record_batch(
+                    [
+                        pa.array(column[: self.rows], type=field.type)
+                        for column, field in zip(self.columns.values(), self.schema)
+                    ],
+                    schema=self.schema,
+                )
+            )
+            self.rows = 0
+
+    def close(self) -> None:
+        # always leaves a file behind, even an empty one
+        self.flush()
+        self._writer.close()
+
+
+class ParquetExport(bt.Analyzer):
+    """
+    Writes every fill, every closed trade and an equity sample every
+    `equity_every` bars to Parquet files in `directory` as the run goes, in
+    batches of `batch_size` rows. Times are UTC.
+
+    Needs pyarrow.
+    """
+
+    params = (
+        ("directory", "backtest_output"),
+        ("batch_size", 10_000),
+        ("equity_every", 1),
+    )
+
+    def start(self):
+        directory = Path(self.p.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.fills = _Stream(directory / "fills.parquet", FILLS, self.p.batch_size)
+        self.trades = _Stream(directory / "trades.parquet", TRADES, self.p.batch_size)
+        self.equity = _Stream(directory / "equity.parquet", EQUITY, self.p.batch_size)
+        self._opened = {}
+        self._bars = 0
+
+    def notify_order(self, order):
+        if order.status != order.Completed:
+            return
+        self.fills.append(
+            _epoch(order.data.datetime[0]),
+            order.ref,
+            1 if order.isbuy() else -1,
+            abs(order.executed.size),
+            order.executed.price,
+            order.executed.value,
+            order.executed.comm,
+        )
+
+    def notify_trade(self, trade):
+        if trade.justopened:
+            self._opened[trade.ref] = (trade.size, trade.price)
+        elif trade.isclosed and trade.ref in self._opened:
+            size, price = self._opened.pop(trade.ref)
+            self.trades.append(
+                trade.ref,
+                _epoch(trade.dtopen),
+                _epoch(trade.dtclose),
+                1 if size > 0 else -1,
+                abs(size),
+                price,
+                price + trade.pnl / size,
+                trade.pnl,
+                trade.pnlcomm,
+                trade.barlen,
+            )
+
+    def next(self):
+        self._bars += 1
+        if self._bars % self.p.equity_every == 0:
+            broker = self.strategy.broker
+            self.equity.append(
+                _epoch(self.strategy.datetime[0]), broker.getvalue(), broker.getcash()
+            )
+
+    def stop(self):
+        for stream in (self.fills, self.trades, self.equity):
+            stream.close()
+
+    def get_analysis(self):
+        return {
+            "fills": self.fills.path,
+            "trades": self.trades.path,
+            "equity": self.equity.path,
+        }
@@ -0,0 +1,93 @@
+"""
+Backtrader data feeds backed by `Candles` arrays.
+"""
+
+import backtrader as bt
+import numpy as np
+
+from common.candles import DAY, Candles
+
+# bt.date2num(datetime(1970, 1, 1))
+EPOCH = 719163.0
+
+# (timeframe, compression) -> OANDA granularity, as the OANDA store maps them
+GRANULARITIES = {
+    (bt.TimeFrame.Seconds, 5): "S5",
+    (bt.TimeFrame.Seconds, 10): "S10",
+    (bt.TimeFrame.Seconds, 15): "S15",
+    (bt.TimeFrame.Seconds, 30): "S30",
+    (bt.TimeFrame.Minutes, 1): "M1",
+    (bt.TimeFrame.Minutes, 2): "M2",
+    (bt.TimeFrame.Minutes, 4): "M4",
+    (bt.TimeFrame.Minutes, 5): "M5",
+    (bt.TimeFrame.Minutes, 10): "M10",
+    (bt.TimeFrame.Minutes, 15): "M15",
+    (bt.TimeFrame.Minutes, 30): "M30",
+    (bt.TimeFrame.Minutes, 60): "H1",
+    (bt.TimeFrame.Minutes, 120): "H2",
+    (bt.TimeFrame.Minutes, 180): "H3",
+    (bt.TimeFrame.Minutes, 240): "H4",
+    (bt.TimeFrame.Minutes, 360): "H6",
+    (bt.TimeFrame.Minutes, 480): "H8",
+    (bt.TimeFrame.Minutes, 720): "H12",
+    (bt.TimeFrame.Days, 1): "D",
+    (bt.TimeFrame.Weeks, 1): "W",
+}
+
+
+class CandlesData(bt.feed.DataBase):
+    """
+    Feeds a `Candles` (passed as `dataname`) to cerebro bar by bar, straight
+    from its arrays. Candle times are UTC, so `tz` works the same as it does
+    on the OANDA store feed.
+    """
+
+    def start(self):
+        super().start()
+        self._candles = self.p.dataname
+        self._idx = None
+        self._first = 0
+
+    @property
+    def candles(self) -> Candles:
+        """
+        The candles being fed, once the feed has started.
+        """
+        return self._candles
+
+    def _load(self):
+        candles = self._candles
+        if self._idx is None:
+            # fromdate/todate are only converted after start(), so skip ahead
+            # here. load() compares them against our datetimes again, so they're
+            # snapped to whole seconds on our scale or float rounding could
+            # drop the bars right on the boundaries
+            self._idx = 0
+            if self.fromdate != float("-inf"):
+                fromdate = round((self.fromdate - EPOCH) * DAY)
+                self._idx = int(np.searchsorted(candles.time, fromdate))
+                self.fromdate = fromdate / DAY + EPOCH
+            if self.todate != float("inf"):
+                self.todate = round((self.todate - EPOCH) * DAY) / DAY + EPOCH
+            self._first = self._idx
+
+        i = self._idx
+        if i >= len(candles):
+            return False
+
+        self.lines.datetime[0] = candles.time[i] / DAY + EPOCH
+        self.lines.open[0] = candles.open[i]
+        self.lines.high[0] = candles.high[i]
+        self.lines.low[0] = candles.low[i]
+        self.lines.close[0] = candles.close[i]
+        self.lines.volume[0] = candles.volume[i]
+        self.lines.openinterest[0] = 0.0
+        self._idx = i + 1
+        return True
+
+    def index(self) -> int:
+        """
+        Position of the current bar in the candles, e.g. for looking it up in
+        a `common.sessions.SessionCalendar` built from them.
+        """
+        return self._first + len(self) - 1
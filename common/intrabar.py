@@ -0,0 +1,121 @@
+"""
+Resolves bracket exits that a coarse bar can't put in order by itself.
+
+When a single bar's range covers both a bracket's stop and its target,
+backtrader's broker can't tell which came first. It fills whichever child is
+ahead in its pending queue, which for `buy_bracket`/`sell_bracket` is always
+the stop. `IntrabarBroker` looks such bars up in finer bars instead, loaded on
+demand for that bar alone, and lets whichever side the fine bars reach first
+fill. Every other bar goes through the normal broker, so a strategy on M15
+keeps M15 speed and only pays for M1 on the handful of bars that need it.
+"""
+
+import logging
+
+import backtrader as bt
+import numpy as np
+
+from common.candles import DAY, Candles
+from common.feeds import EPOCH
+
+logger = logging.getLogger("common.intrabar")
+
+
+def first_touch(fine: Candles, sell: bool, stop: float, target: float) -> str | None:
+    """
+    Which of a bracket's `stop` and `target` the bars reach first, "stop" or
+    "target". `sell` is the side of the exits, i.e. True for a long position.
+    None if neither is reached or the first bar to reach one reaches both.
+    """
+    if sell:
+        stopped, taken = fine.low <= stop, fine.high >= target
+    else:
+        stopped, taken = fine.high >= stop, fine.low <= target
+    either = np.flatnonzero(stopped | taken)
+    if not len(either) or (stopped[either[0]] and taken[either[0]]):
+        return None
+    return "stop" if stopped[either[0]] else "target"
+
+
+class IntrabarBroker(bt.brokers.BackBroker):
+    """
+    BackBroker that settles a bracket's stop-vs-target ties on finer bars.
+
+    `fine(start, end)` must return the finer candles starting in [start, end)
+    (epoch seconds) and `seconds` is the length of the strategy's bars. A bar
+    that opens through either exit fills that exit, as it would anyway. When
+    the fine bars can't settle it either (no data, or one fine bar covering
+    both), the stop fills, as the normal broker would have done.
+
+    Counts the ambiguous bars it saw, how many of them the fine bars
+    `resolved`, and how many of those went to the target rather than the stop
+    (`targets`, the fills that differ from the normal broker's).
+    """
+
+    params = (
+        ("fine", None),
+        ("seconds", 15 * 60),
+    )
+
+    def start(self):
+        super().start()
+        self.ambiguous = 0
+        self.resolved = 0
+        self.targets = 0
+        self._winners: dict[tuple[int, int], bt.Order | None] = {}
+
+    def _try_exec(self, order):
+        if order.parent is not None and self.p.fine is not None:
+            winner = self._winner(order)
+            # the winner fills on its own turn and cancels this one
+            if winner is not None and winner is not order:
+                return
+        super()._try_exec(order)
+
+    def _winner(self, order: bt.Order) -> bt.Order | None:
+        """
+        The child of `order`'s bracket that fills on this bar when both would,
+        or None if they don't both trigger here.
+        """
+        data = order.data
+        key = (order.parent.ref, len(data))
+        if key in self._winners:
+            return self._winners[key]
+
+        children = [o for o in self._pchildren.get(order.parent.ref, ()) if o.alive()]
+        stop = next((o for o in children if o.exectype == bt.Order.Stop), None)
+        target = next((o for o in children if o.exectype == bt.Order.Limit), None)
+        winner = None
+        if stop is not None and target is not None:
+            winner = self._resolve(data, stop, target)
+        # only the current bar's decisions are ever looked up again
+        self._winners = {key: winner}
+        return winner
+
+    def _resolve(self, data, stop: bt.Order, target: bt.Order) -> bt.Order | None:
+        sell = stop.issell()
+        stop_price, target_price = stop.created.price, target.created.price
+        # signed so that "beyond" is always >= for the stop and <= for the target
+        sign = -1 if sell else 1
+        popen, phigh, plow = data.open[0], data.high[0], data.low[0]
+        worst, best = (plow, phigh) if sell else (phigh, plow)
+        if sign * worst < sign * stop_price or sign * best > sign * target_price:
+            return None  # at most one of them triggers
+        if sign * popen >= sign * stop_price:
+            return stop
+        if sign * popen <= sign * target_price:
+            return target
+
+        self.ambiguous += 1
+        start = round((data.datetime[0] - EPOCH) * DAY)
+        first = first_touch(
+            self.p.fine(start, start + self.p.seconds), sell, stop_price, target_price
+        )
+        if first is None:
+            logger.debug("Bar at %i still ambiguous on finer bars", start)
+            return stop
+        self.resolved += 1
+        if first == "target":
+            self.targets += 1
+            return target
+        return stop
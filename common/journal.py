@@ -0,0 +1,171 @@
+"""
+Structured strategy event journal.
+
+Strategies used to format a log line for every order and every pre-open bar,
+paying for the f-strings whether or not anything was listening. Instead they
+append typed records to a `Journal`, a preallocated ring buffer of fixed-size
+rows, and the records are looked at after the run. A strategy without a
+journal only pays for an `is not None` check.
+"""
+
+import logging
+from enum import IntEnum
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from common.candles import DAY
+from common.feeds import EPOCH
+
+
+class Event(IntEnum):
+    RANGE_DEFINED = 1
+    BRACKET_PLACED = 2
+    FILL = 3
+    CANCEL = 4
+    FLATTEN = 5
+
+
+# fields a record doesn't use are left NaN (or -1 for ref)
+RECORD = np.dtype(
+    [
+        ("time", np.float64),  # backtrader date number, UTC
+        ("event", np.uint8),
+        ("side", np.int8),  # +1 buy, -1 sell
+        ("ref", np.int64),  # order ref (the parent's for brackets)
+        ("size", np.float64),
+        ("price", np.float64),
+        ("stop", np.float64),
+        ("limit", np.float64),
+        ("high", np.float64),
+        ("low", np.float64),
+    ]
+)
+
+
+class Journal:
+    """
+    Keeps the last `capacity` events. Once full, new events overwrite the
+    oldest and `dropped` counts how many were lost.
+    """
+
+    def __init__(self, capacity: int = 1 << 16) -> None:
+        self._rows = np.zeros(capacity, dtype=RECORD)
+        self._count = 0
+
+    def _append(self, *row) -> None:
+        self._rows[self._count % len(self._rows)] = row
+        self._count += 1
+
+    def range_defined(self, time: float, high: float, low: float) -> None:
+        self._append(time, Event.RANGE_DEFINED, 0, -1, *[np.nan] * 4, high, low)
+
+    def bracket_placed(
+        self,
+        time: float,
+        ref: int,
+        side: int,
+        size: float,
+        price: float,
+        stop: float,
+        limit: float,
+    ) -> None:
+        self._append(
+            time,
+            Event.BRACKET_PLACED,
+            side,
+            ref,
+            size,
+            price,
+            stop,
+            limit,
+            np.nan,
+            np.nan,
+        )
+
+    def fill(self, time: float, ref: int, side: int, size: float, price: float) -> None:
+        self._append(time, Event.FILL, side, ref, size, price, *[np.nan] * 4)
+
+    def cancel(self, time: float, ref: int, side: int) -> None:
+        self._append(time, Event.CANCEL, side, ref, *[np.nan] * 6)
+
+    def flatten(self, time: float, side: int, size: float) -> None:
+        self._append(time, Event.FLATTEN, side, -1, size, *[np.nan] * 5)
+
+    def __len__(self) -> int:
+        return min(self._count, len(self._rows))
+
+    @property
+    def capacity(self) -> int:
+        return len(self._rows)
+
+    @property
+    def dropped(self) -> int:
+        return max(self._count - len(self._rows), 0)
+
+    def records(self) -> np.ndarray:
+        """
+        The kept events, oldest first, as a structured array (a copy).
+        """
+        if self._count <= len(self._rows):
+            return self._rows[: self._count].copy()
+        start = self._count % len(self._rows)
+        return np.concatenate([self._rows[start:], self._rows[:start]])
+
+    def counts(self) -> dict[str, int]:
+        events = self.records()["event"]
+        return {event.name: int((events == event).sum()) for event in Event}
+
+    def to_dataframe(self, event: Event | None = None) -> pd.DataFrame:
+        """
+        The kept events as a table with naive UTC datetimes and event names,
+        optionally only one kind of event.
+        """
+        records = self.records()
+        if event is not None:
+            records = records[records["event"] == event]
+        frame = pd.DataFrame(records)
+        frame["time"] = pd.to_datetime(
+            np.round((records["time"] - EPOCH) * DAY), unit="s"
+        )
+        frame["event"] = [Event(e).name for e in records["event"]]
+        return frame
+
+    def save(self, path: str | Path) -> None:
+        """
+        Dumps the kept events as a `.npy` binary log, see `load`.
+        """
+        np.save(path, self.records())
+
+    def restore(self, records: np.ndarray) -> None:
+        """
+        Replaces the events with `records` as returned by `records()`, keeping
+        the newest if there are more than fit.
+        """
+        records = records[len(records) - min(len(records), len(self._rows)) :]
+        self._rows[: len(records)] = records
+        self._count = len(records)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Journal":
+        records = np.load(path)
+        journal = cls(max(len(records), 1))
+        journal.restore(records)
+        return journal
+
+
+def log_journal(journal: Journal, path: str | Path | None = None) -> None:
+    """
+    Logs how many of each event a run recorded, and saves the journal to
+    `path` if there is one.
+    """
+    counts = ", ".join(f"{n} {name.lower()}" for name, n in journal.counts().items())
+    logging.info(f"Journal: {counts}")
+    if journal.dropped:
+        logging.warning(
+            f"Journal overflowed, the oldest {journal.dropped} events were dropped"
+        )
+    if path:
+        journal.save(path)
+        logging.info(f"Journal saved to {path}")
@@ -0,0 +1,209 @@
+"""
+Content-addressed store of backtest results, so a rerun with nothing changed
+doesn't run again.
+
+A run is keyed by a hash of everything that goes into it: the source of the
+strategy, analyzer, feed and broker classes, the strategy's params, the
+broker's cash, settings and commission schemes, the sizers, and every data
+feed's params with the bytes of its candles. Change any of them and the key
+changes, so stale entries are never looked up again and just age out. What is
+stored is what the runners use afterwards: the `metrics.Recorder` arrays, the
+strategy's journal and any Parquet files exported, restored on a hit as if
+the run had just written them.
+
+Entries are single `.npz` files, written atomically so sweep workers can share
+a store, and the least recently used are evicted once the store is over
+`max_bytes`.
+
+    <root>/<key>.npz
+"""
+
+import hashlib
+import inspect
+import logging
+import os
+from datetime import date, time, timedelta, tzinfo
+from pathlib import Path
+from typing import Any
+
+import backtrader as bt
+import numpy as np
+
+from common.candles import COLUMNS, Candles
+from common.export import ParquetExport
+from common.journal import Journal
+from common.sessions import SessionCalendar
+
+DEFAULT_ROOT = Path(__file__).resolve().parent.parent / ".results"
+
+# files a ParquetExport writes
+EXPORTS = ("fills", "trades", "equity")
+
+logger = logging.getLogger("common.memo")
+
+
+def _feed(h: "hashlib._Hash", value: Any) -> None:
+    """
+    Hashes `value` by content. Raises TypeError for anything that can't be
+    (lambdas, open files...), whose runs just aren't stored.
+    """
+    h.update(type(value).__qualname__.encode())
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        h.update(repr(value).encode())
+    elif isinstance(value, (date, time, timedelta, tzinfo)):
+        h.update(repr(value).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(f"{value.dtype.str}{value.shape}".encode())
+        h.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, Candles):
+        for name in COLUMNS:
+            _feed(h, getattr(value, name))
+    elif isinstance(value, dict):
+        for key in sorted(value, key=repr):
+            _feed(h, key)
+            _feed(h, value[key])
+    elif isinstance(value, (list, tuple)):
+        h.update(str(len(value)).encode())
+        for item in value:
+            _feed(h, item)
+    elif isinstance(value, type):
+        h.update(f"{value.__module__}.{value.__qualname__}".encode())
+        try:
+            h.update(inspect.getsource(value).encode())
+        except (OSError, TypeError):
+            pass  # built in, nothing to change between runs
+    elif isinstance(value, SessionCalendar):
+        # the flags are all strategies read, and hashing the array is much
+        # faster than the list of them
+        _feed(h, value.flags)
+    elif isinstance(value, Journal):
+        # an output, only its size matters
+        h.update(str(value.capacity).encode())
+    elif hasattr(value, "p") and hasattr(value.p, "_getkwargs"):
+        _feed(h, dict(value.p._getkwargs()))
+    elif hasattr(value, "__dict__") and not callable(value):
+        _feed(h, vars(value))
+    else:
+        raise TypeError(f"Can't fingerprint {type(value).__qualname__}")
+
+
+def fingerprint(*values: Any) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    for value in values:
+        _feed(h, value)
+    return h.hexdigest()
+
+
+def run_key(cerebro: bt.Cerebro) -> str | None:
+    """
+    Key of what `cerebro` would produce, or None if something in it can't be
+    fingerprinted.
+    """
+    broker = cerebro.broker
+    try:
+        return fingerprint(
+            [[(cls, args, kwargs) for cls, args, kwargs in s] for s in cerebro.strats],
+            [
+                # where exports go doesn't change what's in them
+                (cls, args, {k: v for k, v in kwargs.items() if k != "directory"})
+                for cls, args, kwargs in cerebro.analyzers
+            ],
+            cerebro.sizers,
+            type(broker),
+            dict(broker.p._getkwargs(), commission=None),
+            broker.comminfo,
+            [(type(data), data) for data in cerebro.datas],
+            dict(cerebro.p._getkwargs()),
+        )
+    except TypeError as e:
+        logger.debug(f"Not storing the run: {e}")
+        return None
+
+
+class ResultStore:
+    def __init__(
+        self, root: str | os.PathLike | None = None, max_bytes: int = 1 << 30
+    ) -> None:
+        self.root = Path(root or os.getenv("RESULT_STORE_DIR") or DEFAULT_ROOT)
+        self.max_bytes = max_bytes
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.npz"
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        path = self.path(key)
+        try:
+            with np.load(path) as entry:
+                result = {name: entry[name] for name in entry.files}
+        except (OSError, ValueError):
+            return None
+        # recently used, as far as eviction goes
+        os.utime(path)
+        return result
+
+    def put(self, key: str, result: dict[str, np.ndarray]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp, **result)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used entries until the store fits in
+        `max_bytes`.
+        """
+        entries = []
+        for path in self.root.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def run(self, cerebro: bt.Cerebro, fresh: bool = False) -> tuple[dict, bool]:
+        """
+        Runs `cerebro` (one strategy, with a metrics.Recorder named "metrics")
+        unless the store already has its result, or `fresh` is set. Returns
+        the Recorder's analysis and whether it came from the store. On a hit
+        the strategy's journal and any Parquet exports are filled in from the
+        store instead.
+        """
+        key = run_key(cerebro)
+        result = None if key is None or fresh else self.get(key)
+        exports = [
+            Path(kwargs.get("directory", cls.params.directory))
+            for cls, _, kwargs in cerebro.analyzers
+            if issubclass(cls, ParquetExport)
+        ]
+        journal = cerebro.strats[0][0][2].get("journal")
+
+        if result is not None:
+            for i, directory in enumerate(exports):
+                directory.mkdir(parents=True, exist_ok=True)
+                for name in EXPORTS:
+                    data = result.pop(f"export{i}_{name}")
+                    (directory / f"{name}.parquet").write_bytes(data.tobytes())
+            if journal is not None:
+                journal.restore(result.pop("journal"))
+            return result, True
+
+        strategy = cerebro.run()[0]
+        result = dict(strategy.analyzers.metrics.get_analysis())
+        if key is not None:
+            stored = dict(result)
+            if journal is not None:
+                stored["journal"] = journal.records()
+            for i, directory in enumerate(exports):
+                for name in EXPORTS:
+                    data = (directory / f"{name}.parquet").read_bytes()
+                    stored[f"export{i}_{name}"] = np.frombuffer(data, dtype=np.uint8)
+            self.put(key, stored)
+        return result, False
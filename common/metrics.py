@@ -0,0 +1,184 @@
+"""
+Performance statistics from compact trade and equity arrays.
+
+backtrader's SharpeRatio, DrawDown and TradeAnalyzer each keep nested
+AutoOrderedDicts up to date on every bar and trade. `Recorder` only appends
+the portfolio value each bar and four numbers per closed trade to flat
+arrays, and `compute` works the statistics out from those with NumPy once the
+run is over, cheaply enough to do for every combination of a sweep.
+
+Sharpe and Sortino are annualised from daily (UTC) returns with no risk-free
+rate, which is steadier than backtrader's default of yearly returns over a
+couple of years of data.
+"""
+
+import math
+from array import array
+
+import backtrader as bt
+import numpy as np
+
+from common.candles import DAY
+from common.feeds import EPOCH
+
+TRADING_DAYS = 252
+
+
+class Recorder(bt.Analyzer):
+    """
+    Records the portfolio value at every bar and the open/close time, length
+    in bars and net PnL of every closed trade. `get_analysis()` returns them
+    as arrays, times in epoch seconds, ready for `compute(**...)`.
+    """
+
+    def start(self):
+        self._times = array("d")
+        self._values = array("d")
+        self._opened = array("d")
+        self._closed = array("d")
+        self._bars = array("q")
+        self._pnl = array("d")
+
+    def next(self):
+        self._times.append(self.strategy.datetime[0])
+        self._values.append(self.strategy.broker.getvalue())
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self._opened.append(trade.dtopen)
+            self._closed.append(trade.dtclose)
+            self._bars.append(trade.barlen)
+            self._pnl.append(trade.pnlcomm)
+
+    def get_analysis(self) -> dict[str, np.ndarray]:
+        def seconds(nums):
+            return np.round((np.frombuffer(nums) - EPOCH) * DAY).astype(np.int64)
+
+        return dict(
+            times=seconds(self._times),
+            equity=np.frombuffer(self._values).copy(),
+            opened=seconds(self._opened),
+            closed=seconds(self._closed),
+            bars=np.frombuffer(self._bars, dtype=np.int64).copy(),
+            pnl=np.frombuffer(self._pnl).copy(),
+        )
+
+
+def daily_equity(
+    times: np.ndarray, equity: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    UTC day numbers and the last equity value of each.
+    """
+    if len(equity) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    days = times // DAY
+    last = np.flatnonzero(np.diff(days, append=days[-1] + 1))
+    return days[last], equity[last]
+
+
+def daily_returns(times: np.ndarray, equity: np.ndarray) -> np.ndarray:
+    """
+    Returns between the last value of each UTC day, starting from the first
+    value overall.
+    """
+    if len(equity) < 2:
+        return np.empty(0)
+    closes = np.concatenate([equity[:1], daily_equity(times, equity)[1]])
+    return closes[1:] / closes[:-1] - 1
+
+
+def sharpe(returns: np.ndarray, periods: int = TRADING_DAYS) -> float | None:
+    if len(returns) < 2:
+        return None
+    std = returns.std(ddof=1)
+    return float(returns.mean() / std * math.sqrt(periods)) if std > 0 else None
+
+
+def sortino(returns: np.ndarray, periods: int = TRADING_DAYS) -> float | None:
+    if len(returns) < 2:
+        return None
+    downside = math.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+    return float(returns.mean() / downside * math.sqrt(periods)) if downside else None
+
+
+def drawdown(times: np.ndarray, equity: np.ndarray) -> tuple[float, float]:
+    """
+    Deepest drawdown in percent and the longest time in days spent below a
+    previous peak.
+    """
+    if len(equity) == 0:
+        return 0.0, 0.0
+    peaks = np.maximum.accumulate(equity)
+    depth = (1 - equity / peaks).max() * 100
+    # time of the latest peak at every bar
+    at_peak = np.where(equity >= peaks, np.arange(len(equity)), 0)
+    since = times - times[np.maximum.accumulate(at_peak)]
+    return float(depth), float(since.max() / DAY)
+
+
+def profit_factor(pnl: np.ndarray) -> float | None:
+    """
+    Gross profit over gross loss, inf if nothing lost.
+    """
+    profit = pnl[pnl > 0].sum()
+    loss = -pnl[pnl < 0].sum()
+    if loss:
+        return float(profit / loss)
+    return math.inf if profit else None
+
+
+def time_in_market(
+    opened: np.ndarray, closed: np.ndarray, start: int, end: int
+) -> float:
+    """
+    Percentage of [start, end] with a trade open, overlapping trades counted
+    once.
+    """
+    if len(opened) == 0 or end <= start:
+        return 0.0
+    order = np.argsort(opened, kind="stable")
+    opened, closed = opened[order], closed[order]
+    # whatever an earlier trade already covered doesn't count again
+    covered = np.concatenate([[opened[0]], np.maximum.accumulate(closed)[:-1]])
+    held = np.clip(closed - np.maximum(opened, covered), 0, None).sum()
+    return float(held / (end - start) * 100)
+
+
+def compute(
+    times: np.ndarray,
+    equity: np.ndarray,
+    opened: np.ndarray,
+    closed: np.ndarray,
+    bars: np.ndarray,
+    pnl: np.ndarray,
+) -> dict:
+    """
+    The full set of statistics. Break-even trades count as won, as they do in
+    backtrader's TradeAnalyzer.
+    """
+    returns = daily_returns(times, equity)
+    max_drawdown, max_drawdown_days = drawdown(times, equity)
+    won = int((pnl >= 0).sum())
+    return dict(
+        final_value=float(equity[-1]) if len(equity) else None,
+        sharpe=sharpe(returns),
+        sortino=sortino(returns),
+        max_drawdown=max_drawdown,
+        max_drawdown_days=max_drawdown_days,
+        trades=len(pnl),
+        won=won,
+        lost=len(pnl) - won,
+        win_rate=won / len(pnl) * 100 if len(pnl) else None,
+        net_pnl=float(pnl.sum()),
+        profit_factor=profit_factor(pnl),
+        expectancy=float(pnl.mean()) if len(pnl) else None,
+        time_in_market=(
+            time_in_market(opened, closed, int(times[0]), int(times[-1]))
+            if len(times)
+            else 0.0
+        ),
+        avg_bars=float(bars.mean()) if len(bars) else 0.0,
+        max_bars=int(bars.max()) if len(bars) else 0,
+        min_bars=int(bars.min()) if len(bars) else 0,
+    )
@@ -0,0 +1,168 @@
+"""
+Several strategies in one backtrader pass, each as if it ran on its own.
+
+Loading and preloading the bars is a good part of a run, and each script used
+to pay for it separately even when they all trade the same instrument. Here
+the feeds are added to one cerebro once and every strategy is attached to one
+of them:
+
+    shared = SharedRun()
+    m15 = shared.add_feed(m15_candles, timeframe=TimeFrame.Minutes, compression=15)
+    m1 = shared.add_feed(m1_candles, timeframe=TimeFrame.Minutes, compression=1)
+    shared.add("orb", ORBStrategy, m15, open_time=time(9, 30))
+    shared.add("pdr", PriorDayReversal, m1, setup=configure_broker, levels=levels)
+    strategies = shared.run()
+
+backtrader calls every strategy on every bar of every feed and has a single
+broker, so each strategy is wrapped to only see its own feed (as datas[0],
+the only one) and only be called when that feed has a new bar, and gets a
+BackBroker of its own that `SharedBroker` steps on the same bars. Cash,
+positions, orders, sizers and analyzers are therefore all per strategy, and
+the results match a run of that strategy alone.
+"""
+
+import backtrader as bt
+
+from common.candles import Candles
+from common.feeds import CandlesData
+
+
+class SharedBroker(bt.brokers.BackBroker):
+    """
+    Cerebro's broker for a shared run. It doesn't trade itself, it steps the
+    broker of every strategy when the strategy's feed has a new bar and hands
+    their notifications to cerebro, which routes them by owner.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.members: list[tuple[bt.brokers.BackBroker, bt.LineBuffer]] = []
+        self._seen: list[int] = []
+
+    def join(self, broker: bt.brokers.BackBroker, feed: bt.AbstractDataBase) -> None:
+        # the datetime buffer's length is the feed's, without two levels of
+        # LineSeries in between
+        self.members.append((broker, feed.lines.datetime))
+        self._seen.append(0)
+
+    def start(self):
+        super().start()
+        for broker, _ in self.members:
+            broker.start()
+        self._seen = [0] * len(self.members)
+
+    def stop(self):
+        for broker, _ in self.members:
+            broker.stop()
+        super().stop()
+
+    def next(self):
+        for i, (broker, clock) in enumerate(self.members):
+            bars = len(clock)
+            if bars != self._seen[i]:
+                self._seen[i] = bars
+                broker.next()
+
+    def get_notification(self):
+        for broker, _ in self.members:
+            order = broker.get_notification()
+            if order is not None:
+                return order
+        return None
+
+    def getvalue(self, datas=None):
+        return sum(broker.getvalue(datas) for broker, _ in self.members)
+
+    def getcash(self):
+        return sum(broker.getcash() for broker, _ in self.members)
+
+
+def isolated(
+    strategy: type[bt.Strategy], feed: int, broker: bt.brokers.BackBroker
+) -> type[bt.Strategy]:
+    """
+    `strategy` trading through `broker` on the cerebro's feed number `feed`
+    alone. Strategies have to reach their data through `datas[0]`/`data`
+    (or the default of buy/sell), the `dataN` aliases still point at
+    cerebro's order.
+    """
+
+    class Isolated(strategy):
+        def __init__(self, *args, **kwargs):
+            data = self.datas[feed]
+            self.datas = [data]
+            self.data = self.data0 = self._clock = data
+            self.broker = broker
+            self._feed_clock = data.lines.datetime
+            self._bars = 0
+            super().__init__(*args, **kwargs)
+
+        def _oncepost(self, dt):
+            bars = len(self._feed_clock)
+            if bars == self._bars:
+                return
+            self._bars = bars
+            super()._oncepost(dt)
+
+        def _next(self):
+            bars = len(self._feed_clock)
+            if bars == self._bars:
+                return
+            self._bars = bars
+            super()._next()
+
+    Isolated.__name__ = Isolated.__qualname__ = strategy.__name__
+    return Isolated
+
+
+class SharedRun:
+    """
+    One cerebro with a `SharedBroker`. Analyzers added to `cerebro` are given
+    to every strategy, each getting its own instances.
+    """
+
+    def __init__(self, **cerebro_kwargs) -> None:
+        self.cerebro = bt.Cerebro(stdstats=False, **cerebro_kwargs)
+        self.broker = SharedBroker()
+        self.cerebro.broker = self.broker
+        self.names: list[str] = []
+
+    def add_feed(self, candles: Candles, **data_kwargs) -> int:
+        """
+        Adds `candles` as a feed, returning its number for `add`.
+        """
+        self.cerebro.adddata(CandlesData(dataname=candles, **data_kwargs))
+        return len(self.cerebro.datas) - 1
+
+    def add(
+        self,
+        name: str,
+        strategy: type[bt.Strategy],
+        feed: int,
+        cash: float = 100000.0,
+        setup=None,
+        sizer: tuple | None = None,
+        **params,
+    ) -> bt.brokers.BackBroker:
+        """
+        Adds `strategy` on feed number `feed` with a broker of its own holding
+        `cash`, which `setup(broker)` can configure further (commission
+        schemes, slippage...). `sizer` is a (class, kwargs) pair.
+        """
+        broker = bt.brokers.BackBroker()
+        broker.setcash(cash)
+        if setup is not None:
+            setup(broker)
+        self.broker.join(broker, self.cerebro.datas[feed])
+        self.cerebro.addstrategy(isolated(strategy, feed, broker), **params)
+        if sizer is not None:
+            sizer_cls, sizer_kwargs = sizer
+            self.cerebro.addsizer_byidx(len(self.names), sizer_cls, **sizer_kwargs)
+        self.names.append(name)
+        return broker
+
+    def run(self) -> dict[str, bt.Strategy]:
+        """
+        Runs every strategy in one pass, by name.
+        """
+        return dict(zip(self.names, self.cerebro.run()))
@@ -0,0 +1,240 @@
+"""
+Helpers around the v20 bindings that every script ends up needing.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+
+import v20
+from v20.errors import V20ConnectionError, V20Timeout
+
+from common.candles import Candles
+
+PRACTICE_HOSTNAME = "api-fxpractice.oanda.com"
+PRACTICE_STREAM_HOSTNAME = "stream-fxpractice.oanda.com"
+
+# /v3/instruments/{instrument}/candles refuses to return more than this per request
+MAX_CANDLES = 5000
+
+GRANULARITY_SECONDS = {
+    "S5": 5,
+    "S10": 10,
+    "S15": 15,
+    "S30": 30,
+    "M1": 60,
+    "M2": 2 * 60,
+    "M4": 4 * 60,
+    "M5": 5 * 60,
+    "M10": 10 * 60,
+    "M15": 15 * 60,
+    "M30": 30 * 60,
+    "H1": 60 * 60,
+    "H2": 2 * 60 * 60,
+    "H3": 3 * 60 * 60,
+    "H4": 4 * 60 * 60,
+    "H6": 6 * 60 * 60,
+    "H8": 8 * 60 * 60,
+    "H12": 12 * 60 * 60,
+    "D": 24 * 60 * 60,
+    "W": 7 * 24 * 60 * 60,
+}
+
+
+class FetchError(Exception):
+    """
+    Raised when OANDA refuses a candle request.
+    """
+
+
+def endpoint(stream: bool = False) -> tuple[str, int, bool]:
+    """
+    (hostname, port, ssl) of the practice REST or streaming API, unless
+    OANDA_HOSTNAME (OANDA_STREAM_HOSTNAME for the stream, falling back on
+    OANDA_HOSTNAME), OANDA_PORT and OANDA_SSL=0 point it somewhere else, such
+    as bench/standin.py.
+    """
+    hostname = os.getenv("OANDA_HOSTNAME")
+    if stream:
+        hostname = os.getenv("OANDA_STREAM_HOSTNAME") or hostname
+    return (
+        hostname or (PRACTICE_STREAM_HOSTNAME if stream else PRACTICE_HOSTNAME),
+        int(os.getenv("OANDA_PORT") or 443),
+        os.getenv("OANDA_SSL", "1").lower() not in ("0", "false", "no"),
+    )
+
+
+def connect(token: str | None = None) -> v20.Context:
+    """
+    A context for the REST API at `endpoint()`.
+    """
+    hostname, port, ssl = endpoint()
+    return v20.Context(
+        hostname,
+        port=port,
+        ssl=ssl,
+        token=token if token is not None else os.getenv("OANDA_API_KEY"),
+    )
+
+
+def to_epoch(dt: datetime | int) -> int:
+    """
+    Epoch seconds for `dt`. Naive datetimes are taken to be UTC.
+    """
+    if isinstance(dt, datetime):
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
+    return int(dt)
+
+
+def rfc3339(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class RateLimiter:
+    """
+    Spaces calls to `wait` at least `1 / rate` seconds apart, across threads.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class Failure(NamedTuple):
+    start: int
+    end: int
+    error: str
+
+
+def plan_requests(
+    ranges: list[tuple[int, int]], granularity: str
+) -> list[tuple[int, int]]:
+    """
+    Packs [start, end) ranges into as few requests as the per-request candle
+    limit allows. Neighbouring ranges are merged even if that means
+    re-downloading the hours between them, since a round-trip costs far more
+    than a few extra candles.
+    """
+    step = GRANULARITY_SECONDS[granularity] * MAX_CANDLES
+    requests: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if requests and end - requests[-1][0] <= step:
+            requests[-1] = (requests[-1][0], max(requests[-1][1], end))
+            continue
+        for chunk_start in range(start, end, step):
+            requests.append((chunk_start, min(chunk_start + step, end)))
+    return requests
+
+
+def fetch_chunk(
+    ctx: v20.Context,
+    instrument: str,
+    granularity: str,
+    price: str,
+    start: int,
+    end: int,
+    limiter: RateLimiter | None = None,
+    retries: int = 3,
+    backoff: float = 0.5,
+) -> Candles:
+    """
+    One candles request, retried with exponential backoff on throttling,
+    server errors and connection trouble. Raises FetchError once out of retries.
+    """
+    error = ""
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        try:
+            response = ctx.instrument.candles(
+                instrument,
+                price=price,
+                granularity=granularity,
+                fromTime=rfc3339(start),
+                toTime=rfc3339(end),
+            )
+        except (V20ConnectionError, V20Timeout) as e:
+            error = str(e)
+        else:
+            if response.status == 200:
+                return Candles.from_v20(response.body.get("candles", []), price)
+            error = (
+                f"{response.status} "
+                f"{(response.body or {}).get('errorMessage', response.reason)}"
+            )
+            # anything else in the 4xx range won't get better by asking again
+            if response.status != 429 and response.status < 500:
+                break
+        if attempt < retries:
+            time.sleep(backoff * 2**attempt * (1 + random.random()))
+    raise FetchError(
+        f"{instrument} {granularity} {rfc3339(start)}..{rfc3339(end)}: {error}"
+    )
+
+
+def fetch_ranges(
+    connect_fn: Callable[[], v20.Context],
+    instrument: str,
+    granularity: str,
+    price: str,
+    ranges: list[tuple[int, int]],
+    workers: int = 4,
+    rate: float = 20.0,
+    retries: int = 3,
+    backoff: float = 0.5,
+) -> tuple[list[tuple[int, int, Candles]], list[Failure]]:
+    """
+    Fetches `ranges` through a bounded thread pool, sharing one rate limit.
+
+    `connect_fn` is called once per worker thread since a v20 context wraps a
+    requests session, which isn't safe to share between threads.
+
+    Returns the (start, end, candles) of every request that succeeded and a
+    Failure for every one that didn't.
+    """
+    limiter = RateLimiter(rate)
+    local = threading.local()
+
+    def work(chunk: tuple[int, int]) -> Candles:
+        if not hasattr(local, "ctx"):
+            local.ctx = connect_fn()
+        return fetch_chunk(
+            local.ctx,
+            instrument,
+            granularity,
+            price,
+            *chunk,
+            limiter=limiter,
+            retries=retries,
+            backoff=backoff,
+        )
+
+    fetched = []
+    failures = []
+    chunks = plan_requests(ranges, granularity)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            start, end = futures[future]
+            try:
+                fetched.append((start, end, future.result()))
+            except FetchError as e:
+                failures.append(Failure(start, end, str(e)))
+    fetched.sort(key=lambda f: f[0])
+    failures.sort()
+    return fetched, failures
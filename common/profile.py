@@ -0,0 +1,229 @@
+"""
+Where a run's time goes, phase by phase and callback by callback.
+
+cProfile sees every call backtrader makes and slows a run down several times
+over, so its numbers mostly measure itself. `Profiler` only times what it's
+told to: named phases (`with profiler.phase("load")`) and the callables it
+patches, which for a cerebro are the strategy's and analyzers' callbacks, the
+broker's order matching and the feeds' loading. Timers nest, so whatever a
+phase spends outside the timed callables shows up as its own (self) time; for
+`cerebro.run` that is backtrader synchronising the feeds and driving the
+lines.
+
+The breakdown is logged as a tree with bars per second, and the same tree can
+be saved as folded stacks (one `a;b;c <microseconds>` line per node, self
+time) for flamegraph.pl or speedscope.
+
+A disabled profiler patches nothing, so leaving the calls in costs nothing.
+"""
+
+import logging
+import threading
+import time as clock
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import backtrader as bt
+
+from common import cache
+
+logger = logging.getLogger("common.profile")
+
+# callbacks worth timing on strategies and analyzers, where they have them
+STRATEGY_CALLBACKS = ("prenext", "nextstart", "next", "notify_order", "notify_trade")
+ANALYZER_CALLBACKS = ("next", "notify_order", "notify_trade", "notify_cashvalue")
+
+_missing = object()
+
+
+class Node:
+    """
+    One timer in the tree, reached by the names of the timers it ran inside.
+    """
+
+    name: str
+    calls: int
+    total: int  # nanoseconds
+    children: dict[str, "Node"]
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.total = 0
+        self.children = {}
+
+    @property
+    def own(self) -> int:
+        """
+        Nanoseconds not spent in any child
+        """
+        return self.total - sum(child.total for child in self.children.values())
+
+    def walk(self, path: tuple[str, ...] = ()) -> Iterator[tuple[tuple, "Node"]]:
+        for child in self.children.values():
+            yield path + (child.name,), child
+            yield from child.walk(path + (child.name,))
+
+
+class Profiler:
+    """
+    Nested wall-clock timers on the thread that created the profiler. Calls
+    from other threads (such as the candle fetch pool) run untimed, their time
+    lands on whatever the main thread was waiting in.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.root = Node("")
+        self._current = self.root
+        self._thread = threading.get_ident()
+        self._patched: list[tuple[Any, str, Any]] = []
+
+    def _enter(self, name: str) -> tuple[Node, Node]:
+        parent = self._current
+        node = parent.children.get(name)
+        if node is None:
+            node = parent.children[name] = Node(name)
+        self._current = node
+        return parent, node
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        parent, node = self._enter(name)
+        started = clock.perf_counter_ns()
+        try:
+            yield
+        finally:
+            node.total += clock.perf_counter_ns() - started
+            node.calls += 1
+            self._current = parent
+
+    def timed(self, fn: Callable, name: str) -> Callable:
+        """
+        `fn`, timed as `name` under whichever timer is running when it's
+        called.
+        """
+        thread, perf_counter_ns, get_ident = (
+            self._thread,
+            clock.perf_counter_ns,
+            threading.get_ident,
+        )
+
+        def wrapper(*args, **kwargs):
+            if get_ident() != thread:
+                return fn(*args, **kwargs)
+            parent, node = self._enter(name)
+            started = perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                node.total += perf_counter_ns() - started
+                node.calls += 1
+                self._current = parent
+
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    def patch(self, owner: Any, attribute: str, name: str | None = None) -> None:
+        """
+        Replaces `owner.attribute` (a class, instance or module) with a timed
+        version until `restore()`.
+        """
+        if not self.enabled:
+            return
+        original = vars(owner).get(attribute, _missing)
+        fn = getattr(owner, attribute)
+        label = getattr(owner, "__name__", type(owner).__name__)
+        setattr(owner, attribute, self.timed(fn, name or f"{label}.{attribute}"))
+        self._patched.append((owner, attribute, original))
+
+    def restore(self) -> None:
+        """
+        Puts back everything `patch` replaced.
+        """
+        for owner, attribute, original in reversed(self._patched):
+            if original is _missing:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, original)
+        self._patched.clear()
+
+    def instrument(self, cerebro: bt.Cerebro) -> None:
+        """
+        Times `cerebro.run` and, inside it, the strategies' and analyzers'
+        callbacks, the broker's `next` (where orders are matched) and every
+        feed's preload and bar loading.
+        """
+        if not self.enabled:
+            return
+        self.patch(cerebro, "run", "cerebro.run")
+        for strategy, _, _ in (entry for s in cerebro.strats for entry in s):
+            for callback in STRATEGY_CALLBACKS:
+                if getattr(strategy, callback) is not getattr(bt.Strategy, callback):
+                    self.patch(strategy, callback)
+        for analyzer, _, _ in cerebro.analyzers:
+            for callback in ANALYZER_CALLBACKS:
+                if getattr(analyzer, callback) is not getattr(bt.Analyzer, callback):
+                    self.patch(analyzer, callback)
+        self.patch(cerebro.broker, "next", "broker.next")
+        for data in cerebro.datas:
+            self.patch(data, "preload", "data.preload")
+            self.patch(data, "_load", "data._load")
+
+    def instrument_fetch(self) -> None:
+        """
+        Times the candle cache's downloads ("fetch"), reads and writes.
+        """
+        self.patch(cache, "fetch_ranges", "fetch")
+        self.patch(cache.CandleCache, "read")
+        self.patch(cache.CandleCache, "_write")
+
+    def folded(self) -> str:
+        """
+        The tree as folded stacks, self time in microseconds.
+        """
+        return "".join(
+            f"{';'.join(path)} {node.own // 1000}\n"
+            for path, node in self.root.walk()
+            if node.own >= 1000
+        )
+
+    def report(
+        self, path: str | Path | None = None, bars: int = 0, over: str = "run"
+    ) -> None:
+        """
+        Logs the breakdown and `bars` per second of the top-level phase
+        `over`, saves the folded stacks to `path` if there is one, and
+        restores everything that was patched.
+        """
+        self.restore()
+        if not self.enabled:
+            return
+        total = sum(node.total for node in self.root.children.values()) or 1
+        lines = [
+            f"{'phase':<48} {'calls':>10} {'total ms':>10} {'self ms':>10} {'%':>6}"
+        ]
+        for names, node in self.root.walk():
+            lines.append(
+                f"{'  ' * (len(names) - 1) + node.name:<48} {node.calls:>10} "
+                f"{node.total / 1e6:>10.1f} {node.own / 1e6:>10.1f} "
+                f"{node.total / total * 100:>6.1f}"
+            )
+        logger.info("Profile:\n%s", "\n".join(lines))
+
+        phase = self.root.children.get(over)
+        if bars and phase is not None and phase.total:
+            logger.info(
+                "%i bars in %.2fs of %s, %.0f bars/s",
+                bars,
+                phase.total / 1e9,
+                over,
+                bars / (phase.total / 1e9),
+            )
+        if path:
+            Path(path).write_text(self.folded())
+            logger.info("Folded stacks saved to %s", path)
@@ -0,0 +1,104 @@
+"""
+Higher timeframes built from the lowest one fetched, so an instrument only has
+to be downloaded once.
+
+Bars are bucketed on local wall-clock time in a time zone, anchored at a time
+of day, so an H4 or daily bar starts at the same local time all year round
+(17:00 New York for OANDA's daily candles) whichever side of a DST change it
+falls on. The whole history is bucketed at once and each OHLCV column is
+reduced with `ufunc.reduceat` over the runs of bars sharing a bucket.
+
+    resampler = Resampler(minute, NEW_YORK)
+    m15 = resampler.bars(15 * 60)
+    daily = resampler.bars(DAY, anchor=time(17, 0))
+    onr = resampler.window(time(0, 0), time(6, 0))
+"""
+
+from datetime import time, timezone, tzinfo
+
+import numpy as np
+
+from common.candles import DAY, Candles, local_times, to_seconds
+
+
+def aggregate(candles: Candles, keys: np.ndarray) -> tuple[Candles, np.ndarray]:
+    """
+    One bar per run of equal consecutive `keys`, and the index of each run's
+    first bar in `candles`. Times are the first bar's.
+    """
+    if len(candles) == 0:
+        return Candles.empty(), np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.diff(keys, prepend=keys[:1] - 1))
+    stops = np.append(starts[1:], len(candles))
+    return (
+        Candles(
+            candles.time[starts],
+            candles.open[starts],
+            np.maximum.reduceat(candles.high, starts),
+            np.minimum.reduceat(candles.low, starts),
+            candles.close[stops - 1],
+            np.add.reduceat(candles.volume, starts),
+        ),
+        starts,
+    )
+
+
+class Resampler:
+    """
+    Resamples one set of (sorted, lower timeframe) candles into others, with
+    the local times in `tz` worked out once and shared.
+    """
+
+    candles: Candles
+    tz: tzinfo
+
+    """
+    Wall-clock time of every bar in `tz`, as from `local_times`
+    """
+    local: np.ndarray
+
+    def __init__(self, candles: Candles, tz: tzinfo = timezone.utc) -> None:
+        self.candles = candles
+        self.tz = tz
+        self.local = local_times(candles.time, tz)
+
+    def bars(self, seconds: int, anchor: time = time(0)) -> Candles:
+        """
+        `seconds`-long bars on a local grid through `anchor`, e.g. DAY with
+        17:00 for OANDA-style daily candles. Buckets without any bars are left
+        out rather than filled. When clocks go back, buckets the repeated hour
+        covers whole (an hour or shorter) are kept as separate bars for each
+        pass, longer ones just run long, like OANDA's 25 hour daily candle.
+        """
+        shifted = self.local - to_seconds(anchor)
+        # the repeat is as long as the drop in UTC offset, so a run of equal
+        # buckets is broken there when a whole bucket fits in it
+        offsets = self.local - self.candles.time
+        back = -np.diff(offsets, prepend=offsets[:1])
+        repeats = np.cumsum(back >= seconds) % 2
+        bars, starts = aggregate(self.candles, shifted // seconds * 2 + repeats)
+        # back from the first bar to the start of its bucket
+        bars.time = bars.time - shifted[starts] % seconds
+        return bars
+
+    def window(self, start: time, end: time) -> Candles:
+        """
+        One bar per day covering the local times [start, end), such as the
+        00:00-06:00 overnight range. A window with `end` at or before `start`
+        runs past midnight, and its bar belongs to the day it starts on.
+        """
+        length = (to_seconds(end) - to_seconds(start)) % DAY or DAY
+        shifted = self.local - to_seconds(start)
+        inside = np.flatnonzero(shifted % DAY < length)
+        bars, starts = aggregate(self.candles[inside], shifted[inside] // DAY)
+        bars.time = bars.time - shifted[inside[starts]] % DAY
+        return bars
+
+
+def resample(
+    candles: Candles, seconds: int, tz: tzinfo = timezone.utc, anchor: time = time(0)
+) -> Candles:
+    """
+    `Resampler(candles, tz).bars(seconds, anchor)` for a one-off.
+    """
+    return Resampler(candles, tz).bars(seconds, anchor)
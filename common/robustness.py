@@ -0,0 +1,155 @@
+"""
+Monte Carlo robustness of a trade list.
+
+One backtest is one ordering of one sample of trades. Here the trades are
+resampled with replacement ("bootstrap") or reshuffled ("shuffle") into many
+alternative sequences, to see how much of the result was luck of the draw.
+Paths are simulated a chunk at a time, walking the trades in step across the
+whole chunk with its running equity, peak and drawdown held as vectors.
+
+Trades are compounded as returns on the equity they were taken with, so
+position sizing that scales with the account carries over. Shuffling keeps
+the same trades and so the same terminal equity; only the path (and so the
+drawdown) changes. Bootstrapping changes both.
+"""
+
+import logging
+import sys
+
+import numpy as np
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+# paths simulated together: their running equity, peak and drawdown stay in
+# cache while the draws for them are walked trade by trade
+CHUNK = 8192
+
+# which half of a 64-bit shuffle key, viewed as two uint32, holds which bits
+HIGH, LOW = (1, 0) if sys.byteorder == "little" else (0, 1)
+
+
+def trade_returns(pnl: np.ndarray, cash: float) -> np.ndarray:
+    """
+    Each trade's PnL as a fraction of the equity before it, assuming the
+    equity only moves when trades close.
+    """
+    before = cash + np.concatenate([[0.0], np.cumsum(pnl)[:-1]])
+    return pnl / before
+
+
+def _index(trades: int) -> type:
+    return np.uint16 if trades <= np.iinfo(np.uint16).max else np.int32
+
+
+def _bootstrap(rng: np.random.Generator, trades: int, n: int) -> np.ndarray:
+    """
+    (trades, n) trade numbers drawn with replacement, one column per path.
+    """
+    return rng.integers(0, trades, (trades, n), dtype=_index(trades))
+
+
+def _permutations(rng: np.random.Generator, trades: int, n: int) -> np.ndarray:
+    """
+    (n, trades) permutations of the trade numbers. Each path sorts 64-bit
+    keys of 32 random bits over the trade number, so the sorted keys' low
+    halves are the permutation itself, no argsort needed.
+    """
+    keys = np.empty((n, trades), dtype=np.uint64)
+    halves = keys.view(np.uint32).reshape(n, trades, 2)
+    words = rng.bit_generator.random_raw((n * trades + 1) // 2).view(np.uint32)
+    halves[..., HIGH] = words[: n * trades].reshape(n, trades)
+    halves[..., LOW] = np.arange(trades, dtype=np.uint32)
+    keys.sort(axis=1)
+    # trades that drew the same random bits would stay in their original
+    # order, so those (rare) paths are drawn again to keep every ordering
+    # equally likely
+    random = halves[..., HIGH]
+    tied = (random[:, 1:] == random[:, :-1]).any(axis=1)
+    permutations = halves[..., LOW]
+    if tied.any():
+        permutations[tied] = _permutations(rng, trades, int(tied.sum()))
+    return permutations
+
+
+def _shuffle(rng: np.random.Generator, trades: int, n: int) -> np.ndarray:
+    """
+    (trades, n) permutations of the trade numbers, one column per path.
+    """
+    return np.ascontiguousarray(_permutations(rng, trades, n).astype(_index(trades)).T)
+
+
+def monte_carlo(
+    pnl: np.ndarray,
+    cash: float,
+    paths: int = 100_000,
+    method: str = "bootstrap",
+    ruin: float = 0.5,
+    seed: int | None = None,
+) -> dict:
+    """
+    Drawdown and terminal equity percentiles over `paths` resampled trade
+    sequences, plus the probability of losing `ruin` (a fraction) of the
+    starting equity at some point along the way.
+    """
+    if method not in ("bootstrap", "shuffle"):
+        raise ValueError(f"Unknown method {method!r}")
+    returns = trade_returns(np.asarray(pnl, dtype=np.float64), cash)
+    if len(returns) == 0:
+        return dict(paths=0, method=method, ruin_probability=None)
+
+    rng = np.random.default_rng(seed)
+    # float32 halves the memory traffic and is plenty for summing log returns
+    growth = np.log1p(returns).astype(np.float32)
+    trades = len(growth)
+    max_drawdown = np.empty(paths, dtype=np.float32)
+    terminal = np.empty(paths, dtype=np.float32)
+    ruined = 0
+    for start in range(0, paths, CHUNK):
+        n = min(CHUNK, paths - start)
+        draws = (_bootstrap if method == "bootstrap" else _shuffle)(rng, trades, n)
+        # log equity relative to the start, with the start itself as a peak
+        curve = np.zeros(n, dtype=np.float32)
+        peak = np.zeros(n, dtype=np.float32)
+        drawdown = np.zeros(n, dtype=np.float32)
+        low = np.zeros(n, dtype=np.float32)
+        step = np.empty(n, dtype=np.float32)
+        for row in draws:
+            np.take(growth, row, out=step)
+            np.add(curve, step, out=curve)
+            np.maximum(peak, curve, out=peak)
+            np.subtract(curve, peak, out=step)
+            np.minimum(drawdown, step, out=drawdown)
+            np.minimum(low, curve, out=low)
+        max_drawdown[start : start + n] = -np.expm1(drawdown)
+        terminal[start : start + n] = curve
+        ruined += int((low <= np.log1p(-ruin)).sum())
+
+    if method == "shuffle":
+        # same trades, same product, without float32 rounding
+        terminal = np.full(paths, np.log1p(returns).sum())
+    terminal = cash * np.exp(terminal.astype(np.float64))
+
+    return dict(
+        paths=paths,
+        method=method,
+        ruin_probability=ruined / paths,
+        max_drawdown=dict(
+            zip(PERCENTILES, (np.percentile(max_drawdown, PERCENTILES) * 100).tolist())
+        ),
+        terminal=dict(zip(PERCENTILES, np.percentile(terminal, PERCENTILES).tolist())),
+    )
+
+
+def log_monte_carlo(result: dict) -> None:
+    if not result["paths"]:
+        logging.info("Monte Carlo: no trades to resample")
+        return
+    logging.info(
+        f"Monte Carlo ({result['paths']} {result['method']} paths): "
+        f"ruin probability {result['ruin_probability'] * 100:.2f}%"
+    )
+    for p in PERCENTILES:
+        logging.info(
+            f"  p{p:<2} max drawdown {result['max_drawdown'][p]:6.2f}%, "
+            f"terminal equity {result['terminal'][p]:.2f}"
+        )
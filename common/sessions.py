@@ -0,0 +1,235 @@
+"""
+Session-level indexes built once from intraday bars, so strategies can look
+levels up by date instead of carrying extra feeds around, and tell which bar
+opens the session by bar number instead of converting every bar's datetime.
+"""
+
+from datetime import date, time, timezone, tzinfo
+
+import numpy as np
+
+from common.candles import DAY, Candles, local_times, to_seconds
+from common.resample import Resampler
+
+# date(1970, 1, 1).toordinal()
+EPOCH_ORDINAL = 719163
+
+# SessionCalendar event flags, or'd together per bar
+NEW_DAY = 1  # first bar of a local date
+ONR = 2  # inside the overnight range window
+ONR_START = 4
+ONR_END = 8
+OPEN = 16  # starts right at the session open
+SECOND = 32  # starts one `bar` after the open, e.g. the second M15 candle
+END = 64  # last bar starting before the session close
+CLOSE = 128  # starts right at the session close
+
+
+def session_days(candles: Candles, tz: tzinfo, rollover: time) -> np.ndarray:
+    """
+    Trading date of every bar as a day number (days since 1970-01-01). Bars
+    starting at or after `rollover` local time belong to the next day's
+    session, the same way OANDA's daily candles roll over at 17:00 New York.
+    """
+    local = local_times(candles.time, tz)
+    return (local - to_seconds(rollover)) // DAY + 1
+
+
+class PriorDayIndex:
+    """
+    High, low and close of the previous session for every trading date, built
+    from intraday bars.
+
+    Sessions are cut at `rollover` in `tz`, so DST shifts are followed and
+    Monday's prior day is Friday's session. `get` is two list lookups, cheap
+    enough to call on every bar.
+    """
+
+    days: np.ndarray
+    """Trading date (day number) of each session in the data"""
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+
+    def __init__(
+        self, candles: Candles, tz: tzinfo, rollover: time = time(17, 0)
+    ) -> None:
+        daily = Resampler(candles, tz).bars(DAY, rollover)
+        self.days = session_days(daily, tz, rollover)
+        self.high = daily.high
+        self.low = daily.low
+        self.close = daily.close
+
+        # position of the prior session for every day number from the first
+        # session to the day after the last one, -1 where there's none yet
+        self._first = int(self.days[0]) if len(self) else 0
+        last = int(self.days[-1]) + 1 if len(self) else -1
+        span = np.arange(self._first, last + 1)
+        self._prior = (np.searchsorted(self.days, span) - 1).tolist()
+        self._levels = list(
+            zip(self.high.tolist(), self.low.tolist(), self.close.tolist())
+        )
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def get(self, day: date) -> tuple[float, float, float] | None:
+        """
+        (high, low, close) of the last session before trading date `day`, or
+        None if the data doesn't go back that far.
+        """
+        i = day.toordinal() - EPOCH_ORDINAL - self._first
+        if i < 0 or not self._prior:
+            return None
+        prior = self._prior[min(i, len(self._prior) - 1)]
+        return self._levels[prior] if prior >= 0 else None
+
+    def lookup(self, days: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        `get` for a whole array of day numbers at once: (high, low, close)
+        arrays, NaN where there's no prior session.
+        """
+        if not len(self):
+            nan = np.full(len(days), np.nan)
+            return nan, nan.copy(), nan.copy()
+        prior = np.searchsorted(self.days, days) - 1
+        valid = prior >= 0
+        prior = np.maximum(prior, 0)
+        return (
+            np.where(valid, self.high[prior], np.nan),
+            np.where(valid, self.low[prior], np.nan),
+            np.where(valid, self.close[prior], np.nan),
+        )
+
+
+class SessionCalendar:
+    """
+    Where each day's session events fall in one set of bars, worked out once
+    for the whole history so strategies only look their bar number up.
+
+    Days are local dates in `tz` and times are wall-clock, so the events
+    follow DST shifts. A day without the bar an event needs (a holiday, an
+    early close, a gap in the data) just doesn't get that event: its index is
+    -1, and a strategy waiting for it does nothing that day. END is the
+    exception, it's the last bar before the close whatever time that is.
+
+    The per-day arrays are bar indices into the candles, for vectorised code,
+    apart from the overnight range's levels (NaN on days without ONR bars);
+    `events` has the flags of every bar, for strategies:
+
+        events = calendar.events[self.data.index()]
+        if events & OPEN:
+            ...
+    """
+
+    open_time: time
+    close_time: time
+    onr: tuple[time, time]
+    bar: int  # seconds
+
+    days: np.ndarray
+    """Local date (day number) of each day in the data"""
+    start: np.ndarray
+    stop: np.ndarray
+    """Each day's bars are [start, stop)"""
+    open: np.ndarray
+    second: np.ndarray
+    onr_start: np.ndarray
+    onr_end: np.ndarray
+    onr_high: np.ndarray
+    onr_low: np.ndarray
+    end: np.ndarray
+    close: np.ndarray
+
+    flags: np.ndarray
+    """Event flags of every bar"""
+    events: list[int]
+
+    def __init__(
+        self,
+        candles: Candles,
+        tz: tzinfo,
+        open_time: time = time(9, 30),
+        close_time: time = time(16, 0),
+        onr: tuple[time, time] = (time(0, 0), time(6, 0)),
+        bar: int = 15 * 60,
+    ) -> None:
+        self.open_time = open_time
+        self.close_time = close_time
+        self.onr = onr
+        self.bar = bar
+
+        resampler = Resampler(candles, tz)
+        local = resampler.local
+        local_days = local // DAY
+        self.start = np.flatnonzero(np.diff(local_days, prepend=local_days[:1] - 1))
+        self.stop = np.append(self.start[1:], len(candles))
+        self.days = local_days[self.start]
+        midnights = self.days * DAY
+
+        def at(seconds: int) -> np.ndarray:
+            # bars are sorted, so a day's bar at a given time is found by
+            # bisection, if it's there
+            i = np.searchsorted(local, midnights + seconds)
+            found = i < len(local)
+            found[found] = local[i[found]] == (midnights + seconds)[found]
+            return np.where(found, i, -1)
+
+        def window(start: int, stop: int) -> tuple[np.ndarray, np.ndarray]:
+            lo = np.searchsorted(local, midnights + start)
+            hi = np.searchsorted(local, midnights + stop)
+            inside = hi > lo
+            return np.where(inside, lo, -1), np.where(inside, hi - 1, -1)
+
+        opening, closing = to_seconds(open_time), to_seconds(close_time)
+        self.open = at(opening)
+        self.second = at(opening + bar)
+        self.close = at(closing)
+        self.onr_start, self.onr_end = window(to_seconds(onr[0]), to_seconds(onr[1]))
+        _, self.end = window(opening, closing)
+
+        # one ONR bar per day, from the resampler, filed under the day it's on
+        onr_bars = resampler.window(*onr)
+        keys = local_times(onr_bars.time, tz) // DAY
+        rows = np.minimum(np.searchsorted(self.days, keys), len(self.days) - 1)
+        found = self.days[rows] == keys
+        self.onr_high = np.full(len(self.days), np.nan)
+        self.onr_low = np.full(len(self.days), np.nan)
+        self.onr_high[rows[found]] = onr_bars.high[found]
+        self.onr_low[rows[found]] = onr_bars.low[found]
+
+        flags = np.zeros(len(candles), dtype=np.int64)
+        flags[self.start] |= NEW_DAY
+        time_of_day = local % DAY
+        flags[
+            (time_of_day >= to_seconds(onr[0])) & (time_of_day < to_seconds(onr[1]))
+        ] |= ONR
+        for flag, indices in (
+            (ONR_START, self.onr_start),
+            (ONR_END, self.onr_end),
+            (OPEN, self.open),
+            (SECOND, self.second),
+            (END, self.end),
+            (CLOSE, self.close),
+        ):
+            flags[indices[indices >= 0]] |= flag
+        self.flags = flags
+        # plain ints, indexing a list is much cheaper than an array per bar
+        self.events = flags.tolist()
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+
+def feed_calendar(data, **kwargs) -> SessionCalendar:
+    """
+    `SessionCalendar` of a started `common.feeds.CandlesData` feed's candles,
+    in the feed's time zone, for strategies that weren't given one. Other
+    feeds have no candles to build it from, so it has to be passed in.
+    """
+    candles = getattr(data, "candles", None)
+    if candles is None:
+        raise ValueError(
+            f"A session calendar is required on {type(data).__name__} feeds"
+        )
+    return SessionCalendar(candles, data._tz or timezone.utc, **kwargs)
@@ -0,0 +1,169 @@
+"""
+Minimal asyncio HTTP/1.1 client for the v20 REST and streaming APIs.
+
+The v20 bindings are blocking and go through requests, which is fine for
+history but puts a thread hop and a few layers of parsing between a price
+arriving and an order leaving. This talks to the API over plain asyncio
+streams instead: one keep-alive connection for requests, whose bytes can be
+prepared ahead of time and written with a single call, and one for the pricing
+stream, read line by line with the time each line arrived.
+
+Times are asked for in UNIX format ("1704205800.000000000"), which is cheaper
+to parse than RFC3339.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import ssl as ssllib
+import time
+from typing import AsyncIterator
+
+from common.oanda import endpoint
+
+USER_AGENT = "backtesting-live/1.0"
+
+
+async def _open(hostname: str, port: int, ssl: bool):
+    reader, writer = await asyncio.open_connection(
+        hostname, port, ssl=ssllib.create_default_context() if ssl else None
+    )
+    # orders are written in one go, don't let Nagle hold them back
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return reader, writer
+
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple[int, dict[str, str]]:
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while line := (await reader.readline()).strip():
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def _read_chunks(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    while True:
+        size = int((await reader.readline()).split(b";")[0], 16)
+        if size == 0:
+            await reader.readline()
+            return
+        chunk = await reader.readexactly(size)
+        await reader.readexactly(2)
+        yield chunk
+
+
+class Connection:
+    """
+    One keep-alive connection to the REST API. `prepare` renders a request
+    to bytes, so the hot path is just `send` plus reading the response.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int = 443,
+        ssl: bool = True,
+        token: str | None = None,
+    ) -> None:
+        self.hostname = hostname
+        self.port = port
+        self.ssl = ssl
+        self.token = token if token is not None else os.getenv("OANDA_API_KEY")
+        self._reader = self._writer = None
+
+    @classmethod
+    def from_env(cls) -> "Connection":
+        return cls(*endpoint())
+
+    async def open(self) -> None:
+        self._reader, self._writer = await _open(self.hostname, self.port, self.ssl)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+
+    def prepare(self, method: str, path: str, body: dict | None = None) -> bytes:
+        payload = json.dumps(body, separators=(",", ":")).encode() if body else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.hostname}\r\n"
+            f"Authorization: Bearer {self.token}\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            "Accept-Datetime-Format: UNIX\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "\r\n"
+        )
+        return head.encode() + payload
+
+    async def send(self, request: bytes) -> None:
+        if self._writer is None:
+            await self.open()
+        self._writer.write(request)
+        await self._writer.drain()
+
+    async def response(self) -> tuple[int, dict]:
+        status, headers = await _read_head(self._reader)
+        if headers.get("transfer-encoding") == "chunked":
+            body = b"".join([chunk async for chunk in _read_chunks(self._reader)])
+        else:
+            body = await self._reader.readexactly(int(headers["content-length"]))
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, json.loads(body) if body else {}
+
+    async def request(
+        self, method: str, path: str, body: dict | None = None
+    ) -> tuple[int, dict]:
+        await self.send(self.prepare(method, path, body))
+        return await self.response()
+
+
+async def pricing_stream(
+    account: str, instruments: list[str], token: str | None = None
+) -> AsyncIterator[tuple[int, bytes]]:
+    """
+    Every line of the pricing stream at the streaming `endpoint`, with the
+    `time.perf_counter_ns()` it was read at, unparsed so the caller only pays
+    for the JSON it needs. PRICE and HEARTBEAT lines alike.
+    """
+    hostname, port, ssl = endpoint(stream=True)
+    connection = Connection(hostname, port, ssl, token)
+    reader, writer = await _open(hostname, port, ssl)
+    writer.write(
+        connection.prepare(
+            "GET",
+            f"/v3/accounts/{account}/pricing/stream"
+            f"?instruments={'%2C'.join(instruments)}",
+        )
+    )
+    await writer.drain()
+    try:
+        status, headers = await _read_head(reader)
+        if status != 200:
+            body = await reader.read(int(headers.get("content-length", -1)))
+            raise ConnectionError(f"pricing stream: {status} {body.decode()}")
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = _read_chunks(reader)
+        else:
+            chunks = _read_all(reader)
+        partial = b""
+        async for chunk in chunks:
+            received = time.perf_counter_ns()
+            *lines, partial = (partial + chunk).split(b"\n")
+            for line in lines:
+                if line:
+                    yield received, line
+    finally:
+        writer.close()
+
+
+async def _read_all(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    while chunk := await reader.read(65536):
+        yield chunk
@@ -0,0 +1,129 @@
+"""
+Parameter sweeps over a process pool, with the bars in shared memory.
+
+Backtrader's `optstrategy` pickles every data feed to every worker. Here the
+candles are copied into one shared memory block up front and each worker maps
+it once, so the data never goes through pickle no matter how big the grid is.
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Sequence
+
+import numpy as np
+import pandas as pd
+
+from common.candles import COLUMNS, Candles
+
+DTYPES = {
+    "time": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64,
+}
+
+
+def _views(buffer, length: int) -> Candles:
+    return Candles(
+        *(
+            np.ndarray(length, DTYPES[name], buffer, offset=i * length * 8)
+            for i, name in enumerate(COLUMNS)
+        )
+    )
+
+
+class SharedCandles:
+    """
+    A copy of `candles` in a shared memory block, freed on `close()` (or when
+    used as a context manager). Workers get at it through `attach(handle)`.
+    """
+
+    def __init__(self, candles: Candles) -> None:
+        length = len(candles)
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=max(length * 8 * len(COLUMNS), 1)
+        )
+        self.candles = _views(self._shm.buf, length)
+        for name in COLUMNS:
+            getattr(self.candles, name)[:] = getattr(candles, name)
+        self.handle = (self._shm.name, length)
+
+    def close(self) -> None:
+        # drop our views first, the block can't be closed while they're alive
+        self.candles = None
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self) -> "SharedCandles":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attach(handle: tuple[str, int]) -> tuple[shared_memory.SharedMemory, Candles]:
+    """
+    Maps a SharedCandles block created by another process. Keep the returned
+    SharedMemory referenced for as long as the Candles are in use.
+    """
+    name, length = handle
+    # pool workers share their parent's resource tracker, so attaching here
+    # doesn't hand ownership of the block to them
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, _views(shm.buf, length)
+
+
+_worker: dict[str, Any] = {}
+
+
+def _init_worker(handle: tuple[str, int]) -> None:
+    _worker["shm"], _worker["candles"] = attach(handle)
+
+
+def _run(fn: Callable[..., dict], params: dict) -> dict:
+    return fn(_worker["candles"], **params)
+
+
+def grid(**axes: Sequence) -> list[dict]:
+    """
+    Every combination of the given parameter values.
+    """
+    return [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+
+
+def sweep_results(
+    fn: Callable[..., dict],
+    candles: Candles,
+    jobs: list[dict],
+    processes: int | None = None,
+) -> list[dict]:
+    """
+    Calls `fn(candles, **params)` for every params dict in `jobs` across a
+    process pool and returns what each call returned, in the order of `jobs`.
+    `fn` has to be picklable, e.g. a module-level function, so it can be sent
+    to the workers.
+    """
+    with SharedCandles(candles) as shared, ProcessPoolExecutor(
+        processes, initializer=_init_worker, initargs=(shared.handle,)
+    ) as pool:
+        futures = [pool.submit(_run, fn, params) for params in jobs]
+        return [future.result() for future in futures]
+
+
+def run_sweep(
+    fn: Callable[..., dict],
+    candles: Candles,
+    combinations: list[dict],
+    processes: int | None = None,
+) -> pd.DataFrame:
+    """
+    `sweep_results` collected into one table, one row per combination with
+    its params next to the stats `fn` returned for it.
+    """
+    results = sweep_results(fn, candles, combinations, processes)
+    return pd.DataFrame(
+        [{**params, **result} for params, result in zip(combinations, results)]
+    )
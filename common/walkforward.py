@@ -0,0 +1,124 @@
+"""
+Walk-forward optimisation on top of the shared-memory sweeps.
+
+The history is cut into equal segments (calendar months by default) and every
+parameter combination is backtested once per segment, all in one pool. A
+window's in-sample score is then just its segments' daily returns put
+together, and its out-of-sample result is the next segments' returns for the
+winning combination, which were already computed. Overlapping windows never
+re-run anything and no window replays the history from the start.
+
+Every segment starts flat with fresh cash, so a position still open at a
+segment boundary is dropped rather than carried into the next one.
+"""
+
+from datetime import datetime, tzinfo
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from common import metrics
+from common.candles import Candles
+from common.sweep import sweep_results
+
+
+def month_bounds(
+    start: datetime, end: datetime, tz: tzinfo, months: int = 1
+) -> list[int]:
+    """
+    Epoch seconds of every `months`-th local month start from `start` to
+    `end`, with `start` and `end` themselves as the outer bounds.
+    """
+    starts = pd.date_range(start, end, freq=f"{months}MS", tz=tz, inclusive="neither")
+    edges = [pd.Timestamp(start, tz=tz), *starts, pd.Timestamp(end, tz=tz)]
+    return sorted({int(t.timestamp()) for t in edges})
+
+
+def segment_returns(result: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (UTC day numbers, daily returns) of one segment run, from the arrays a
+    `metrics.Recorder` returns.
+    """
+    days, closes = metrics.daily_equity(result["times"], result["equity"])
+    closes = np.concatenate([result["equity"][:1], closes])
+    return days, closes[1:] / closes[:-1] - 1
+
+
+def walk_forward(
+    fn: Callable[..., dict],
+    candles: Candles,
+    combinations: list[dict],
+    bounds: list[int],
+    train: int,
+    test: int = 1,
+    objective: Callable[[np.ndarray], float | None] = metrics.sharpe,
+    processes: int | None = None,
+) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Rolls a window of `train` segments in sample followed by `test` segments
+    out of sample over the segments between `bounds`, stepping by `test`.
+
+    `fn(candles, start=..., end=..., **params)` must backtest the bars in
+    [start, end) and return a `metrics.Recorder` analysis. It's called with
+    the whole of `candles` every time, so anything it derives from them can
+    be worked out once (see `orb.segment_backtest`). The combination
+    with the best `objective` over each window's in-sample daily returns is
+    evaluated on its out-of-sample segments.
+
+    Returns one row per window and the stitched out-of-sample equity curve
+    (starting at 1.0, indexed by UTC date).
+    """
+    segments = list(zip(bounds[:-1], bounds[1:]))
+    jobs = [
+        dict(params, start=start, end=end)
+        for params in combinations
+        for start, end in segments
+    ]
+    results = sweep_results(fn, candles, jobs, processes)
+
+    # runs[combination][segment], in the order the jobs were made
+    runs = [
+        results[c * len(segments) : (c + 1) * len(segments)]
+        for c in range(len(combinations))
+    ]
+    returns = [[segment_returns(run) for run in row] for row in runs]
+    trades = [[len(run["pnl"]) for run in row] for row in runs]
+
+    rows = []
+    oos_days, oos_returns = [], []
+    for first in range(0, len(segments) - train - test + 1, test):
+        in_sample = range(first, first + train)
+        out_of_sample = range(first + train, first + train + test)
+
+        scores = []
+        for c in range(len(combinations)):
+            score = objective(np.concatenate([returns[c][s][1] for s in in_sample]))
+            scores.append(-np.inf if score is None else score)
+        best = int(np.argmax(scores))
+
+        days = np.concatenate([returns[best][s][0] for s in out_of_sample])
+        oos = np.concatenate([returns[best][s][1] for s in out_of_sample])
+        oos_days.append(days)
+        oos_returns.append(oos)
+        rows.append(
+            dict(
+                train_start=pd.Timestamp(segments[in_sample[0]][0], unit="s"),
+                test_start=pd.Timestamp(segments[out_of_sample[0]][0], unit="s"),
+                test_end=pd.Timestamp(segments[out_of_sample[-1]][1], unit="s"),
+                **combinations[best],
+                in_sample_score=scores[best],
+                oos_sharpe=metrics.sharpe(oos),
+                oos_return=float(np.prod(1 + oos) - 1) * 100,
+                oos_trades=sum(trades[best][s] for s in out_of_sample),
+            )
+        )
+
+    days = np.concatenate(oos_days) if oos_days else np.empty(0, dtype=np.int64)
+    equity = pd.Series(
+        np.cumprod(1 + np.concatenate(oos_returns)) if oos_returns else [],
+        index=pd.to_datetime(days, unit="D"),
+        name="equity",
+        dtype=float,
+    )
+    return pd.DataFrame(rows), equity
@@ -0,0 +1,167 @@
+"""
+ORB, SRS, SRS Anti and prior day reversal side by side on one instrument, in
+a single backtrader pass.
+
+    python compare.py                                  # US30_USD, ORB's dates
+    python compare.py NAS100_USD --from 2024-01-01 --to 2025-01-01 --offline
+
+The minute history is loaded once. M15 bars for ORB and SRS are resampled
+from it and the prior-day levels built from it, and all four strategies run
+over the two feeds together (see common.multi), each with its own broker,
+cash, sizer and analyzers, so their stats are what their own scripts report
+for the same bars.
+"""
+
+import argparse
+import logging
+from datetime import datetime, time
+
+import pandas as pd
+from backtrader import TimeFrame
+
+import orb
+from common import metrics
+from common.cache import CandleCache
+from common.candles import Candles
+from common.multi import SharedRun
+from common.profile import Profiler
+from common.resample import Resampler
+from common.sessions import PriorDayIndex, SessionCalendar
+from meta.srs_and_onr import SchoolRun
+from prolefoto import prior_day_reversal as pdr
+
+TZ = orb.TZ
+
+ORB_KWARGS = dict(open_time=time(9, 30), entry_offset=5.0, r=1.5)
+
+
+def load_candles(
+    instrument: str,
+    fromdate: datetime,
+    todate: datetime,
+    cache: CandleCache | None = None,
+    offline: bool = False,
+) -> tuple[Candles, Candles, PriorDayIndex]:
+    """
+    Minute and M15 bid candles from fromdate to todate (New York wall clock)
+    and the prior-day levels, all from one load of the minute history.
+    """
+    warmup, start, end = pdr.history_bounds(fromdate, todate)
+    history = (cache or CandleCache()).load(
+        instrument, "M1", "B", warmup, end, fetch=not offline, mmap=offline
+    )
+    minute = history.between(start, end)
+    m15 = Resampler(minute, TZ).bars(15 * 60)
+    return minute, m15, PriorDayIndex(history, pdr.TZ, pdr.ROLLOVER)
+
+
+def build_run(minute: Candles, m15: Candles, levels: PriorDayIndex) -> SharedRun:
+    # one calendar per feed, shared by the strategies on it
+    m15_calendar = SessionCalendar(m15, TZ)
+    shared = SharedRun()
+    m15_feed = shared.add_feed(m15, timeframe=TimeFrame.Minutes, compression=15, tz=TZ)
+    minute_feed = shared.add_feed(
+        minute, timeframe=TimeFrame.Minutes, compression=1, tz=TZ
+    )
+    shared.add(
+        "ORB",
+        orb.ORBStrategy,
+        m15_feed,
+        cash=orb.CASH,
+        setup=orb.configure_broker,
+        sizer=(orb.SizerCls, dict(percents=1.0)),
+        calendar=m15_calendar,
+        **ORB_KWARGS,
+    )
+    shared.add("SRS", SchoolRun, m15_feed, cash=orb.CASH, calendar=m15_calendar)
+    shared.add(
+        "SRS Anti",
+        SchoolRun,
+        m15_feed,
+        cash=orb.CASH,
+        calendar=m15_calendar,
+        anti=True,
+    )
+    shared.add(
+        "Prior day reversal",
+        pdr.PriorDayReversal,
+        minute_feed,
+        cash=pdr.CASH,
+        setup=pdr.configure_broker,
+        levels=levels,
+        calendar=SessionCalendar(minute, TZ),
+        **pdr.STRATEGY_KWARGS,
+    )
+    shared.cerebro.addanalyzer(metrics.Recorder, _name="metrics")
+    return shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare strategies in one pass")
+    parser.add_argument("instrument", nargs="?", default=orb.INSTRUMENT)
+    parser.add_argument(
+        "--from",
+        dest="fromdate",
+        type=datetime.fromisoformat,
+        default=orb.DATA_KWARGS["fromdate"],
+    )
+    parser.add_argument(
+        "--to",
+        dest="todate",
+        type=datetime.fromisoformat,
+        default=orb.DATA_KWARGS["todate"],
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="use whatever is cached without connecting to OANDA",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        nargs="?",
+        const="compare.folded",
+        help="time every phase and callback and save folded stacks for a "
+        "flamegraph to PATH (compare.folded by default)",
+    )
+    args = parser.parse_args()
+
+    profiler = Profiler(enabled=args.profile is not None)
+    profiler.instrument_fetch()
+    with profiler.phase("load"):
+        minute, m15, levels = load_candles(
+            args.instrument, args.fromdate, args.todate, offline=args.offline
+        )
+    if len(minute) == 0:
+        logging.error(f"No M1 candles from {args.fromdate} to {args.todate}")
+        profiler.restore()
+        return
+    logging.info(f"Running on {len(minute)} M1 and {len(m15)} M15 bars")
+
+    shared = build_run(minute, m15, levels)
+    profiler.instrument(shared.cerebro)
+    with profiler.phase("run"):
+        strategies = shared.run()
+    profiler.report(args.profile, bars=len(minute) + len(m15))
+    report = pd.DataFrame(
+        [
+            dict(
+                strategy=name,
+                **metrics.compute(**strategy.analyzers.metrics.get_analysis()),
+            )
+            for name, strategy in strategies.items()
+        ]
+    )
+    logging.info(f"{args.instrument}:\n{report.to_string(index=False)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()  # hack to move to next line
+        logging.info("Process interrupted by user. Exiting...")
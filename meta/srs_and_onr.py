@@ -33,29 +33,49 @@ to automate, leaving me with more time for research (and everyday life, I
 suppose).
 """
 
+import argparse
 import logging
+import math
 import os
-from datetime import datetime, timedelta, timezone
+import sys
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from zipfile import BadZipFile
 from zoneinfo import ZoneInfo
 
-import v20
+import backtrader as bt
+import numpy as np
+import pandas as pd
 
+# allow running as `python meta/srs_and_onr.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-class Candlestick:
-    time: datetime
-    open: float
-    high: float
-    low: float
-    close: float
-    volume: float
+from common import sessions
+from common.cache import CandleCache
+from common.candles import Candles, to_seconds
+from common.oanda import to_epoch
+from common.profile import Profiler
 
-    def __init__(self, dt: datetime, o: float, h: float, l: float, c: float, v: float):
-        self.time = dt
-        self.open = o
-        self.high = h
-        self.low = l
-        self.close = c
-        self.volume = v
+INSTRUMENT = "US30_USD"
+TIMEZONE = ZoneInfo("America/New_York")
+
+BAR = 15 * 60
+ONR_START = time(0, 0)
+ONR_END = time(6, 0)
+SESSION_OPEN = time(9, 30)
+SESSION_CLOSE = time(16, 0)
+
+# per-session results of earlier runs, so a rerun only evaluates new sessions
+STATE = Path(__file__).resolve().parent.parent / ".srs_and_onr.npz"
+# sessions fetched and evaluated between saves of the state
+CHUNK = 20
+
+
+def slot(t: time) -> int:
+    """
+    Column of the M15 bar starting at `t` on a grid that starts at ONR_START.
+    """
+    return (to_seconds(t) - to_seconds(ONR_START)) // BAR
 
 
 class TestResult:
@@ -73,111 +93,737 @@ class TestResult:
     """
     anti_wr: float
 
-    def __init__(self, school_run_wr: float, anti_wr: float) -> None:
+    """
+    Number of sessions that triggered an entry
+    """
+    trades: int
+
+    def __init__(self, school_run_wr: float, anti_wr: float, trades: int = 0) -> None:
         self.school_run_wr = school_run_wr
         self.anti_wr = anti_wr
+        self.trades = trades
+
+    def __repr__(self) -> str:
+        return (
+            f"TestResult(school_run_wr={self.school_run_wr:.4f}, "
+            f"anti_wr={self.anti_wr:.4f}, trades={self.trades})"
+        )
 
 
-def run(end_date: datetime, num_days: int):
-    logger = logging.getLogger("srs_and_onr.run")
+class Signals:
+    """
+    SRS and SRS Anti entries for every session, one array element per day.
+
+    Sessions without an entry (no breakout, a missing SRS candle, or a single
+    M15 bar breaking both sides so the order can't be known) have a direction
+    of 0.
+    """
 
-    logger.info("Connecting to v20 API")
+    dates: list[date]
 
-    oanda = v20.Context(
-        "api-fxpractice.oanda.com",
-        token=os.getenv("OANDA_API_KEY"),
-    )
+    """
+    OHLC laid out on a (days, slots) grid of M15 bars from ONR_START to
+    SESSION_CLOSE, NaN where a bar is missing
+    """
+    prices: dict[str, np.ndarray]
+
+    srs_high: np.ndarray
+    srs_low: np.ndarray
+    onr_high: np.ndarray
+    onr_low: np.ndarray
+
+    """
+    Grid slot of the bar that broke out of the SRS range
+    """
+    trigger: np.ndarray
 
-    accounts_response = oanda.account.list()
-    if accounts_response.status != 200:
-        logger.error("Failed to connect to OANDA server: %s", accounts_response)
-        exit(1)
+    """
+    Fill price of the breakout, i.e. the SRS level or the trigger bar's open if
+    it gapped through
+    """
+    entry: np.ndarray
 
-    logger.info("Gathering data")
+    """
+    +1 for long, -1 for short, 0 for no trade
+    """
+    srs_direction: np.ndarray
+    anti_direction: np.ndarray
 
-    candles_response = oanda.instrument.candles(
-        instrument="US30_USD",
-        price="M",
-        granularity="D",
-        count=num_days,
-        to=end_date,
+    """
+    Points won or lost holding until SESSION_CLOSE
+    """
+    srs_pnl: np.ndarray
+    anti_pnl: np.ndarray
+
+    # the per-day arrays above, in the order they're saved
+    ARRAYS = (
+        "srs_high",
+        "srs_low",
+        "onr_high",
+        "onr_low",
+        "trigger",
+        "entry",
+        "srs_direction",
+        "anti_direction",
+        "srs_pnl",
+        "anti_pnl",
     )
 
-    if candles_response.status != 200:
-        logger.error("Failed to fetch candles: %s", candles_response)
+    def __init__(self, dates: list[date], prices: dict[str, np.ndarray]) -> None:
+        self.dates = dates
+        self.prices = prices
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, rows) -> "Signals":
+        """
+        The sessions at `rows` (a slice, mask or index array).
+        """
+        rows = np.arange(len(self))[rows]
+        signals = Signals(
+            [self.dates[i] for i in rows],
+            {name: p[rows] for name, p in self.prices.items()},
+        )
+        for name in self.ARRAYS:
+            setattr(signals, name, getattr(self, name)[rows])
+        return signals
+
+    @classmethod
+    def concat(cls, parts: list["Signals"]) -> "Signals":
+        """
+        All the sessions of `parts`, sorted by date. Where a date appears more
+        than once the last part's session wins.
+        """
+        dates = [d for part in parts for d in part.dates]
+        signals = Signals(
+            dates,
+            {
+                name: np.concatenate([part.prices[name] for part in parts])
+                for name in parts[0].prices
+            },
+        )
+        for name in cls.ARRAYS:
+            setattr(
+                signals, name, np.concatenate([getattr(part, name) for part in parts])
+            )
+        ordinals = np.asarray([d.toordinal() for d in dates], dtype=np.int64)
+        _, last = np.unique(ordinals[::-1], return_index=True)
+        return signals[len(dates) - 1 - last]
+
+    @property
+    def traded(self) -> np.ndarray:
+        return self.srs_direction != 0
 
-    candles_count = len(candles_response.body.get("candles"))
-    candles_first_date = datetime.fromisoformat(
-        candles_response.body.get("candles")[0].time
+
+def test_sessions(candles: Candles) -> tuple[Signals, TestResult]:
+    """
+    Evaluates SRS and SRS Anti on every session in `candles` (M15) at once.
+
+    The second M15 candle of the session sets the SRS range and the first bar
+    to break out of it triggers the entry. SRS trades the breakout direction,
+    SRS Anti fades it when the breakout level sits inside the ONR. Both are
+    held to the session close for now.
+    """
+    dates, prices = candles.grid(TIMEZONE, ONR_START, SESSION_CLOSE, BAR)
+    signals = Signals(dates, prices)
+    high, low = prices["high"], prices["low"]
+    rows = np.arange(len(dates))
+
+    # every day on the grid has bars, so it's one of the calendar's days
+    calendar = sessions.SessionCalendar(
+        candles,
+        TIMEZONE,
+        open_time=SESSION_OPEN,
+        close_time=SESSION_CLOSE,
+        onr=(ONR_START, ONR_END),
+        bar=BAR,
     )
-    candles_last_date = datetime.fromisoformat(
-        candles_response.body.get("candles")[-1].time
+    days = np.searchsorted(
+        calendar.days, np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
     )
+    signals.onr_high = calendar.onr_high[days]
+    signals.onr_low = calendar.onr_low[days]
+
+    second = slot(SESSION_OPEN) + 1
+    signals.srs_high = high[:, second]
+    signals.srs_low = low[:, second]
+
+    # NaN compares False, so missing bars and missing SRS candles never trigger
+    up = high[:, second + 1 :] > signals.srs_high[:, None]
+    down = low[:, second + 1 :] < signals.srs_low[:, None]
+    never = up.shape[1]
+    first_up = np.where(up.any(axis=1), up.argmax(axis=1), never)
+    first_down = np.where(down.any(axis=1), down.argmax(axis=1), never)
+    first = np.minimum(first_up, first_down)
+    valid = (first < never) & (first_up != first_down)
+
+    signals.trigger = np.where(valid, first + second + 1, -1)
+    signals.srs_direction = np.where(valid, np.where(first_up < first_down, 1, -1), 0)
+
+    level = np.where(signals.srs_direction > 0, signals.srs_high, signals.srs_low)
+    bar_open = prices["open"][rows, np.maximum(signals.trigger, 0)]
+    entry = np.where(
+        signals.srs_direction > 0, np.fmax(bar_open, level), np.fmin(bar_open, level)
+    )
+    signals.entry = np.where(valid, entry, np.nan)
 
-    logger.info(
-        "Testing on %i days from %s to %s",
-        candles_count,
-        candles_first_date,
-        candles_last_date,
+    inside_onr = (level >= signals.onr_low) & (level <= signals.onr_high)
+    signals.anti_direction = np.where(
+        inside_onr, -signals.srs_direction, signals.srs_direction
     )
 
-    timezone_info = ZoneInfo("America/New_York")
+    close = prices["close"]
+    last = close.shape[1] - 1 - np.argmax(~np.isnan(close[:, ::-1]), axis=1)
+    move = close[rows, last] - signals.entry
+    signals.srs_pnl = np.where(valid, signals.srs_direction * move, 0.0)
+    signals.anti_pnl = np.where(valid, signals.anti_direction * move, 0.0)
+
+    return signals, score(signals)
+
+
+def score(signals: Signals) -> TestResult:
+    """
+    Win rates of the sessions that triggered an entry.
+    """
+    traded = signals.traded
+    trades = int(traded.sum())
+    if trades == 0:
+        return TestResult(0, 0)
+    return TestResult(
+        float((signals.srs_pnl[traded] > 0).mean()),
+        float((signals.anti_pnl[traded] > 0).mean()),
+        trades,
+    )
 
-    test_results = []
 
-    for session in candles_response.body.get("candles"):
-        date = datetime.fromisoformat(session.time).astimezone(timezone_info)
-        intraday_candles = oanda.instrument.candles(
-            instrument="US30_USD",
-            granularity="M15",
-            fromTime=(date + timedelta(hours=0)).isoformat(),
-            toTime=(date + timedelta(hours=16)).isoformat(),
+def save_state(path: Path, signals: Signals, start: date, processed: date) -> None:
+    """
+    Writes every session's signals and the first and last session dates that
+    have been dealt with (every session from `start` to `processed`).
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            start=start.toordinal(),
+            processed=processed.toordinal(),
+            dates=np.asarray([d.toordinal() for d in signals.dates], dtype=np.int64),
+            **{f"prices_{name}": p for name, p in signals.prices.items()},
+            **{name: getattr(signals, name) for name in Signals.ARRAYS},
         )
+    # replaced in one go, so an interrupted save leaves the previous state
+    os.replace(tmp, path)
 
-        if intraday_candles.status != 200:
-            logger.error(
-                "Failed to fetch intraday candles for %s. Skipping day: %s",
-                date.date(),
-                intraday_candles.body.get("errorMessage"),
-            )
-            continue
-
-        candles_list = []
-        for candle in intraday_candles.body.get("candles"):
-            candles_list.append(
-                Candlestick(
-                    datetime.fromisoformat(candle.time).astimezone(timezone_info),
-                    candle.mid.o,
-                    candle.mid.h,
-                    candle.mid.l,
-                    candle.mid.c,
-                    candle.volume,
-                )
+
+def load_state(path: Path) -> tuple[Signals, date, date] | None:
+    """
+    The signals and the first and last session dates saved by `save_state`,
+    or None if there is no state or it can't be read, so it's rebuilt.
+    """
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as state:
+            signals = Signals(
+                [date.fromordinal(int(d)) for d in state["dates"]],
+                {
+                    name: state[f"prices_{name}"]
+                    for name in ("open", "high", "low", "close")
+                },
             )
+            for name in Signals.ARRAYS:
+                setattr(signals, name, state[name])
+            start = date.fromordinal(int(state["start"]))
+            return signals, start, date.fromordinal(int(state["processed"]))
+    except (OSError, ValueError, KeyError, BadZipFile) as e:
+        logging.getLogger("srs_and_onr.state").warning(
+            "Rebuilding the state, %s can't be read: %s", path, e
+        )
+        return None
 
-        test_results.append(test_day(candles_list))
 
-    test_results_len = len(test_results)
+def session_dates(start: date, end: date) -> list[date]:
+    """
+    Every weekday from `start` to `end`. Holidays are left in, they just don't
+    have any bars to evaluate.
+    """
+    days = np.arange(start, end + timedelta(days=1), dtype="datetime64[D]")
+    return days[np.is_busday(days)].tolist()
 
-    if test_results_len == 0:
-        return
 
-    # TODO: i don't actually want to log the results. they should be tallied up and analyzed instead
-    for result in test_results:
-        logger.info("Result: %s", result)
+def evaluate(
+    cache: CandleCache, sessions: list[date], logger: logging.Logger
+) -> tuple[Signals, list[date]]:
+    """
+    Fetches the M15 window of each session as a handful of concurrent range
+    requests and evaluates them. Returns the signals and the sessions that
+    couldn't be fetched (and were skipped).
+    """
+    windows = [
+        (
+            session,
+            datetime.combine(session, ONR_START, TIMEZONE),
+            datetime.combine(session, SESSION_CLOSE, TIMEZONE),
+        )
+        for session in sessions
+    ]
 
+    failures = cache.update_ranges(
+        INSTRUMENT, "M15", "M", [(start, end) for _, start, end in windows]
+    )
+    failed_days = []
+    for session, start, end in windows:
+        start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+        failure = next(
+            (f for f in failures if f.start < end_epoch and start_epoch < f.end),
+            None,
+        )
+        if failure is not None:
+            failed_days.append((session, failure.error))
+
+    if failed_days:
+        logger.error(
+            "Failed to fetch intraday candles for %i of %i days, skipped:",
+            len(failed_days),
+            len(windows),
+        )
+        for session, error in failed_days:
+            logger.error("  %s: %s", session, error)
+
+    # only the session windows were fetched, the nights and weekends between
+    # them aren't cached and aren't wanted
+    cached = cache.read(INSTRUMENT, "M15", "M")
+    failed = {session for session, _ in failed_days}
+    intraday = Candles.concat(
+        [
+            cached.between(to_epoch(start), to_epoch(end))
+            for session, start, end in windows
+            if session not in failed
+        ]
+    )
 
-def test_day(candles: list[Candlestick]) -> TestResult:
-    # TODO: actually write the tests
-    return TestResult(0, 0)
+    return test_sessions(intraday)[0], [session for session, _ in failed_days]
+
+
+def run(end_date: datetime, num_days: int, state: Path | None = None) -> Signals | None:
+    """
+    Evaluates the last `num_days` sessions up to `end_date`.
+
+    With a `state` file only the sessions it hasn't dealt with are fetched
+    and evaluated, CHUNK at a time, and the state is saved after each chunk,
+    so a daily rerun costs only the new days and an interrupted one carries
+    on where it stopped. A larger `num_days` than before backfills the
+    sessions before the stored ones, and sessions that have fallen out of the
+    window are dropped from the state. Sessions that failed to fetch are
+    tried again on the next run.
+    """
+    logger = logging.getLogger("srs_and_onr.run")
+
+    cache = CandleCache()
+    stored = load_state(state) if state is not None else None
+
+    # only sessions that have closed by `end_date`
+    end_date = end_date.astimezone(TIMEZONE)
+    last = end_date.date()
+    if datetime.combine(last, SESSION_CLOSE, TIMEZONE) > end_date:
+        last -= timedelta(days=1)
+
+    # sessions are counted by the ones with bars, so evaluate a few weeks more
+    # than `num_days` to make up for holidays and keep the last ones
+    window = last - timedelta(days=num_days * 7 // 5 + 14)
+    if stored is None:
+        signals, start, processed = None, window, window - timedelta(days=1)
+    else:
+        signals, start, processed = stored
+        logger.info(
+            "Resuming after %s with %i stored sessions", processed, len(signals)
+        )
+        # sessions that have fallen out of the window aren't kept
+        start = max(start, window)
+        processed = max(processed, window - timedelta(days=1))
+        kept = np.asarray([d >= window for d in signals.dates], dtype=bool)
+        if not kept.all():
+            signals = signals[kept]
+            save_state(state, signals, start, processed)
+
+    # sessions before the stored ones, when `num_days` has grown since
+    backfill = session_dates(window, start - timedelta(days=1))
+    if backfill:
+        logger.info(
+            "Backfilling %i days from %s to %s",
+            len(backfill),
+            backfill[0],
+            backfill[-1],
+        )
+
+    # newest first, so the state always covers one run of sessions
+    missed = None
+    for stop in range(len(backfill), 0, -CHUNK):
+        chunk = backfill[max(stop - CHUNK, 0) : stop]
+        new, failed = evaluate(cache, chunk, logger)
+        signals = new if signals is None else Signals.concat([new, signals])
+        # don't move before a failed session, so the next run fetches it again
+        if failed and missed is None:
+            missed = failed[-1]
+        start = chunk[0] if missed is None else missed + timedelta(days=1)
+        if state is not None:
+            save_state(state, signals, start, processed)
+
+    sessions = session_dates(processed + timedelta(days=1), last)
+    if sessions:
+        logger.info(
+            "Testing on %i new days from %s to %s",
+            len(sessions),
+            sessions[0],
+            sessions[-1],
+        )
+
+    retry = None
+    for first in range(0, len(sessions), CHUNK):
+        chunk = sessions[first : first + CHUNK]
+        new, failed = evaluate(cache, chunk, logger)
+        signals = new if signals is None else Signals.concat([signals, new])
+        # don't move past a failed session, so the next run fetches it again
+        if failed and retry is None:
+            retry = failed[0]
+        processed = chunk[-1] if retry is None else retry - timedelta(days=1)
+        if state is not None:
+            save_state(state, signals, start, processed)
+
+    if signals is None:
+        logger.error("No sessions before %s", end_date)
+        return None
+    signals = signals[-num_days:]
+    result = score(signals)
+
+    logger.info("%i of %i sessions triggered an entry", result.trades, len(signals))
+    logger.info("SRS win rate: %.2f%%", result.school_run_wr * 100)
+    logger.info("SRS Anti win rate: %.2f%%", result.anti_wr * 100)
+
+    return signals
+
+
+def test_day(candles: Candles) -> TestResult:
+    return test_sessions(candles)[1]
+
+
+class ExitGrid:
+    """
+    Exit rules to search over. Every combination of one stop, one target, one
+    exit time and one break-even setting is evaluated.
+    """
+
+    """
+    Stops as a fixed number of points, and as multiples of the SRS range
+    """
+    stop_points: tuple[float, ...]
+    stop_ranges: tuple[float, ...]
+
+    """
+    Targets as a fixed number of points, and as multiples of the SRS range
+    """
+    target_points: tuple[float, ...]
+    target_ranges: tuple[float, ...]
+
+    """
+    Flatten at the close of the bar ending at each of these times
+    """
+    exit_times: tuple[time, ...]
+
+    """
+    Move the stop to the entry once the trade is this many points in profit
+    (math.inf to never move it)
+    """
+    breakeven: tuple[float, ...]
+
+    def __init__(
+        self,
+        stop_points: tuple[float, ...] = (20, 40, 60, 80, 100),
+        stop_ranges: tuple[float, ...] = (0.5, 1.0, 1.5, 2.0),
+        target_points: tuple[float, ...] = (20, 40, 60, 80, 100, 150),
+        target_ranges: tuple[float, ...] = (0.5, 1.0, 1.5, 2.0, 3.0),
+        exit_times: tuple[time, ...] = (
+            time(11, 0),
+            time(12, 0),
+            time(14, 0),
+            SESSION_CLOSE,
+        ),
+        breakeven: tuple[float, ...] = (20, 40, math.inf),
+    ) -> None:
+        self.stop_points = stop_points
+        self.stop_ranges = stop_ranges
+        self.target_points = target_points
+        self.target_ranges = target_ranges
+        self.exit_times = exit_times
+        self.breakeven = breakeven
+
+
+def _first_reach(excursion: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """
+    For a (days, slots) running-max excursion and (days, n) thresholds, the
+    first slot at which each threshold is reached (slots if never).
+    """
+    return (excursion[:, :, None] < thresholds[:, None, :]).sum(axis=1)
+
+
+def search_exits(signals: Signals, grid: ExitGrid | None = None) -> pd.DataFrame:
+    """
+    Scores every exit combination in `grid` on the SRS and SRS Anti entries of
+    every session at once, ranked by expectancy (points per trade).
+
+    Works on M15 bars, so two conservative assumptions are made: the entry
+    bar's whole range counts towards the trade, and a bar that reaches both
+    the stop and the target (or break-even) counts as the stop.
+    """
+    grid = grid or ExitGrid()
+    traded = signals.traded
+    prices = {name: p[traded] for name, p in signals.prices.items()}
+    entry = signals.entry[traded]
+    trigger = signals.trigger[traded]
+    srs_range = (signals.srs_high - signals.srs_low)[traded]
+    days, slots = prices["close"].shape
+    rows = np.arange(days)[:, None]
+    columns = np.arange(slots)
+
+    stops = np.concatenate(
+        [
+            np.broadcast_to(
+                np.asarray(grid.stop_points, float), (days, len(grid.stop_points))
+            ),
+            srs_range[:, None] * np.asarray(grid.stop_ranges, float),
+        ],
+        axis=1,
+    )
+    targets = np.concatenate(
+        [
+            np.broadcast_to(
+                np.asarray(grid.target_points, float), (days, len(grid.target_points))
+            ),
+            srs_range[:, None] * np.asarray(grid.target_ranges, float),
+        ],
+        axis=1,
+    )
+    stop_labels = [f"{v:g} pts" for v in grid.stop_points] + [
+        f"{v:g}x SRS" for v in grid.stop_ranges
+    ]
+    target_labels = [f"{v:g} pts" for v in grid.target_points] + [
+        f"{v:g}x SRS" for v in grid.target_ranges
+    ]
+    breakeven = np.broadcast_to(
+        np.asarray(grid.breakeven, float), (days, len(grid.breakeven))
+    )
+    # last bar held for each exit time, never before the entry bar
+    exit_slots = np.maximum(
+        np.asarray([slot(t) - 1 for t in grid.exit_times])[None, :], trigger[:, None]
+    )
+
+    results = []
+    for variant, direction in (
+        ("SRS", signals.srs_direction[traded]),
+        ("SRS Anti", signals.anti_direction[traded]),
+    ):
+        long = (direction > 0)[:, None]
+        active = columns[None, :] >= trigger[:, None]
+        # per-bar excursions from the entry, 0 before the entry and on missing bars
+        favourable = np.where(
+            long, prices["high"] - entry[:, None], entry[:, None] - prices["low"]
+        )
+        adverse = np.where(
+            long, entry[:, None] - prices["low"], prices["high"] - entry[:, None]
+        )
+        favourable = np.where(active, np.nan_to_num(favourable, nan=-np.inf), -np.inf)
+        adverse = np.where(active, np.nan_to_num(adverse, nan=-np.inf), -np.inf)
+        mfe = np.maximum(np.maximum.accumulate(favourable, axis=1), 0)
+        mae = np.maximum(np.maximum.accumulate(adverse, axis=1), 0)
+
+        stop_hit = _first_reach(mae, stops)
+        target_hit = _first_reach(mfe, targets)
+
+        # once break-even is armed, the first later bar trading back through
+        # the entry closes the trade flat
+        armed = _first_reach(mfe, breakeven)
+        touches = np.where(adverse >= 0, columns[None, :], slots)
+        next_touch = np.minimum.accumulate(touches[:, ::-1], axis=1)[:, ::-1]
+        next_touch = np.concatenate([next_touch, np.full((days, 1), slots)], axis=1)
+        breakeven_hit = next_touch[rows, np.minimum(armed + 1, slots)]
+
+        # (days, stops, targets, exit times, break-even)
+        s = stop_hit[:, :, None, None, None]
+        t = target_hit[:, None, :, None, None]
+        e = exit_slots[:, None, None, :, None]
+        b = breakeven_hit[:, None, None, None, :]
+        first = np.minimum(np.minimum(s, t), b)
+        timed_out = first > e
+        exit_at = np.where(timed_out, e, first)
+
+        close = prices["close"][rows, exit_slots]
+        close = np.where(np.isnan(close), entry[:, None], close)
+        held = (direction[:, None] * (close - entry[:, None]))[:, None, None, :, None]
+        pnl = np.where(
+            timed_out,
+            held,
+            np.where(
+                s == first,
+                -stops[:, :, None, None, None],
+                np.where(b == first, 0.0, targets[:, None, :, None, None]),
+            ),
+        )
+
+        index = rows.reshape(days, 1, 1, 1, 1)
+        results.append(
+            (
+                variant,
+                (pnl > 0).mean(axis=0),
+                pnl.mean(axis=0),
+                mfe[index, exit_at].mean(axis=0),
+                mae[index, exit_at].mean(axis=0),
+            )
+        )
+
+    shape = (
+        len(stop_labels),
+        len(target_labels),
+        len(grid.exit_times),
+        len(grid.breakeven),
+    )
+    stop_i, target_i, exit_i, breakeven_i = (i.ravel() for i in np.indices(shape))
+    table = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "variant": variant,
+                    "stop": np.asarray(stop_labels)[stop_i],
+                    "target": np.asarray(target_labels)[target_i],
+                    "exit_time": np.asarray(
+                        [t.strftime("%H:%M") for t in grid.exit_times]
+                    )[exit_i],
+                    "breakeven": np.asarray(grid.breakeven)[breakeven_i],
+                    "trades": days,
+                    "win_rate": win_rate.ravel(),
+                    "expectancy": expectancy.ravel(),
+                    "mfe": mfe_mean.ravel(),
+                    "mae": mae_mean.ravel(),
+                }
+            )
+            for variant, win_rate, expectancy, mfe_mean, mae_mean in results
+        ],
+        ignore_index=True,
+    )
+    return table.sort_values("expectancy", ascending=False, ignore_index=True)
+
+
+class SchoolRun(bt.Strategy):
+    """
+    SRS, or SRS Anti with `anti`, as a backtrader strategy on M15 bars, for
+    running next to the other strategies on the same data. `calendar` is a
+    `sessions.SessionCalendar` of the feed's candles with the default
+    session and ONR times (the ones here), built from the feed if not given.
+
+    Once the second candle of the session closes, a stop order goes on
+    either side of its range, one cancelling the other. With `anti`, a side
+    whose level is inside the ONR is faded with a limit order instead. An
+    entry that hasn't filled by the last bar of the session is cancelled and
+    an open position is closed at the next bar's open, about the session
+    close `test_sessions` holds to.
+    """
+
+    params = (
+        ("anti", False),
+        ("size", 1),
+        ("calendar", None),
+    )
+
+    def __init__(self):
+        calendar = self.p.calendar
+        if calendar is None:
+            calendar = sessions.feed_calendar(self.datas[0])
+        self.calendar = calendar
+        self.events: list[int] = calendar.events
+        self.onr_high: float | None = None
+        self.onr_low: float | None = None
+        self.entries: list[bt.Order] = []
+
+    def next(self):
+        data = self.datas[0]
+        events = self.events[data.index()]
+        if events & sessions.NEW_DAY:
+            # the day's ONR is only looked at after it's over, at the SRS candle
+            day = np.searchsorted(self.calendar.start, data.index())
+            self.onr_high = float(self.calendar.onr_high[day])
+            self.onr_low = float(self.calendar.onr_low[day])
+
+        if events & sessions.SECOND and not self.position:
+            self.place(data.high[0], data.low[0])
+        elif events & sessions.END:
+            for order in self.entries:
+                if order.alive():
+                    self.cancel(order)
+            self.entries = []
+            if self.position:
+                self.close()
+
+    def inside_onr(self, level: float) -> bool:
+        # NaN levels, on days without ONR bars, compare False
+        return self.onr_high is not None and self.onr_low <= level <= self.onr_high
+
+    def place(self, srs_high: float, srs_low: float) -> None:
+        size = self.p.size
+        if self.p.anti and self.inside_onr(srs_high):
+            up = self.sell(price=srs_high, exectype=bt.Order.Limit, size=size)
+        else:
+            up = self.buy(price=srs_high, exectype=bt.Order.Stop, size=size)
+        if self.p.anti and self.inside_onr(srs_low):
+            down = self.buy(price=srs_low, exectype=bt.Order.Limit, size=size, oco=up)
+        else:
+            down = self.sell(price=srs_low, exectype=bt.Order.Stop, size=size, oco=up)
+        self.entries = [up, down]
 
 
 def main():
+    parser = argparse.ArgumentParser(description="SRS and SRS Anti study")
+    parser.add_argument("--days", type=int, default=50, help="sessions to test on")
+    parser.add_argument(
+        "--state",
+        metavar="PATH",
+        type=Path,
+        nargs="?",
+        const=STATE,
+        help=f"only evaluate sessions newer than those saved in PATH ({STATE.name} "
+        "by default), saving as it goes",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        nargs="?",
+        const="srs_and_onr.folded",
+        help="time every phase and save folded stacks for a flamegraph to PATH "
+        "(srs_and_onr.folded by default)",
+    )
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.DEBUG)
+    profiler = Profiler(enabled=args.profile is not None)
+    profiler.instrument_fetch()
+    module = sys.modules[__name__]
+    for name in ("evaluate", "test_sessions", "save_state"):
+        profiler.patch(module, name, name)
     try:
-        run(datetime.now() - timedelta(days=2), 50)
+        with profiler.phase("run"):
+            signals = run(datetime.now() - timedelta(days=2), args.days, args.state)
+        if signals is not None and signals.traded.any():
+            with profiler.phase("search_exits"):
+                exits = search_exits(signals)
+            logging.getLogger("srs_and_onr.main").info(
+                "Best exits out of %i:\n%s", len(exits), exits.head(20).to_string()
+            )
+        # bars on the session grids that were reported on
+        bars = 0 if signals is None else int(np.isfinite(signals.prices["close"]).sum())
+        profiler.report(args.profile, bars=bars)
     except KeyboardInterrupt:
         pass
+    finally:
+        profiler.restore()
 
 
 if __name__ == "__main__":
@@ -1,21 +1,39 @@
+import argparse
+import asyncio
+import json
 import logging
 import os
+import time as clock
+from functools import partial
+from typing import Callable
 
 import backtrader as bt
-import btoandav20 as bto
+import numpy as np
+import pandas as pd
 import pytz
 from backtrader import TimeFrame
 
-StoreCls = bto.stores.OandaV20Store
-DataCls = bto.feeds.OandaV20Data
+from common import metrics
+from common.cache import CandleCache
+from common.candles import Candles
+from common.export import ParquetExport
+from common.feeds import GRANULARITIES, CandlesData
+from common.intrabar import IntrabarBroker
+from common.journal import Journal, log_journal
+from common.memo import ResultStore
+from common.oanda import GRANULARITY_SECONDS
+from common.profile import Profiler
+from common.robustness import log_monte_carlo, monte_carlo
+from common.sessions import OPEN, SessionCalendar, feed_calendar
+from common.stream import Connection, pricing_stream
+from common.sweep import grid, run_sweep
+from common.walkforward import month_bounds, walk_forward
+
 SizerCls = bt.sizers.PercentSizerInt
 
 datetime = bt.datetime.datetime
 time = bt.datetime.time
 
-OANDA_API_KEY = os.getenv("OANDA_API_KEY")
-OANDA_ACCOUNT_ID = os.getenv("OANDA_ACCOUNT_ID")
-
 
 class ORBStrategy(bt.Strategy):
     params = (
@@ -25,9 +43,20 @@ class ORBStrategy(bt.Strategy):
         ),
         ("entry_offset", 5.0),
         ("r", 1.0),
+        ("journal", None),  # common.journal.Journal to record events into
+        ("calendar", None),  # common.sessions.SessionCalendar, the feed's by default
     )
 
     def __init__(self):
+        self.journal: Journal | None = self.p.journal
+        calendar = self.p.calendar
+        if calendar is None:
+            calendar = feed_calendar(self.datas[0], open_time=self.p.open_time)
+        if calendar.open_time != self.p.open_time:
+            raise ValueError(
+                f"Calendar opens at {calendar.open_time}, not {self.p.open_time}"
+            )
+        self.events: list[int] = calendar.events
         self.take_range_next_bar: bool = False
         self.open_high: float | None = None
         self.open_low: float | None = None
@@ -40,13 +69,8 @@ class ORBStrategy(bt.Strategy):
         if frompre:  # Skip if data is not live
             return
 
-        dt: datetime = self.datas[0].datetime.datetime(0)
-        if dt.time() < self.p.open_time:
-            logging.debug(f"[{dt}] Before market open, waiting for open range.")
-
-        if dt.time() == self.p.open_time:
+        if self.events[self.datas[0].index()] & OPEN:
             self.take_range_next_bar = True
-            logging.info(f"[{dt}] Market opened, taking open range next bar.")
 
         if self.take_range_next_bar:
             self.open_high = self.datas[0].high[-1]
@@ -56,9 +80,10 @@ class ORBStrategy(bt.Strategy):
             assert self.open_high is not None and self.open_low is not None
 
             self.open_range = self.open_high - self.open_low
-            logging.info(
-                f"[{dt}] Opening Range defined: High={self.open_high}, Low={self.open_low}, Range={self.open_range}"
-            )
+            if self.journal is not None:
+                self.journal.range_defined(
+                    self.datas[0].datetime[0], self.open_high, self.open_low
+                )
             self.take_range_next_bar = False
 
         if self.open_range is not None and not self.position:
@@ -69,10 +94,7 @@ class ORBStrategy(bt.Strategy):
             take_profit_long = entry_long + self.p.r * self.open_range
             take_profit_short = entry_short - self.p.r * self.open_range
 
-            logging.info(
-                f"[{dt}] Placing long order: Entry={entry_long}, Stop Loss={stop_loss_long}"
-            )
-            self.buy_bracket(
+            orders = self.buy_bracket(
                 price=entry_long,
                 exectype=bt.Order.Stop,
                 stopprice=stop_loss_long,
@@ -82,6 +104,16 @@ class ORBStrategy(bt.Strategy):
                 valid=bt.Order.DAY,
                 size=1,
             )
+            if self.journal is not None:
+                self.journal.bracket_placed(
+                    self.datas[0].datetime[0],
+                    orders[0].ref,
+                    1,
+                    1,
+                    entry_long,
+                    stop_loss_long,
+                    take_profit_long,
+                )
             # logging.info(
             #     f"[{dt}] Placing short order: Entry={entry_short}, Stop Loss={stop_loss_short}"
             # )
@@ -100,75 +132,639 @@ class ORBStrategy(bt.Strategy):
             self.open_low = None
             self.open_range = None
 
-
-if __name__ == "__main__":
-    logging.basicConfig(
-        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    def notify_order(self, order):
+        if self.journal is None:
+            return
+        side = 1 if order.isbuy() else -1
+        if order.status == order.Completed:
+            self.journal.fill(
+                self.datas[0].datetime[0],
+                order.ref,
+                side,
+                abs(order.executed.size),
+                order.executed.price,
+            )
+        elif order.status in (order.Canceled, order.Expired):
+            self.journal.cancel(self.datas[0].datetime[0], order.ref, side)
+
+
+INSTRUMENT = "US30_USD"
+TZ = pytz.timezone("US/Eastern")
+CASH = 100000.0
+
+DATA_KWARGS = dict(
+    timeframe=TimeFrame.Minutes,
+    compression=15,
+    fromdate=bt.datetime.datetime(2024, 1, 1),
+    todate=bt.datetime.datetime(2025, 8, 31),
+    tz=TZ,
+)
+
+SWEEP_GRID = dict(
+    open_time=[time(9, 30)],
+    entry_offset=[0.0, 2.5, 5.0, 10.0, 20.0],
+    r=[0.5, 1.0, 1.5, 2.0, 3.0],
+)
+
+
+def load_candles(cache: CandleCache | None = None, offline: bool = False) -> Candles:
+    # bid candles, same as bidask=True/useask=False on the OANDA store feed.
+    # offline replays whatever is cached, memory-mapped, without fetching
+    return (cache or CandleCache()).load(
+        INSTRUMENT,
+        "M15",
+        "B",
+        TZ.localize(DATA_KWARGS["fromdate"]),
+        TZ.localize(DATA_KWARGS["todate"]),
+        fetch=not offline,
+        mmap=offline,
     )
 
-    cerebro = bt.Cerebro()
-    cerebro.addstrategy(ORBStrategy, open_time=time(9, 30), entry_offset=5.0, r=1.5)
-    cerebro.broker.setcash(100000.0)
-    cerebro.broker.setcommission(commission=0.0)
+
+def straddling_bars(
+    candles: Candles,
+    open_time: time = time(9, 30),
+    entry_offset: float = 5.0,
+    r: float = 1.0,
+) -> np.ndarray:
+    """
+    Start times of the bars of `candles` that could reach both the stop and
+    the target of ORBStrategy's bracket: from the bar that reaches the day's
+    entry up to the next opening bar (the bracket only lives for the day),
+    and at least as wide as the (1 + r) opening ranges between its stop and
+    target.
+    """
+    opens = SessionCalendar(candles, TZ, open_time=open_time).open
+    opens = opens[opens > 0]
+    # the strategy takes the range from the bar before the one flagged OPEN
+    high, low = candles.high[opens - 1], candles.low[opens - 1]
+    bars = np.arange(len(candles))
+    day = np.searchsorted(opens, bars) - 1
+    on_day = day >= 0
+    day = np.maximum(day, 0)
+    entered = np.full(len(opens), len(candles))
+    reached = np.flatnonzero(on_day & (candles.high >= high[day] + entry_offset))
+    np.minimum.at(entered, day[reached], reached)
+    wide = candles.high - candles.low >= (1 + r) * (high - low)[day] - 1e-9
+    return candles.time[on_day & (bars >= entered[day]) & wide]
+
+
+def fine_loader(
+    candles: Candles,
+    cache: CandleCache | None = None,
+    offline: bool = False,
+    open_time: time = time(9, 30),
+    entry_offset: float = 5.0,
+    r: float = 1.0,
+    seconds: int = 15 * 60,
+) -> Callable[[int, int], Candles]:
+    """
+    M1 bid candles of one `seconds` bar of `candles` at a time, for
+    `IntrabarBroker`. Every bar that could be ambiguous (see
+    `straddling_bars`) has its M1 fetched in one batch up front unless
+    `offline`, so the run only slices the memory-mapped cache. A bar without
+    M1 candles comes back empty and is left to the default fill.
+    """
+    cache = cache or CandleCache()
+    if not offline:
+        starts = straddling_bars(candles, open_time, entry_offset, r).tolist()
+        logging.info(f"Fetching M1 candles for {len(starts)} possibly ambiguous bars")
+        failures = cache.update_ranges(
+            INSTRUMENT, "M1", "B", [(start, start + seconds) for start in starts]
+        )
+        for failure in failures:
+            logging.warning(f"No M1 candles for ambiguous bars: {failure.error}")
+    minute = cache.read(INSTRUMENT, "M1", "B", mmap=True)
+
+    def load(start: int, end: int) -> Candles:
+        return minute.between(start, end)
+
+    return load
+
+
+def configure_broker(broker: bt.brokers.BackBroker) -> None:
+    broker.setcommission(commission=0.0)
+
+
+def build_cerebro(
+    candles: Candles,
+    stdstats: bool = True,
+    data_kwargs: dict | None = None,
+    fine: Callable[[int, int], Candles] | None = None,
+    **params,
+) -> bt.Cerebro:
+    """
+    `data_kwargs` replaces DATA_KWARGS on the feed, e.g. for other timeframes.
+    With `fine` (see `fine_loader`), bars that hit both a bracket's stop and
+    target are settled on finer bars.
+    """
+    data_kwargs = data_kwargs or DATA_KWARGS
+    cerebro = bt.Cerebro(stdstats=stdstats)
+    if fine is not None:
+        granularity = GRANULARITIES[
+            data_kwargs["timeframe"], data_kwargs["compression"]
+        ]
+        cerebro.broker = IntrabarBroker(
+            fine=fine, seconds=GRANULARITY_SECONDS[granularity]
+        )
+    cerebro.addstrategy(ORBStrategy, **params)
+    cerebro.broker.setcash(CASH)
+    configure_broker(cerebro.broker)
     cerebro.addsizer(SizerCls, percents=1.0)
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe")
-    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="tradeanalyzer")
-    cerebro.addanalyzer(bt.analyzers.Transactions, _name="transactions")
-
-    storekwargs = dict(
-        account=OANDA_ACCOUNT_ID,
-        token=OANDA_API_KEY,
-        practice=True,
-    )
-    store = StoreCls(**storekwargs)
-
-    logging.info("Connected to OANDA")
-
-    instrument = "US30_USD"
-
-    data0kwargs = dict(
-        timeframe=TimeFrame.Minutes,
-        compression=15,
-        fromdate=bt.datetime.datetime(2024, 1, 1),
-        todate=bt.datetime.datetime(2025, 8, 31),
-        tz=pytz.timezone("US/Eastern"),
-        backfill_start=True,
-        backfill=True,
-        bidask=True,
-        useask=False,
-        qcheck=0.5,
-        historical=True,
-    )
-    data0 = store.getdata(dataname=instrument, **data0kwargs)
-    cerebro.adddata(data0)
+    cerebro.addanalyzer(metrics.Recorder, _name="metrics")
+    cerebro.adddata(CandlesData(dataname=candles, **data_kwargs))
+    return cerebro
+
+
+def backtest(candles: Candles, export: str | None = None, **params) -> dict:
+    """
+    One run without observers, for sweeps. `export` is a directory to stream
+    fills, trades and equity to as Parquet. Combinations that have been run
+    before come from the result store.
+    """
+    cerebro = build_cerebro(candles, stdstats=False, **params)
+    if export:
+        cerebro.addanalyzer(ParquetExport, directory=export)
+    recorded, _ = ResultStore().run(cerebro)
+    return metrics.compute(**recorded)
+
+
+def sweep(
+    candles: Candles, processes: int | None = None, export: str | None = None
+) -> pd.DataFrame:
+    """
+    With `export`, every combination streams its outputs to a numbered
+    subdirectory of it, listed in the export column of the results.
+    """
+    combinations = grid(**SWEEP_GRID)
+    if export:
+        for i, params in enumerate(combinations):
+            params["export"] = os.path.join(export, f"{i:03d}")
+    return run_sweep(backtest, candles, combinations, processes)
+
+
+def segment_backtest(
+    candles: Candles,
+    start: int,
+    end: int,
+    calendars: dict[time, SessionCalendar] | None = None,
+    **params,
+) -> dict:
+    """
+    One run over the bars in [start, end), for walk-forward segments. The feed
+    is given all of `candles` and skips to `start`, so its bar numbers are the
+    whole history's and `calendars` (by open time), built once from all of
+    `candles`, serve every segment instead of each run finding its opening
+    bars again.
+    """
+    local = lambda epoch: datetime.fromtimestamp(epoch, TZ).replace(tzinfo=None)
+    data_kwargs = dict(DATA_KWARGS, fromdate=local(start), todate=local(end - 1))
+    if calendars is not None:
+        params["calendar"] = calendars[params["open_time"]]
+    cerebro = build_cerebro(candles, stdstats=False, data_kwargs=data_kwargs, **params)
+    recorded, _ = ResultStore().run(cerebro)
+    return recorded
+
+
+def walk(
+    candles: Candles,
+    train_months: int,
+    test_months: int = 1,
+    processes: int | None = None,
+) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Walk-forward over SWEEP_GRID on monthly segments, optimising Sharpe over
+    `train_months` and trading the winner for the following `test_months`.
+    """
+    bounds = month_bounds(DATA_KWARGS["fromdate"], DATA_KWARGS["todate"], TZ)
+    calendars = {
+        open_time: SessionCalendar(candles, TZ, open_time=open_time)
+        for open_time in SWEEP_GRID["open_time"]
+    }
+    return walk_forward(
+        partial(segment_backtest, calendars=calendars),
+        candles,
+        grid(**SWEEP_GRID),
+        bounds,
+        train=train_months,
+        test=test_months,
+        processes=processes,
+    )
+
+
+class Latencies:
+    """
+    The last `capacity` latencies in nanoseconds, in a preallocated ring like
+    common.journal's, so a long stream doesn't grow them. `count` keeps
+    counting past the capacity.
+    """
+
+    def __init__(self, capacity: int = 1 << 16) -> None:
+        self._values = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+
+    def append(self, latency: int) -> None:
+        self._values[self.count % len(self._values)] = latency
+        self.count += 1
+
+    def __len__(self) -> int:
+        return min(self.count, len(self._values))
+
+    def values(self) -> np.ndarray:
+        """
+        The kept latencies, in no particular order (a view).
+        """
+        return self._values[: len(self)]
+
+
+class LiveORB:
+    """
+    ORBStrategy's long bracket on the live pricing stream.
+
+    The opening range is built from the bid of every tick in the
+    `window` seconds from `open_time`, rather than from the bar after it, and
+    the bracket order is rendered to request bytes again whenever the range
+    moves, so the first tick or heartbeat at or after the end of the window
+    only has to write them. The order is a STOP entry with its stop loss and
+    take profit attached, good until the 17:00 New York close like the
+    backtest's DAY orders. One per day.
+
+    Latencies in nanoseconds, from a stream line being read:
+    """
+
+    """
+    to being handled, for the last lines
+    """
+    tick: Latencies
+
+    """
+    to the order being written, and to its response, for the last orders
+    """
+    sent: Latencies
+    acked: Latencies
+
+    def __init__(
+        self,
+        connection: Connection,
+        account: str,
+        open_time: time = time(9, 30),
+        entry_offset: float = 5.0,
+        r: float = 1.5,
+        units: int = 1,
+        window: int = 15 * 60,
+        precision: int = 1,
+    ) -> None:
+        self.connection = connection
+        self.path = f"/v3/accounts/{account}/orders"
+        self.open_time = open_time
+        self.entry_offset = entry_offset
+        self.r = r
+        self.units = units
+        self.window = window
+        self.precision = precision
+        self.tick, self.sent, self.acked = Latencies(), Latencies(), Latencies()
+        self.orders = 0
+        self._acks: set[asyncio.Task] = set()
+        self._start = self._end = self._close = self._midnight = 0.0
+        self._high = self._low = None
+        self._staged: bytes | None = None
+
+    def _new_day(self, now: float) -> None:
+        day = datetime.fromtimestamp(now, TZ).date()
+        local = lambda d, t: TZ.localize(datetime.combine(d, t)).timestamp()
+        self._start = local(day, self.open_time)
+        self._end = self._start + self.window
+        self._close = local(day, time(17))
+        self._midnight = local(day + bt.datetime.timedelta(days=1), time(0))
+        self._high = self._low = None
+        self._staged = None
+
+    def stage(self) -> None:
+        """
+        Renders the order for the range so far.
+        """
+        open_range = self._high - self._low
+        entry = self._high + self.entry_offset
+        price = lambda value: f"{value:.{self.precision}f}"
+        order = {
+            "type": "STOP",
+            "instrument": INSTRUMENT,
+            "units": str(self.units),
+            "price": price(entry),
+            "timeInForce": "GTD",
+            "gtdTime": f"{self._close:.9f}",
+            "positionFill": "DEFAULT",
+            "triggerCondition": "BID",
+            "stopLossOnFill": {"price": price(entry - open_range)},
+            "takeProfitOnFill": {"price": price(entry + self.r * open_range)},
+        }
+        self._staged = self.connection.prepare("POST", self.path, {"order": order})
+
+    async def on_line(self, received: int, line: bytes) -> None:
+        message = json.loads(line)
+        now = float(message["time"])
+        if now >= self._midnight:
+            self._new_day(now)
+        if now >= self._end:
+            if self._staged is not None:
+                await self.send(received)
+        elif now >= self._start and message["type"] == "PRICE":
+            bid = float(message["bids"][0]["price"])
+            if self._high is None or bid > self._high or bid < self._low:
+                self._high = bid if self._high is None else max(self._high, bid)
+                self._low = bid if self._low is None else min(self._low, bid)
+                self.stage()
+        self.tick.append(clock.perf_counter_ns() - received)
+
+    async def send(self, received: int) -> None:
+        staged, self._staged = self._staged, None
+        try:
+            await self.connection.send(staged)
+        except ConnectionError:
+            # an idle keep-alive connection may have been dropped
+            await self.connection.close()
+            await self.connection.send(staged)
+        self.sent.append(clock.perf_counter_ns() - received)
+        self.orders += 1
+        task = asyncio.create_task(self.ack(received))
+        self._acks.add(task)
+        task.add_done_callback(self._acks.discard)
+
+    async def ack(self, received: int) -> None:
+        status, body = await self.connection.response()
+        self.acked.append(clock.perf_counter_ns() - received)
+        if status != 201:
+            logging.error(f"Order rejected ({status}): {body}")
+            return
+        transaction = body["orderCreateTransaction"]
+        logging.info(
+            f"Order {transaction['id']}: {transaction['units']} @ "
+            f"{transaction['price']}, SL {transaction['stopLossOnFill']['price']}, "
+            f"TP {transaction['takeProfitOnFill']['price']}"
+        )
+
+    async def drain(self) -> None:
+        if self._acks:
+            await asyncio.wait(self._acks)
+
+
+def latency_percentiles(latencies: Latencies) -> str:
+    if not len(latencies):
+        return "n/a"
+    us = np.percentile(latencies.values() / 1e3, [50, 90, 99, 100])
+    return ", ".join(
+        f"{name} {value:.0f}us" for name, value in zip(("p50", "p90", "p99", "max"), us)
+    )
+
+
+async def live(
+    days: int | None = None, seconds: float | None = None, **params
+) -> LiveORB:
+    """
+    Trades `LiveORB` on the pricing stream of OANDA_ACCOUNT_ID (the first
+    account otherwise) until `days` orders have been sent or `seconds` have
+    passed, whichever comes first, and logs the latencies.
+    """
+    connection = Connection.from_env()
+    await connection.open()
+    account = os.getenv("OANDA_ACCOUNT_ID")
+    if not account:
+        status, body = await connection.request("GET", "/v3/accounts")
+        if status != 200 or not body.get("accounts"):
+            raise ConnectionError(f"No accounts ({status}): {body}")
+        account = body["accounts"][0]["id"]
+    strategy = LiveORB(connection, account, **params)
+    logging.info(f"Streaming {INSTRUMENT} prices for account {account}")
+
+    async def consume():
+        async for received, line in pricing_stream(account, [INSTRUMENT]):
+            await strategy.on_line(received, line)
+            if days is not None and strategy.orders >= days:
+                return
+
+    try:
+        await asyncio.wait_for(consume(), seconds)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await strategy.drain()
+        await connection.close()
+
+    logging.info(f"Orders sent: {strategy.orders}, ticks: {strategy.tick.count}")
+    logging.info(f"Tick handling: {latency_percentiles(strategy.tick)}")
+    logging.info(f"Tick to order sent: {latency_percentiles(strategy.sent)}")
+    logging.info(f"Tick to order acknowledged: {latency_percentiles(strategy.acked)}")
+    return strategy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Opening range breakout backtest")
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="run every combination in SWEEP_GRID across a process pool",
+    )
+    parser.add_argument(
+        "--walk-forward",
+        action="store_true",
+        help="walk-forward optimise SWEEP_GRID on monthly windows",
+    )
+    parser.add_argument(
+        "--train-months", type=int, default=6, help="walk-forward in-sample months"
+    )
+    parser.add_argument(
+        "--test-months", type=int, default=1, help="walk-forward out-of-sample months"
+    )
+    parser.add_argument(
+        "--processes", type=int, default=None, help="sweep worker count"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="replay the local candle cache without connecting to OANDA",
+    )
+    parser.add_argument(
+        "--journal", metavar="PATH", help="save the strategy's event journal (.npy)"
+    )
+    parser.add_argument(
+        "--export",
+        metavar="DIR",
+        help="stream fills/trades/equity to Parquet files in DIR",
+    )
+    parser.add_argument(
+        "--intrabar",
+        action="store_true",
+        help="settle bars that hit both a bracket's stop and target on M1",
+    )
+    parser.add_argument(
+        "--monte-carlo",
+        metavar="PATHS",
+        type=int,
+        nargs="?",
+        const=100_000,
+        help="resample the trades into PATHS sequences (100000 by default)",
+    )
+    parser.add_argument(
+        "--mc-method", choices=("bootstrap", "shuffle"), default="bootstrap"
+    )
+    parser.add_argument(
+        "--no-memo",
+        action="store_true",
+        help="run the backtest even if the result store already has it",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        nargs="?",
+        const="orb.folded",
+        help="time every phase and callback and save folded stacks for a "
+        "flamegraph to PATH (orb.folded by default)",
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="trade the opening range on the OANDA pricing stream",
+    )
+    parser.add_argument(
+        "--live-days", type=int, help="stop live trading after this many orders"
+    )
+    parser.add_argument(
+        "--live-seconds", type=float, help="stop live trading after this long"
+    )
+    args = parser.parse_args()
+
+    if args.live:
+        asyncio.run(
+            live(
+                args.live_days,
+                args.live_seconds,
+                open_time=time(9, 30),
+                entry_offset=5.0,
+                r=1.5,
+            )
+        )
+        return
+
+    profiler = Profiler(enabled=args.profile is not None)
+    profiler.instrument_fetch()
+    with profiler.phase("load"):
+        candles = load_candles(offline=args.offline)
+
+    if args.sweep:
+        logging.info(f"Sweeping {len(grid(**SWEEP_GRID))} parameter combinations")
+        with profiler.phase("sweep"):
+            results = sweep(candles, args.processes, args.export)
+        profiler.report(args.profile)
+        results = results.sort_values("sharpe", ascending=False, na_position="last")
+        logging.info(f"Sweep results:\n{results.to_string(index=False)}")
+        return
+
+    if args.walk_forward:
+        with profiler.phase("walk-forward"):
+            windows, equity = walk(
+                candles, args.train_months, args.test_months, args.processes
+            )
+        profiler.report(args.profile)
+        logging.info(f"Walk-forward windows:\n{windows.to_string(index=False)}")
+        if len(equity):
+            returns = equity.pct_change().fillna(equity.iloc[0] - 1).to_numpy()
+            logging.info(
+                f"Out-of-sample return: {(equity.iloc[-1] - 1) * 100:.2f}%, "
+                f"Sharpe: {metrics.sharpe(returns)}"
+            )
+        return
+
+    journal = Journal()
+    cerebro = build_cerebro(
+        candles,
+        fine=(
+            fine_loader(
+                candles,
+                offline=args.offline,
+                open_time=time(9, 30),
+                entry_offset=5.0,
+                r=1.5,
+            )
+            if args.intrabar
+            else None
+        ),
+        open_time=time(9, 30),
+        entry_offset=5.0,
+        r=1.5,
+        journal=journal,
+    )
+    if args.export:
+        cerebro.addanalyzer(ParquetExport, directory=args.export)
 
     logging.info("Data feed(s) added")
 
     logging.info(f"Starting Portfolio Value: {cerebro.broker.getvalue():.2f}")
 
+    # a profile needs the run itself, not the stored results
     logging.info("Running the strategy")
-    results = cerebro.run()
-    logging.info("Strategy run completed")
-
-    strat = results[0]
+    profiler.instrument(cerebro)
+    with profiler.phase("run"):
+        recorded, stored = ResultStore().run(
+            cerebro, fresh=args.no_memo or profiler.enabled
+        )
+    if stored:
+        logging.info("Unchanged since the last run, results from the result store")
+    else:
+        logging.info("Strategy run completed")
+    profiler.report(args.profile, bars=sum(data.buflen() for data in cerebro.datas))
+    log_journal(journal, args.journal)
+
+    equity = recorded["equity"]
+    final = equity[-1] if len(equity) else cerebro.broker.startingcash
+    logging.info(f"Final Portfolio Value: {final:.2f}")
+    if args.intrabar:
+        broker = cerebro.broker
+        logging.info(
+            f"Ambiguous bars: {broker.ambiguous}, settled on M1: {broker.resolved}, "
+            f"of which went to the target: {broker.targets}"
+        )
+
+    stats = metrics.compute(**recorded)
+
+    logging.info(
+        f"Sharpe Ratio: {stats['sharpe'] if stats['sharpe'] is not None else 'N/A'}"
+    )
+    logging.info(
+        f"Drawdown: {stats['max_drawdown'] if stats['max_drawdown'] is not None else 'N/A'}%"
+    )
+    logging.info(f"Total Trades: {stats['trades']}")
 
-    logging.info(f"Final Portfolio Value: {cerebro.broker.getvalue():.2f}")
+    if stats["win_rate"] is not None:
+        logging.info(f"Win Rate: {stats['win_rate']:.2f}%")
+    else:
+        logging.info("Win Rate: N/A (no trades)")
 
-    sharpe = strat.analyzers.sharpe.get_analysis()
-    drawdown = strat.analyzers.drawdown.get_analysis()
-    tradeanalyzer = strat.analyzers.tradeanalyzer.get_analysis()
-    transactions = strat.analyzers.transactions.get_analysis()
+    logging.info(
+        f"Sortino Ratio: {stats['sortino'] if stats['sortino'] is not None else 'N/A'}"
+    )
+    logging.info(f"Longest Drawdown: {stats['max_drawdown_days']:.1f} days")
+    logging.info(
+        f"Profit Factor: {stats['profit_factor'] if stats['profit_factor'] is not None else 'N/A'}"
+    )
+    logging.info(
+        f"Expectancy: {stats['expectancy'] if stats['expectancy'] is not None else 'N/A'}"
+    )
+    logging.info(f"Time in Market: {stats['time_in_market']:.2f}%")
+
+    if args.monte_carlo:
+        log_monte_carlo(
+            monte_carlo(
+                recorded["pnl"],
+                cerebro.broker.startingcash,
+                args.monte_carlo,
+                method=args.mc_method,
+            )
+        )
 
-    logging.info(f"Sharpe Ratio: {sharpe.get('sharperatio', 'N/A')}")
-    logging.info(f"Drawdown: {drawdown.get('max', {}).get('drawdown', 'N/A')}%")
-    logging.info(f"Total Trades: {tradeanalyzer.get('total', {}).get('total', 0)}")
 
-    winners = tradeanalyzer.get("won", {}).get("total", 0)
-    losers = tradeanalyzer.get("lost", {}).get("total", 0)
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
 
-    if winners + losers > 0:
-        win_rate = winners / (winners + losers) * 100
-        logging.info(f"Win Rate: {win_rate:.2f}%")
-    else:
-        logging.info("Win Rate: N/A (no trades)")
+    main()
@@ -0,0 +1,193 @@
+"""
+Runs PriorDayReversal over a basket of instruments, one process each.
+
+    python prolefoto/basket.py                                # BASKET below
+    python prolefoto/basket.py XAU_USD SPX500_USD:2020-01-01:2025-01-01
+
+Every instrument's minute history is brought up to date in the candle cache
+first. The workers then memory-map it from the cache, so the bars are shared
+through the page cache instead of being pickled, and only the runs themselves
+compete for cores. Each instrument trades its own CASH; the portfolio is their
+sum.
+
+Nothing is converted between currencies: every leg's broker value is in its
+instrument's quote currency, and the portfolio adds them up as if they were
+all USD. Legs quoted in anything else (DE30_EUR, UK100_GBP, USD_JPY in BASKET)
+are logged as such, and their share of the portfolio is off by the exchange
+rate.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# allow running as `python prolefoto/basket.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import metrics
+from common.cache import CandleCache
+from common.candles import DAY
+from prolefoto import prior_day_reversal as pdr
+
+BASKET = [
+    "XAU_USD",
+    "XAG_USD",
+    "SPX500_USD",
+    "NAS100_USD",
+    "US30_USD",
+    "US2000_USD",
+    "DE30_EUR",
+    "UK100_GBP",
+    "JP225_USD",
+    "WTICO_USD",
+    "BCO_USD",
+    "NATGAS_USD",
+    "EUR_USD",
+    "GBP_USD",
+    "USD_JPY",
+]
+
+
+def parse_leg(leg: str) -> tuple[str, datetime, datetime]:
+    """
+    "INSTRUMENT" or "INSTRUMENT:YYYY-MM-DD:YYYY-MM-DD", the dates defaulting
+    to DATA0_KWARGS'.
+    """
+    instrument, *dates = leg.split(":")
+    fromdate = pdr.DATA0_KWARGS["fromdate"]
+    todate = pdr.DATA0_KWARGS["todate"]
+    if dates:
+        fromdate, todate = (datetime.fromisoformat(d) for d in dates)
+    return instrument, fromdate, todate
+
+
+def run_leg(instrument: str, fromdate: datetime, todate: datetime, root: str) -> dict:
+    """
+    Backtests one instrument from the cache (no fetching) and returns its
+    stats plus its daily equity.
+    """
+    minute, levels = pdr.load_candles(
+        CandleCache(root),
+        offline=True,
+        instrument=instrument,
+        fromdate=fromdate,
+        todate=todate,
+    )
+    if len(minute) == 0:
+        raise ValueError(f"no cached M1 candles from {fromdate} to {todate}")
+    data_kwargs = dict(pdr.DATA0_KWARGS, fromdate=fromdate, todate=todate)
+    cerebro = pdr.build_cerebro(minute, levels, data_kwargs=data_kwargs)
+    recorded = cerebro.run()[0].analyzers.metrics.get_analysis()
+    days, equity = metrics.daily_equity(recorded["times"], recorded["equity"])
+    return dict(
+        instrument=instrument,
+        bars=len(minute),
+        **metrics.compute(**recorded),
+        days=days,
+        equity=equity,
+    )
+
+
+def portfolio(results: list[dict]) -> dict:
+    """
+    Stats of the summed daily equity of every leg, holding each one's last
+    value on days it didn't trade (and CASH before it started). Drawdown is
+    on daily closes, so it can read shallower than the legs' own. The legs'
+    values are assumed to be in USD.
+    """
+    days = np.unique(np.concatenate([r["days"] for r in results]))
+    total = np.zeros(len(days))
+    for r in results:
+        held = np.searchsorted(r["days"], days, side="right") - 1
+        total += np.where(held >= 0, r["equity"][np.maximum(held, 0)], pdr.CASH)
+    times = days * DAY
+    closes = np.concatenate([[pdr.CASH * len(results)], total])
+    returns = closes[1:] / closes[:-1] - 1
+    max_drawdown, max_drawdown_days = metrics.drawdown(times, total)
+    return dict(
+        instrument="portfolio",
+        final_value=float(total[-1]) if len(total) else None,
+        sharpe=metrics.sharpe(returns),
+        sortino=metrics.sortino(returns),
+        max_drawdown=max_drawdown,
+        max_drawdown_days=max_drawdown_days,
+        trades=sum(r["trades"] for r in results),
+        won=sum(r["won"] for r in results),
+        lost=sum(r["lost"] for r in results),
+        net_pnl=sum(r["net_pnl"] for r in results),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prior day reversal basket")
+    parser.add_argument(
+        "legs",
+        nargs="*",
+        metavar="INSTRUMENT[:FROM:TO]",
+        help="instruments to run, BASKET by default",
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="use whatever is cached without connecting to OANDA",
+    )
+    args = parser.parse_args()
+
+    legs = [parse_leg(leg) for leg in args.legs or BASKET]
+    cache = CandleCache()
+
+    if not args.offline:
+        for instrument, fromdate, todate in legs:
+            warmup, _, end = pdr.history_bounds(fromdate, todate)
+            failures = cache.update(instrument, "M1", "B", warmup, end)
+            for failure in failures:
+                logging.warning(f"{instrument}: {failure.error}")
+
+    foreign = [i for i, _, _ in legs if not i.endswith("_USD")]
+    if foreign:
+        logging.warning(
+            f"Not quoted in USD but summed as if they were: {', '.join(foreign)}"
+        )
+
+    logging.info(f"Running {len(legs)} instrument(s)")
+    with ProcessPoolExecutor(args.processes) as pool:
+        futures = [
+            pool.submit(run_leg, instrument, fromdate, todate, str(cache.root))
+            for instrument, fromdate, todate in legs
+        ]
+        results = []
+        for (instrument, _, _), future in zip(legs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logging.error(f"{instrument} failed: {e}")
+
+    if not results:
+        return
+
+    report = pd.DataFrame(
+        [{k: v for k, v in r.items() if k not in ("days", "equity")} for r in results]
+        + [portfolio(results)]
+    )
+    logging.info(
+        f"Basket report (legs summed as USD-quoted):\n{report.to_string(index=False)}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    try:
+        main()
+    except KeyboardInterrupt:
+        print()  # hack to move to next line
+        logging.info("Process interrupted by user. Exiting...")
@@ -1,30 +1,100 @@
-import csv
+import argparse
 import logging
 import os
+import sys
+from datetime import datetime, time, timedelta
 
 import backtrader as bt
-import btoandav20 as btv20
+import numpy as np
 import pandas as pd
 import pytz
 from backtrader import TimeFrame
 
+# allow running as `python prolefoto/prior_day_reversal.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import metrics
+from common.cache import CandleCache
+from common.candles import Candles
+from common.export import ParquetExport
+from common.feeds import CandlesData
+from common.journal import Journal, log_journal
+from common.memo import ResultStore
+from common.oanda import to_epoch
+from common.profile import Profiler
+from common.robustness import log_monte_carlo, monte_carlo
+from common.sessions import (
+    CLOSE,
+    NEW_DAY,
+    OPEN,
+    PriorDayIndex,
+    SessionCalendar,
+    feed_calendar,
+)
+
 # > This is just trading reversals of previous day high/low on ES and GC.
 # >
 # > 1. mark out the previous day high and low
 # > 2. enter short if price taps PDH, enter long if price tals PDL.
 
-StoreCls = btv20.stores.OandaV20Store
-DataCls = btv20.feeds.OandaV20Data
 
+# swap which instrument is commented here to change the instrument
+INSTRUMENT = "XAU_USD"
+# INSTRUMENT = "SPX500_USD"
+
+TZ = pytz.timezone("US/Eastern")
+
+STRATEGY_KWARGS = dict(stop_loss_perc=0.1, profit_target_perc=0.5)
+CASH = 100000.0
+
+DATA0_KWARGS = dict(
+    timeframe=TimeFrame.Minutes,
+    compression=1,
+    fromdate=bt.datetime.datetime(2024, 1, 1),
+    todate=bt.datetime.datetime(2024, 12, 31),
+    tz=TZ,
+)
+# sessions roll over at 17:00 New York, same as OANDA's daily candles
+ROLLOVER = time(17, 0)
+# extra minute history before fromdate so the first day has a prior session,
+# long enough to get over a weekend plus a holiday
+LEVELS_WARMUP = timedelta(days=7)
+
+
+def history_bounds(
+    fromdate: datetime | None = None, todate: datetime | None = None
+) -> tuple[int, int, int]:
+    """
+    Epoch seconds of the start of the warm-up, fromdate and todate (New York
+    wall clock, DATA0_KWARGS' by default).
+    """
+    start = to_epoch(TZ.localize(fromdate or DATA0_KWARGS["fromdate"]))
+    end = to_epoch(TZ.localize(todate or DATA0_KWARGS["todate"]))
+    return start - int(LEVELS_WARMUP.total_seconds()), start, end
+
+
+def load_candles(
+    cache: CandleCache | None = None,
+    offline: bool = False,
+    instrument: str = INSTRUMENT,
+    fromdate: datetime | None = None,
+    todate: datetime | None = None,
+) -> tuple[Candles, PriorDayIndex]:
+    """
+    Minute bid candles (same as bidask=True/useask=False on the OANDA store
+    feed) and the prior-day levels built from them. `offline` replays
+    whatever is cached, memory-mapped, without fetching.
+    """
+    cache = cache or CandleCache()
+    warmup, start, end = history_bounds(fromdate, todate)
+    history = cache.load(
+        instrument, "M1", "B", warmup, end, fetch=not offline, mmap=offline
+    )
+    return history.between(start, end), PriorDayIndex(history, TZ, ROLLOVER)
 
-def main():
-    logging.info("Starting Prior Day Reversal Strategy")
-    cerebro = bt.Cerebro()
 
-    # Add a strategy
-    cerebro.addstrategy(PriorDayReversal, stop_loss_perc=0.1, profit_target_perc=0.5)
-    cerebro.broker.setcash(100000.0)
-    cerebro.broker.setcommission(
+def configure_broker(broker: bt.brokers.BackBroker) -> None:
+    broker.setcommission(
         commission=0.0,
         leverage=20.0,
         margin=0.5,
@@ -32,135 +102,182 @@ def main():
         stocklike=False,
         interest=0.0,
     )
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe")
-    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="tradeanalyzer")
-    cerebro.addanalyzer(bt.analyzers.Transactions, _name="transactions")
+
+
+def build_cerebro(
+    minute: Candles,
+    levels: PriorDayIndex,
+    data_kwargs: dict | None = None,
+    journal: Journal | None = None,
+    calendar: SessionCalendar | None = None,
+) -> bt.Cerebro:
+    """
+    `data_kwargs` replaces DATA0_KWARGS on the feed, e.g. for other timeframes.
+    `calendar` is `minute`'s, the strategy builds it if not given.
+    """
+    data_kwargs = data_kwargs or DATA0_KWARGS
+    cerebro = bt.Cerebro()
+
+    # Add a strategy
+    cerebro.addstrategy(
+        PriorDayReversal,
+        levels=levels,
+        journal=journal,
+        calendar=calendar,
+        **STRATEGY_KWARGS,
+    )
+    cerebro.broker.setcash(CASH)
+    configure_broker(cerebro.broker)
+    cerebro.addanalyzer(metrics.Recorder, _name="metrics")
 
     # Data feed
-    storeargs = dict(
-        account=os.getenv("OANDA_ACCOUNT_ID"),
-        token=os.getenv("OANDA_API_KEY"),
-        practice=True,
+    cerebro.adddata(CandlesData(dataname=minute, **data_kwargs))
+    return cerebro
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prior day reversal backtest")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--fast", action="store_true", help="use the vectorised fast path"
     )
-    store = StoreCls(**storeargs)
-    logging.info("Connected to OANDA")
-
-    # swap which instrument is commented here to change the instrument
-    instrument = "XAU_USD"
-    # instrument = "SPX500_USD"
-
-    data0kwargs = dict(
-        timeframe=TimeFrame.Minutes,
-        compression=1,
-        fromdate=bt.datetime.datetime(2024, 1, 1),
-        todate=bt.datetime.datetime(2024, 12, 31),
-        tz=pytz.timezone("US/Eastern"),
-        backfill_start=True,
-        backfill=True,
-        bidask=True,
-        useask=False,
-        qcheck=0.5,
-        historical=True,
+    mode.add_argument(
+        "--parity",
+        action="store_true",
+        help="run both the fast path and backtrader and diff their trades",
     )
-    data0 = store.getdata(dataname=instrument, **data0kwargs)
-    cerebro.adddata(data0)
-
-    data1kwargs = dict(
-        timeframe=TimeFrame.Days,
-        compression=1,
-        fromdate=bt.datetime.datetime(2023, 12, 31),
-        todate=bt.datetime.datetime(2024, 12, 31),
-        tz=pytz.timezone("US/Eastern"),
-        backfill_start=True,
-        backfill=True,
-        bidask=True,
-        useask=False,
-        qcheck=0.5,
-        historical=True,
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="replay the local candle cache without connecting to OANDA",
     )
-    data1 = store.getdata(dataname=instrument, **data1kwargs)
-    cerebro.adddata(data1)
-
-    logging.info("Data feeds added")
-
-    logging.info(f"Starting Portfolio Value: {cerebro.broker.getvalue():.2f}")
+    parser.add_argument(
+        "--journal", metavar="PATH", help="save the strategy's event journal (.npy)"
+    )
+    parser.add_argument(
+        "--export",
+        metavar="DIR",
+        default="prior_day_reversal_output",
+        help="directory for the fills/trades/equity Parquet files",
+    )
+    parser.add_argument(
+        "--monte-carlo",
+        metavar="PATHS",
+        type=int,
+        nargs="?",
+        const=100_000,
+        help="resample the trades into PATHS sequences (100000 by default)",
+    )
+    parser.add_argument(
+        "--mc-method", choices=("bootstrap", "shuffle"), default="bootstrap"
+    )
+    parser.add_argument(
+        "--no-memo",
+        action="store_true",
+        help="run the backtest even if the result store already has it",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        nargs="?",
+        const="prior_day_reversal.folded",
+        help="time every phase and callback and save folded stacks for a "
+        "flamegraph to PATH (prior_day_reversal.folded by default)",
+    )
+    parser.add_argument("--plot", action="store_true", help="plot the run")
+    args = parser.parse_args()
 
-    # Run the strategy
-    logging.info("Running the strategy")
-    results = cerebro.run()
-    logging.info("Strategy run completed")
+    logging.info("Starting Prior Day Reversal Strategy")
 
-    strat = results[0]
+    profiler = Profiler(enabled=args.profile is not None)
+    profiler.instrument_fetch()
+    with profiler.phase("load"):
+        minute, levels = load_candles(offline=args.offline)
 
-    logging.info(f"Final Portfolio Value: {cerebro.broker.getvalue():.2f}")
+    if args.fast:
+        with profiler.phase("fast"):
+            trades = fast_backtest(minute, levels, **STRATEGY_KWARGS)
+        profiler.report(args.profile, bars=len(minute), over="fast")
+        log_fast_summary(trades)
+        return
 
-    sharpe = strat.analyzers.sharpe.get_analysis()
-    drawdown = strat.analyzers.drawdown.get_analysis()
-    tradeanalyzer = strat.analyzers.tradeanalyzer.get_analysis()
-    transactions = strat.analyzers.transactions.get_analysis()
+    if args.parity:
+        with profiler.phase("parity"):
+            parity(minute, levels)
+        profiler.report(args.profile)
+        return
 
-    logging.debug(f"Sharpe Ratio: {type(sharpe)}")
-    logging.debug(f"Drawdown: {type(drawdown)}")
-    logging.debug(f"Trade Analyzer: {type(tradeanalyzer)}")
-    logging.debug(f"Transactions: {type(transactions)}")
+    journal = Journal()
+    cerebro = build_cerebro(minute, levels, journal=journal)
+    cerebro.addanalyzer(ParquetExport, _name="export", directory=args.export)
 
-    winners = tradeanalyzer.won.total if tradeanalyzer.won.total else 0
-    losers = tradeanalyzer.lost.total if tradeanalyzer.lost.total else 0
+    logging.info("Data feeds added")
 
-    logging.info(f"Sharpe Ratio: {sharpe.get('sharperatio', 'N/A')}")
+    logging.info(f"Starting Portfolio Value: {cerebro.broker.getvalue():.2f}")
 
-    logging.info(f"Max Drawdown: {drawdown.max.drawdown:.2f}%")
+    # Run the strategy, or reuse the last run's results if nothing changed.
+    # plotting and profiling need the run itself
+    logging.info("Running the strategy")
+    profiler.instrument(cerebro)
+    with profiler.phase("run"):
+        recorded, stored = ResultStore().run(
+            cerebro, fresh=args.no_memo or args.plot or profiler.enabled
+        )
+    if stored:
+        logging.info("Unchanged since the last run, results from the result store")
+    else:
+        logging.info("Strategy run completed")
+    profiler.report(args.profile, bars=len(minute))
+    log_journal(journal, args.journal)
+
+    equity = recorded["equity"]
+    final = equity[-1] if len(equity) else CASH
+    logging.info(f"Final Portfolio Value: {final:.2f}")
+
+    stats = metrics.compute(**recorded)
 
     logging.info(
-        f"Trades executed: {tradeanalyzer.total.closed if tradeanalyzer.total.closed else 0}"
+        f"Sharpe Ratio: {stats['sharpe'] if stats['sharpe'] is not None else 'N/A'}"
     )
-    logging.info(f"Number of winning trades: {winners}")
-    logging.info(f"Number of losing trades: {losers}")
     logging.info(
-        f"Win rate: { (winners / (winners + losers) * 100) if (winners + losers) > 0 else 0:.2f}%"
+        f"Sortino Ratio: {stats['sortino'] if stats['sortino'] is not None else 'N/A'}"
     )
 
-    logging.info(
-        f"Average number of bars in the market: {tradeanalyzer.len.average if tradeanalyzer.len.average else 0}"
-    )
-    logging.info(
-        f"Longest time in the market: {tradeanalyzer.len.max if tradeanalyzer.len.max else 0} bars"
-    )
-    logging.info(
-        f"Shortest time in the market: {tradeanalyzer.len.min if tradeanalyzer.len.min else 0} bars"
-    )
+    logging.info(f"Max Drawdown: {stats['max_drawdown']:.2f}%")
+    logging.info(f"Longest Drawdown: {stats['max_drawdown_days']:.1f} days")
 
+    logging.info(f"Trades executed: {stats['trades']}")
+    logging.info(f"Number of winning trades: {stats['won']}")
+    logging.info(f"Number of losing trades: {stats['lost']}")
+    logging.info(f"Win rate: {stats['win_rate'] or 0:.2f}%")
+
+    logging.info(f"Average number of bars in the market: {stats['avg_bars']}")
+    logging.info(f"Longest time in the market: {stats['max_bars']} bars")
+    logging.info(f"Shortest time in the market: {stats['min_bars']} bars")
+    logging.info(f"Time in the market: {stats['time_in_market']:.2f}%")
+
+    logging.info(f"Net Profit: {stats['net_pnl']:.2f}")
     logging.info(
-        f"Net Profit: {tradeanalyzer.pnl.net.total if tradeanalyzer.pnl.net.total else 0:.2f}"
+        f"Profit Factor: {stats['profit_factor'] if stats['profit_factor'] is not None else 'N/A'}"
     )
     logging.info(
-        f"Profit Factor: {tradeanalyzer.pnl.net.total / abs(tradeanalyzer.pnl.net.total) if tradeanalyzer.pnl.net.total and tradeanalyzer.pnl.net.total < 0 else 'N/A'}"
+        f"Expectancy: {stats['expectancy'] if stats['expectancy'] is not None else 'N/A'}"
     )
 
-    # save transactions to csv
-    logging.info("Saving transactions to trades.csv")
-
-    # format the DF correctly
-    rows = []
-    for dt, row in transactions.items():
-        for trans in row:
-            rows.append(
-                {
-                    "date": dt,
-                    "amount": trans[0],
-                    "price": trans[1],
-                    # "sid": trans[2],
-                    "symbol": trans[3],
-                    "value": trans[4],
-                }
+    if args.monte_carlo:
+        log_monte_carlo(
+            monte_carlo(
+                recorded["pnl"],
+                CASH,
+                args.monte_carlo,
+                method=args.mc_method,
             )
+        )
 
-    df = pd.DataFrame(rows)
-    df.to_csv("trades.csv")
-    logging.info("Transactions saved to trades.csv")
+    logging.info(f"Fills, trades and equity saved to {args.export}")
 
-    cerebro.plot()
+    if args.plot:
+        cerebro.plot()
 
 
 class PriorDayReversal(bt.Strategy):
@@ -168,15 +285,20 @@ class PriorDayReversal(bt.Strategy):
         stop_loss_perc=0.5,  # stop loss as a percentage of PDH-PDL range
         profit_target_perc=0.5,  # profit target as a percentage of PDH-PDL range
         risk_per_trade=0.01,  # risk per trade as a percentage of account equity
+        levels=None,  # PriorDayIndex with the prior session's high/low per date
+        journal=None,  # common.journal.Journal to record events into
+        calendar=None,  # common.sessions.SessionCalendar, the feed's by default
     )
 
     def __init__(self):
         self.dataclose = self.datas[0].close
-        self.datahigh = self.datas[1].high
-        self.datalow = self.datas[1].low
+        self.journal: Journal | None = self.p.journal
+        calendar = self.p.calendar
+        if calendar is None:
+            calendar = feed_calendar(self.datas[0])
+        self.events: list[int] = calendar.events
         self.pdh = None
         self.pdl = None
-        self.last_date = None
         self.long_orders = None
         self.short_orders = None
 
@@ -185,18 +307,17 @@ class PriorDayReversal(bt.Strategy):
         logging.info(f"Profit Target Percentage: {self.p.profit_target_perc * 100}%")
 
     def next(self):
-        dt = self.datas[0].datetime.date(0)
-        if self.last_date != dt:
-            self.last_date = dt
-            if len(self.datahigh) > 1 and len(self.datalow) > 1:
-                self.pdh = self.datahigh[-1]
-                self.pdl = self.datalow[-1]
+        events = self.events[self.datas[0].index()]
+        if events & NEW_DAY:
+            levels = self.p.levels.get(self.datas[0].datetime.date(0))
+            if levels is not None:
+                self.pdh, self.pdl, _ = levels
 
         if self.pdh is None or self.pdl is None:
             return
 
         # execute only at NY open (9:30 AM Eastern)
-        if self.datas[0].datetime.time(0) == bt.datetime.time(9, 30):
+        if events & OPEN:
             pdr = self.pdh - self.pdl
 
             long_entry_price = self.pdl
@@ -212,15 +333,6 @@ class PriorDayReversal(bt.Strategy):
                 / (pdr * self.p.stop_loss_perc)
             )
 
-            logging.debug(f"Lot size calculated: {lot_size}")
-
-            logging.debug(
-                f"{dt} - Long Entry: {long_entry_price:.2f}, Stop: {long_stop_price:.2f}, Limit: {long_limit_price:.2f}"
-            )
-            logging.debug(
-                f"{dt} - Short Entry: {short_entry_price:.2f}, Stop: {short_stop_price:.2f}, Limit: {short_limit_price:.2f}"
-            )
-
             self.long_orders = self.buy_bracket(
                 size=lot_size,
                 data=self.datas[0],
@@ -233,11 +345,6 @@ class PriorDayReversal(bt.Strategy):
                 valid=bt.Order.DAY,
             )
 
-            for o in self.long_orders:
-                logging.debug(
-                    f"Long order created: {o.created.size} @ {o.created.price} ({o.ref})"
-                )
-
             self.short_orders = self.sell_bracket(
                 size=lot_size,
                 data=self.datas[0],
@@ -250,13 +357,29 @@ class PriorDayReversal(bt.Strategy):
                 valid=bt.Order.DAY,
             )
 
-            for o in self.short_orders:
-                logging.debug(
-                    f"Short order created: {o.created.size} @ {o.created.price} ({o.ref})"
+            if self.journal is not None:
+                now = self.datas[0].datetime[0]
+                self.journal.bracket_placed(
+                    now,
+                    self.long_orders[0].ref,
+                    1,
+                    lot_size,
+                    long_entry_price,
+                    long_stop_price,
+                    long_limit_price,
+                )
+                self.journal.bracket_placed(
+                    now,
+                    self.short_orders[0].ref,
+                    -1,
+                    lot_size,
+                    short_entry_price,
+                    short_stop_price,
+                    short_limit_price,
                 )
 
         # cancel unfilled orders at the end of the day (4:00 PM Eastern) and flatten
-        if self.datas[0].datetime.time(0) == bt.datetime.time(16, 0):
+        if events & CLOSE:
             if self.long_orders:
                 for order in self.long_orders:
                     if order.status in [bt.Order.Submitted, bt.Order.Accepted]:
@@ -269,6 +392,12 @@ class PriorDayReversal(bt.Strategy):
                 self.short_orders = None
 
             if self.position != 0:
+                if self.journal is not None:
+                    self.journal.flatten(
+                        self.datas[0].datetime[0],
+                        -1 if self.position.size > 0 else 1,
+                        abs(self.position.size),
+                    )
                 self.close()
 
     def notify_order(self, order):
@@ -276,25 +405,301 @@ class PriorDayReversal(bt.Strategy):
             return
 
         if order.status in [order.Completed]:
+            if self.journal is not None:
+                self.journal.fill(
+                    self.datas[0].datetime[0],
+                    order.ref,
+                    1 if order.isbuy() else -1,
+                    abs(order.executed.size),
+                    order.executed.price,
+                )
             # cancel short entry if long entry is filled and vice versa
             # i hate manual OCO like this but backtrader's OCO handling is fucked
             if order.isbuy() and self.short_orders and self.position:
-                logging.debug(f"Long entry filled, cancelling short entry: {order.ref}")
                 for o in self.short_orders:
                     self.cancel(o)
                 self.short_orders = None
             elif order.issell() and self.long_orders and self.position:
-                logging.debug(f"Short entry filled, cancelling long entry: {order.ref}")
                 for o in self.long_orders:
                     self.cancel(o)
                 self.long_orders = None
 
+        elif order.status in [order.Canceled, order.Expired]:
+            if self.journal is not None:
+                self.journal.cancel(
+                    self.datas[0].datetime[0], order.ref, 1 if order.isbuy() else -1
+                )
         elif order.status in [order.Margin]:
             logging.warning(f"Margin issue with order {order.ref}")
         elif order.status in [order.Rejected]:
             logging.warning(f"Order Rejected: {order.ref}")
 
 
+SESSION_OPEN = time(9, 30)
+SESSION_CLOSE = time(16, 0)
+
+
+def _first(hit: np.ndarray) -> np.ndarray:
+    """
+    Column of the first True in each row, or the row width if there is none.
+    """
+    return np.where(hit.any(axis=1), hit.argmax(axis=1), hit.shape[1])
+
+
+def fast_backtest(
+    minute: Candles,
+    levels: PriorDayIndex,
+    stop_loss_perc: float = 0.5,
+    profit_target_perc: float = 0.5,
+    risk_per_trade: float = 0.01,
+    cash: float = CASH,
+    tz=TZ,
+    calendar: SessionCalendar | None = None,
+) -> pd.DataFrame:
+    """
+    PriorDayReversal without backtrader: every session is resolved at once
+    with array operations and only the position sizing walks day by day.
+
+    Mirrors what the strategy gets from backtrader's broker: PDH/PDL of the
+    session before each date from `levels`, both limit entries live from the
+    bar after 09:30, the first one to fill cancels the other, its stop and
+    target go live on the next bar (stop first if a bar reaches both), and
+    anything still open at the 16:00 bar is closed at the next bar's open.
+    Fills follow backtrader's rules for gaps through the order price.
+
+    Sessions where one bar fills both entries, or with no 16:00 bar, can't be
+    reproduced exactly. They come back with an exit_reason of "ambiguous" or
+    "no close bar" so `parity` can point at them.
+
+    `calendar` is `minute`'s, built with SESSION_OPEN and SESSION_CLOSE in
+    `tz` unless given. Returns one row per trade.
+    """
+    if calendar is None:
+        calendar = SessionCalendar(
+            minute, tz, open_time=SESSION_OPEN, close_time=SESSION_CLOSE
+        )
+    session = np.flatnonzero(calendar.open >= 0)
+    if len(session) == 0:
+        return pd.DataFrame()
+
+    pdh, pdl, _ = levels.lookup(calendar.days[session])
+    has_levels = ~np.isnan(pdh)
+    session, pdh, pdl = session[has_levels], pdh[has_levels], pdl[has_levels]
+    if len(session) == 0:
+        return pd.DataFrame()
+    pdr = pdh - pdl
+    opens = calendar.open[session]
+
+    # last bar the orders are live on: the 16:00 bar, or the day's last bar
+    has_close = calendar.close[session] >= 0
+    end = np.where(has_close, calendar.close[session], calendar.stop[session] - 1)
+
+    width = max(int((end - opens).max()), 1)
+    index = opens[:, None] + 1 + np.arange(width)[None, :]
+    live = index <= end[:, None]
+    index = np.minimum(index, len(minute) - 1)
+    bar_open = minute.open[index]
+    high = np.where(live, minute.high[index], -np.inf)
+    low = np.where(live, minute.low[index], np.inf)
+
+    long_k = _first(low <= pdl[:, None])
+    short_k = _first(high >= pdh[:, None])
+    entry_k = np.minimum(long_k, short_k)
+    filled = entry_k < width
+    ambiguous = filled & (long_k == short_k)
+    side = np.where(long_k < short_k, 1, -1)
+    rows = np.arange(len(opens))
+    k = np.minimum(entry_k, width - 1)
+    entry_price = np.where(
+        side > 0,
+        np.minimum(bar_open[rows, k], pdl),
+        np.maximum(bar_open[rows, k], pdh),
+    )
+    stop = np.where(side > 0, pdl - pdr * stop_loss_perc, pdh + pdr * stop_loss_perc)
+    target = np.where(
+        side > 0, pdl + pdr * profit_target_perc, pdh - pdr * profit_target_perc
+    )
+
+    # children only go live on the bar after the entry fills
+    after = np.arange(width)[None, :] > entry_k[:, None]
+    long_side = (side > 0)[:, None]
+    stop_k = _first(
+        after & np.where(long_side, low <= stop[:, None], high >= stop[:, None])
+    )
+    target_k = _first(
+        after & np.where(long_side, high >= target[:, None], low <= target[:, None])
+    )
+    exit_k = np.minimum(stop_k, target_k)
+    stopped = stop_k <= target_k
+    k = np.minimum(exit_k, width - 1)
+    bracket_price = np.where(
+        stopped,
+        np.where(
+            side > 0,
+            np.minimum(bar_open[rows, k], stop),
+            np.maximum(bar_open[rows, k], stop),
+        ),
+        np.where(
+            side > 0,
+            np.maximum(bar_open[rows, k], target),
+            np.minimum(bar_open[rows, k], target),
+        ),
+    )
+
+    # otherwise closed at market on the bar after 16:00
+    market = np.minimum(end + 1, len(minute) - 1)
+    bracket_exit = exit_k < width
+    exit_index = np.where(
+        bracket_exit, opens + 1 + exit_k, np.where(has_close, market, end)
+    )
+    exit_price = np.where(
+        bracket_exit,
+        bracket_price,
+        np.where(has_close, minute.open[market], minute.close[end]),
+    )
+    exit_reason = np.where(
+        ambiguous,
+        "ambiguous",
+        np.where(
+            bracket_exit,
+            np.where(stopped, "stop", "target"),
+            np.where(has_close, "close", "no close bar"),
+        ),
+    )
+
+    trades = []
+    equity = cash
+    for i in np.flatnonzero(filled & ~ambiguous):
+        size = int((equity * risk_per_trade) / (pdr[i] * stop_loss_perc))
+        if size <= 0:
+            continue
+        pnl = side[i] * size * (exit_price[i] - entry_price[i])
+        equity += pnl
+        trades.append(
+            dict(
+                date=int(calendar.days[session[i]]),
+                side=int(side[i]),
+                size=size,
+                entry_time=int(minute.time[opens[i] + 1 + entry_k[i]]),
+                entry_price=float(entry_price[i]),
+                exit_time=int(minute.time[exit_index[i]]),
+                exit_price=float(exit_price[i]),
+                exit_reason=str(exit_reason[i]),
+                pnl=float(pnl),
+                equity=equity,
+            )
+        )
+    for i in np.flatnonzero(ambiguous):
+        trades.append(
+            dict(
+                date=int(calendar.days[session[i]]),
+                side=0,
+                size=0,
+                exit_reason="ambiguous",
+                pnl=0.0,
+            )
+        )
+
+    trades = pd.DataFrame(trades)
+    if len(trades):
+        trades["date"] = pd.to_datetime(trades["date"], unit="D").dt.date
+        trades = trades.sort_values("date", ignore_index=True)
+    return trades
+
+
+def log_fast_summary(trades: pd.DataFrame) -> None:
+    taken = trades[trades["side"] != 0] if len(trades) else trades
+    winners = int((taken["pnl"] > 0).sum()) if len(taken) else 0
+    losers = int((taken["pnl"] <= 0).sum()) if len(taken) else 0
+    logging.info(f"Fast path trades executed: {len(taken)}")
+    logging.info(f"Number of winning trades: {winners}")
+    logging.info(f"Number of losing trades: {losers}")
+    logging.info(
+        f"Win rate: {(winners / (winners + losers) * 100) if (winners + losers) > 0 else 0:.2f}%"
+    )
+    logging.info(f"Net Profit: {taken['pnl'].sum() if len(taken) else 0:.2f}")
+    if len(trades) and (trades["side"] == 0).any():
+        logging.warning(
+            f"{int((trades['side'] == 0).sum())} session(s) filled both entries "
+            "on one bar and were left out"
+        )
+
+
+class TradeRecorder(bt.Analyzer):
+    """
+    Closed trades in the same shape as `fast_backtest` returns them.
+    """
+
+    def start(self):
+        self.trades = []
+        self._opened = {}
+
+    def notify_trade(self, trade):
+        if trade.justopened:
+            self._opened[trade.ref] = (trade.size, trade.price, trade.dtopen)
+        elif trade.isclosed and trade.ref in self._opened:
+            size, price, dtopen = self._opened.pop(trade.ref)
+            tz = self.strategy.datas[0]._tz
+            opened = bt.num2date(dtopen, tz)
+            self.trades.append(
+                dict(
+                    date=opened.date(),
+                    side=1 if size > 0 else -1,
+                    size=abs(size),
+                    entry_time=opened,
+                    entry_price=price,
+                    exit_time=bt.num2date(trade.dtclose, tz),
+                    exit_price=price + trade.pnl / size,
+                    pnl=trade.pnl,
+                )
+            )
+
+    def get_analysis(self):
+        return self.trades
+
+
+def parity(
+    minute: Candles, levels: PriorDayIndex, tolerance: float = 1e-6
+) -> pd.DataFrame:
+    """
+    Runs backtrader and the fast path on the same candles and logs every
+    session where their trades disagree. Returns the joined trade table.
+    """
+    calendar = SessionCalendar(minute, TZ, SESSION_OPEN, SESSION_CLOSE)
+    cerebro = build_cerebro(minute, levels, calendar=calendar)
+    cerebro.addanalyzer(TradeRecorder, _name="trades")
+    logging.info("Running backtrader for parity")
+    reference = pd.DataFrame(cerebro.run()[0].analyzers.trades.get_analysis())
+
+    logging.info("Running fast path for parity")
+    fast = fast_backtest(minute, levels, calendar=calendar, **STRATEGY_KWARGS)
+
+    columns = ["date", "side", "size", "entry_price", "exit_price", "pnl"]
+    joined = pd.merge(
+        reference.reindex(columns=columns),
+        fast.reindex(columns=columns + ["exit_reason"]),
+        on="date",
+        how="outer",
+        suffixes=("_bt", "_fast"),
+    ).sort_values("date", ignore_index=True)
+
+    matches = np.ones(len(joined), dtype=bool)
+    for column in columns[1:]:
+        bt_values = joined[f"{column}_bt"].to_numpy(dtype=float)
+        fast_values = joined[f"{column}_fast"].to_numpy(dtype=float)
+        matches &= np.isclose(bt_values, fast_values, rtol=0, atol=tolerance)
+    joined["match"] = matches
+
+    mismatched = joined[~joined["match"]]
+    logging.info(
+        f"Parity: {int(matches.sum())} of {len(joined)} sessions match "
+        f"({len(reference)} backtrader trades, {len(fast)} fast path trades)"
+    )
+    if len(mismatched):
+        logging.warning(f"Mismatched sessions:\n{mismatched.to_string(index=False)}")
+    return joined
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"